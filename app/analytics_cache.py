@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: TTL cache for analytics results, invalidated by per-table write versions, with coalesced misses.
+EMBED_TAGS: analytics, cache, ttl, invalidation, versions, coalescing, performance
+
+- Every session created by SessionLocal records the tables it writes: ORM flushes (members,
+  bookings, payments, refunds, stripe webhook, whatsapp, QR check-in, ...) and Core
+  INSERT/UPDATE/DELETE statements run through the session. On commit each touched table's version
+  counter is bumped; a rollback discards the pending set.
+- A cache entry stores the versions of the tables it depends on. A lookup is a hit only if the entry
+  is younger than APP_ANALYTICS_CACHE_TTL_SECONDS and none of those versions moved.
+- Concurrent misses for one key wait on a per-key lock, so a cold key is computed once.
+- Keys include client-supplied ranges, so at most APP_ANALYTICS_CACHE_MAX_ENTRIES entries are kept;
+  storing one more evicts the least recently used entry together with its (idle) key lock.
+
+Versions are per process: a write handled by another uvicorn worker is picked up when the TTL
+expires, so the TTL bounds cross-worker staleness. APP_ANALYTICS_CACHE_TTL_SECONDS=0 disables caching.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal
+
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+_PENDING_KEY = "analytics_cache_tables"
+
+
+def table_version(table: str) -> int:
+    return _versions.get(table, 0)
+
+
+def bump_tables(tables: Iterable[str]) -> None:
+    with _versions_lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+
+def _pending(session: Session) -> set:
+    return session.info.setdefault(_PENDING_KEY, set())
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_flushed_tables(session: Session, flush_context) -> None:
+    pending = _pending(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            pending.add(table)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _collect_statement_tables(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _pending(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_committed_tables(session: Session) -> None:
+    tables = session.info.pop(_PENDING_KEY, None)
+    if tables:
+        bump_tables(tables)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back_tables(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+@dataclass
+class _Entry:
+    versions: Tuple[int, ...]
+    expires_at: float
+    value: Any
+
+
+_entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+_key_locks: Dict[Hashable, threading.Lock] = {}
+_entries_lock = threading.Lock()
+
+
+def _drop_idle_locks() -> None:
+    # A lock held by a computing thread stays, so its waiters still coalesce on it
+    for key in [k for k, lock in _key_locks.items() if k not in _entries and not lock.locked()]:
+        del _key_locks[key]
+
+
+def clear_cache() -> None:
+    with _entries_lock:
+        _entries.clear()
+        _drop_idle_locks()
+
+
+def _key_lock(key: Hashable) -> threading.Lock:
+    with _entries_lock:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+
+def _fresh(key: Hashable, versions: Tuple[int, ...]) -> Tuple[bool, Any]:
+    with _entries_lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.versions == versions and entry.expires_at > time.monotonic():
+            _entries.move_to_end(key)
+            return True, entry.value
+    return False, None
+
+
+def _store(key: Hashable, entry: _Entry) -> None:
+    max_entries = max(1, get_settings().analytics_cache_max_entries)
+    with _entries_lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > max_entries:
+            _entries.popitem(last=False)
+        if len(_key_locks) > max_entries:
+            _drop_idle_locks()
+
+
+def cached(key: Hashable, tables: Tuple[str, ...], compute: Callable[[], Any]) -> Any:
+    """Return the cached value for `key` or compute it once, even when many requests miss together."""
+    ttl = get_settings().analytics_cache_ttl_seconds
+    if ttl <= 0:
+        return compute()
+    # Versions are read before computing: a write landing mid-computation leaves the entry stale
+    versions = tuple(table_version(t) for t in tables)
+    hit, value = _fresh(key, versions)
+    if hit:
+        return value
+    with _key_lock(key):
+        versions = tuple(table_version(t) for t in tables)
+        hit, value = _fresh(key, versions)
+        if hit:
+            return value
+        value = compute()
+        _store(key, _Entry(versions=versions, expires_at=time.monotonic() + ttl, value=value))
+        return value
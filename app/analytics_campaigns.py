@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Per-campaign daily attribution rollups (acquired, converted, visits, net revenue) kept fresh by dirty-day rebuilds.
+EMBED_TAGS: analytics, campaigns, facebook, attribution, rollups, conversion, revenue, dirty days
+
+A member belongs to the campaign in Member.facebook_campaign_id. Per (day, campaign):
+- members_acquired: members whose join_date is that day
+- members_converted: of those, members with at least one booking (first-booking conversion)
+- visits: member visits that day
+- revenue_cents: payments that day minus refunds that day (refunds attributed via their payment)
+
+Freshness:
+- An after_flush listener marks the days a write touches in campaign_stats_dirty_days, in the same
+  transaction: the join day for new/deleted members and for members gaining or losing bookings, the
+  visit day, the payment/refund day. Changing a member's campaign or join date, and bulk statements
+  on the source tables, clear the READY_KEY marker instead (that member's whole history moves).
+- Readers call ensure_campaign_stats(): without the marker it rebuilds everything; otherwise it
+  claims the dirty days with DELETE ... RETURNING and rebuilds only the days its own delete removed,
+  each with a single INSERT ... SELECT over a UNION ALL of the four sources. A concurrent reader
+  blocks on the same mark rows and then finds them gone, so two readers never rebuild one day from
+  one mark; if they still collide on a day (a new mark claimed mid-rebuild), the loser rolls back,
+  which restores its marks for the next reader.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import case, delete, event, exists, func, inspect, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .analytics_math import change
+from .analytics_timeseries import bucket_expr
+from .database import SessionLocal, increment_rows
+from .models import (
+    Booking,
+    CampaignDailyStats,
+    CampaignStatsDirtyDay,
+    ConfigEntry,
+    FacebookCampaign,
+    Member,
+    MemberVisit,
+    Payment,
+    Refund,
+)
+
+
+READY_KEY = "campaign_stats.ready"
+SOURCE_TABLES = {model.__tablename__ for model in (Member, MemberVisit, Payment, Refund, Booking)}
+STAT_COLUMNS = ("members_acquired", "members_converted", "visits", "revenue_cents")
+
+
+# --- set-based rebuild --------------------------------------------------------------------------
+
+
+def _on_day(column, day: Optional[date]) -> list:
+    if day is None:
+        return []
+    lo = datetime.combine(day, time.min)
+    return [column >= lo, column < lo + timedelta(days=1)]
+
+
+def _sources(dialect: str, day: Optional[date]):
+    """UNION ALL of (day, campaign_id, acquired, converted, visits, revenue) rows from every source."""
+    zero = literal(0)
+    campaign = Member.facebook_campaign_id
+    acquired = select(
+        bucket_expr(dialect, Member.join_date, "day").label("day"),
+        campaign.label("campaign_id"),
+        literal(1).label("acquired"),
+        case((exists().where(Booking.member_id == Member.id), 1), else_=0).label("converted"),
+        zero.label("visits"),
+        zero.label("revenue"),
+    ).where(campaign.is_not(None), Member.join_date.is_not(None))
+    if day is not None:
+        acquired = acquired.where(Member.join_date == day)
+    visits = (
+        select(bucket_expr(dialect, MemberVisit.ts, "day"), campaign, zero, zero, literal(1), zero)
+        .join(Member, Member.id == MemberVisit.member_id)
+        .where(campaign.is_not(None), *_on_day(MemberVisit.ts, day))
+    )
+    payments = (
+        select(bucket_expr(dialect, Payment.created_at, "day"), campaign, zero, zero, zero, Payment.amount_cents)
+        .join(Member, Member.id == Payment.member_id)
+        .where(campaign.is_not(None), *_on_day(Payment.created_at, day))
+    )
+    refunds = (
+        select(bucket_expr(dialect, Refund.created_at, "day"), campaign, zero, zero, zero, -Refund.amount_cents)
+        .join(Payment, Payment.id == Refund.payment_id)
+        .join(Member, Member.id == Payment.member_id)
+        .where(campaign.is_not(None), *_on_day(Refund.created_at, day))
+    )
+    return union_all(acquired, visits, payments, refunds).subquery()
+
+
+def _rebuild(db: Session, day: Optional[date]) -> int:
+    """Replace the rows of `day` (or of every day when None) with one INSERT ... SELECT; returns rows written."""
+    stmt = delete(CampaignDailyStats)
+    if day is not None:
+        stmt = stmt.where(CampaignDailyStats.day == day)
+    db.execute(stmt)
+    src = _sources(db.get_bind().dialect.name, day)
+    grouped = select(
+        src.c.day,
+        src.c.campaign_id,
+        func.sum(src.c.acquired),
+        func.sum(src.c.converted),
+        func.sum(src.c.visits),
+        func.sum(src.c.revenue),
+    ).group_by(src.c.day, src.c.campaign_id)
+    result = db.execute(
+        CampaignDailyStats.__table__.insert().from_select(["day", "campaign_id", *STAT_COLUMNS], grouped)
+    )
+    return int(result.rowcount or 0)
+
+
+def rebuild_campaign_stats(db: Session) -> Dict[str, int]:
+    """Recompute every day of every campaign and mark the rollup ready (caller commits)."""
+    db.execute(delete(CampaignStatsDirtyDay))
+    rows = _rebuild(db, None)
+    db.merge(ConfigEntry(key=READY_KEY, value=datetime.utcnow().isoformat()))
+    db.flush()
+    return {"rows": rows}
+
+
+def claim_dirty_days(db: Session) -> List[date]:
+    """Delete the dirty-day marks and return the days this transaction actually removed."""
+    marks = CampaignStatsDirtyDay.__table__
+    conn = db.connection()
+    if conn.dialect.delete_returning:
+        claimed = conn.execute(delete(marks).returning(marks.c.day)).scalars()
+        return sorted({_as_date(d) for d in claimed})
+    # No RETURNING: read, then delete only what was read (marks committed meanwhile survive)
+    days = sorted({_as_date(d) for d in conn.execute(select(marks.c.day)).scalars()})
+    if days:
+        conn.execute(delete(marks).where(marks.c.day.in_(days)))
+    return days
+
+
+def ensure_campaign_stats(db: Session) -> Dict[str, int]:
+    """Bring campaign_daily_stats up to date (full rebuild or dirty days only) and commit."""
+    if db.execute(select(ConfigEntry.value).where(ConfigEntry.key == READY_KEY)).scalar_one_or_none() is None:
+        result = rebuild_campaign_stats(db)
+        db.commit()
+        return {"rebuilt_days": -1, **result}
+    days = claim_dirty_days(db)
+    if not days:
+        db.commit()
+        return {"rebuilt_days": 0}
+    try:
+        for day in days:
+            _rebuild(db, day)
+        db.commit()
+    except IntegrityError:
+        # Another reader is writing the same day; rolling back hands our marks to the next reader
+        db.rollback()
+        return {"rebuilt_days": 0}
+    return {"rebuilt_days": len(days)}
+
+
+def _as_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# --- dirty-day tracking ------------------------------------------------------------------------
+
+
+def _join_day(session: Session, member_id: Optional[str], cache: Dict[str, Optional[date]]) -> Optional[date]:
+    if not member_id:
+        return None
+    if member_id not in cache:
+        cache[member_id] = session.connection().execute(
+            select(Member.join_date).where(Member.id == member_id)
+        ).scalar()
+    return cache[member_id]
+
+
+def _invalidate(session: Session) -> None:
+    session.connection().execute(delete(ConfigEntry.__table__).where(ConfigEntry.key == READY_KEY))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_dirty_days(session: Session, flush_context) -> None:
+    days: Set[date] = set()
+    join_days: Dict[str, Optional[date]] = {}
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Member):
+            days.add(obj.join_date)
+        elif isinstance(obj, MemberVisit):
+            days.add(obj.ts)
+        elif isinstance(obj, (Payment, Refund)):
+            days.add(obj.created_at)
+        elif isinstance(obj, Booking):
+            days.add(_join_day(session, obj.member_id, join_days))
+    for obj in session.dirty:
+        if isinstance(obj, Member):
+            state = inspect(obj).attrs
+            if state.facebook_campaign_id.history.has_changes() or state.join_date.history.has_changes():
+                _invalidate(session)
+                return
+        elif isinstance(obj, (Payment, Refund)) and inspect(obj).attrs.amount_cents.history.has_changes():
+            days.add(obj.created_at)
+    rows = [{"day": _as_date(d), "marks": 1} for d in days if d is not None]
+    increment_rows(
+        session.connection(), CampaignStatsDirtyDay.__table__, ["day"], ["marks"], sorted(rows, key=lambda r: r["day"])
+    )
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in SOURCE_TABLES:
+            _invalidate(orm_execute_state.session)
+
+
+# --- reads --------------------------------------------------------------------------------------
+
+
+def _conversion_rate(stats: Dict[str, int]) -> Optional[float]:
+    acquired = stats["members_acquired"]
+    return round(stats["members_converted"] / acquired, 4) if acquired else None
+
+
+def campaign_report(
+    db: Session,
+    start: date,
+    end: date,
+    campaign_id: Optional[str] = None,
+    daily: bool = False,
+    compare: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Per-campaign totals over [start, end] (inclusive days), with a per-day breakdown when `daily`.
+    With `compare`, the same number of days right before `start` is aggregated in the same scan
+    (SUM(CASE WHEN day >= start ...)) and each campaign gets `previous` totals and a `change` per stat.
+    """
+    ensure_campaign_stats(db)
+    first = start - timedelta(days=(end - start).days + 1) if compare else start
+    where = [CampaignDailyStats.day >= first, CampaignDailyStats.day <= end]
+    if campaign_id:
+        where.append(CampaignDailyStats.campaign_id == campaign_id)
+    current = CampaignDailyStats.day >= start
+    aggregates = [
+        func.sum(case((current, getattr(CampaignDailyStats, c)), else_=0)).label(c) for c in STAT_COLUMNS
+    ]
+    if compare:
+        aggregates += [
+            func.sum(case((current, 0), else_=getattr(CampaignDailyStats, c))).label(f"previous_{c}")
+            for c in STAT_COLUMNS
+        ]
+    totals = db.execute(
+        select(CampaignDailyStats.campaign_id, FacebookCampaign.name, *aggregates)
+        .outerjoin(FacebookCampaign, FacebookCampaign.id == CampaignDailyStats.campaign_id)
+        .where(*where)
+        .group_by(CampaignDailyStats.campaign_id, FacebookCampaign.name)
+        .order_by(CampaignDailyStats.campaign_id)
+    ).all()
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    if daily:
+        for row in db.execute(
+            select(CampaignDailyStats)
+            .where(*where, current)
+            .order_by(CampaignDailyStats.campaign_id, CampaignDailyStats.day)
+        ).scalars():
+            by_day.setdefault(row.campaign_id, []).append(
+                {"day": _as_date(row.day).isoformat(), **{c: getattr(row, c) for c in STAT_COLUMNS}}
+            )
+    report = []
+    for row in totals:
+        stats = {c: int(getattr(row, c) or 0) for c in STAT_COLUMNS}
+        entry: Dict[str, Any] = {
+            "campaign_id": row.campaign_id,
+            "name": row.name,
+            **stats,
+            "conversion_rate": _conversion_rate(stats),
+        }
+        if daily:
+            entry["days"] = by_day.get(row.campaign_id, [])
+        if compare:
+            previous = {c: int(getattr(row, f"previous_{c}") or 0) for c in STAT_COLUMNS}
+            entry["previous"] = {**previous, "conversion_rate": _conversion_rate(previous)}
+            entry["change"] = {
+                c: change(entry[c], entry["previous"][c]) for c in (*STAT_COLUMNS, "conversion_rate")
+            }
+        report.append(entry)
+    return report
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Daily churn-risk score per active member from bulk visit, booking and payment features, scored with NumPy.
+EMBED_TAGS: members, churn, risk, retention, engagement, visits, bookings, payments, refunds, numpy, batch
+
+score_members() builds every feature for all active members at once:
+- visits (one grouped query): last visit, visits in the last RECENT_DAYS and in the RECENT_DAYS before
+- bookings (one grouped query): cancelled / all bookings created in the last LOOKBACK_DAYS
+- payments (one grouped query): failed payments in the last LOOKBACK_DAYS
+- refunds (one grouped query via payments.member_id): refunds in the last LOOKBACK_DAYS
+
+The features are scaled to [0, 1] in a (members x features) matrix and combined in one logistic:
+  score = 1 / (1 + exp(-(BIAS + features @ WEIGHTS)))
+so a member who visits weekly with clean payments scores ~0.05, and one who stopped coming a
+quarter ago after a falling trend ~0.95. Members who never visited count their days since joining.
+
+member_churn_scores is rewritten on every run (daily in one app worker, APP_CHURN_REFRESH_SECONDS,
+see periodic.py, and `python -m app.maintenance churn-score`); its score index serves the at-risk list.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .models import Booking, Member, MemberChurnScore, MemberVisit, Payment, Refund
+from .periodic import start_periodic
+
+
+RECENT_DAYS = 28
+LOOKBACK_DAYS = 90
+CAP_DAYS = 90  # recency saturates after a quarter without a visit
+CAP_COUNT = 3  # refunds / payment failures saturate at three
+FEATURES = ("recency", "decline", "cancellation_ratio", "refunds", "payment_failures")
+WEIGHTS = np.array([4.0, 2.0, 1.5, 1.0, 1.5])
+BIAS = -3.0
+
+_scores = MemberChurnScore.__table__
+
+
+def churn_scores(features: np.ndarray) -> np.ndarray:
+    """Logistic risk in (0, 1) for a (members, len(FEATURES)) matrix of features scaled to [0, 1]."""
+    return 1.0 / (1.0 + np.exp(-(BIAS + features @ WEIGHTS)))
+
+
+def _fill(values: np.ndarray, index: Dict[str, int], rows, column: int = 1) -> None:
+    for row in rows:
+        i = index.get(row[0])
+        if i is not None:
+            values[i] = row[column] or 0
+
+
+def score_members(db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Recompute the churn score of every active member and rewrite member_churn_scores (caller commits)."""
+    now = now or datetime.utcnow()
+    recent_since = now - timedelta(days=RECENT_DAYS)
+    prior_since = recent_since - timedelta(days=RECENT_DAYS)
+    lookback_since = now - timedelta(days=LOOKBACK_DAYS)
+
+    members = db.execute(select(Member.id, Member.join_date).where(Member.status == "active")).all()
+    conn = db.connection()
+    conn.execute(delete(_scores))
+    if not members:
+        return {"scored": 0, "at_risk": 0}
+    index = {member_id: i for i, (member_id, _) in enumerate(members)}
+    n = len(members)
+
+    last_visit = np.full(n, np.nan)
+    recent = np.zeros(n)
+    prior = np.zeros(n)
+    visits = db.execute(
+        select(
+            MemberVisit.member_id,
+            func.max(MemberVisit.ts),
+            func.sum(case((MemberVisit.ts >= recent_since, 1), else_=0)),
+            func.sum(case(((MemberVisit.ts >= prior_since) & (MemberVisit.ts < recent_since), 1), else_=0)),
+        )
+        .where(MemberVisit.ts < now)
+        .group_by(MemberVisit.member_id)
+    ).all()
+    for member_id, last_ts, n_recent, n_prior in visits:
+        i = index.get(member_id)
+        if i is not None:
+            last_visit[i] = (now - last_ts).total_seconds() / 86400
+            recent[i], prior[i] = n_recent or 0, n_prior or 0
+
+    booked = np.zeros(n)
+    cancelled = np.zeros(n)
+    bookings = db.execute(
+        select(Booking.member_id, func.count(), func.sum(case((Booking.status == "cancelled", 1), else_=0)))
+        .where(Booking.created_at >= lookback_since, Booking.created_at < now)
+        .group_by(Booking.member_id)
+    ).all()
+    _fill(booked, index, bookings, 1)
+    _fill(cancelled, index, bookings, 2)
+
+    failures = np.zeros(n)
+    _fill(
+        failures,
+        index,
+        db.execute(
+            select(Payment.member_id, func.count())
+            .where(Payment.status == "failed", Payment.created_at >= lookback_since, Payment.created_at < now)
+            .group_by(Payment.member_id)
+        ),
+    )
+    refunds = np.zeros(n)
+    _fill(
+        refunds,
+        index,
+        db.execute(
+            select(Payment.member_id, func.count(Refund.id))
+            .join(Refund, Refund.payment_id == Payment.id)
+            .where(Refund.created_at >= lookback_since, Refund.created_at < now)
+            .group_by(Payment.member_id)
+        ),
+    )
+
+    # Members without any visit: days since they joined (unknown join date: fully lapsed)
+    joined = np.array(
+        [(now.date() - join_date).days if join_date else CAP_DAYS for _, join_date in members], dtype=np.float64
+    )
+    days_since = np.where(np.isnan(last_visit), joined, last_visit)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cancel_ratio = np.where(booked > 0, cancelled / booked, 0.0)
+    features = np.column_stack(
+        [
+            np.clip(days_since / CAP_DAYS, 0.0, 1.0),
+            np.clip((prior - recent) / np.maximum(prior, 1.0), 0.0, 1.0),
+            cancel_ratio,
+            np.minimum(refunds, CAP_COUNT) / CAP_COUNT,
+            np.minimum(failures, CAP_COUNT) / CAP_COUNT,
+        ]
+    )
+    scores = churn_scores(features)
+
+    rows = [
+        {
+            "member_id": member_id,
+            "score": round(float(scores[i]), 4),
+            "days_since_visit": None if np.isnan(last_visit[i]) else int(last_visit[i]),
+            "recent_visits": int(recent[i]),
+            "prior_visits": int(prior[i]),
+            "cancellation_ratio": round(float(cancel_ratio[i]), 4),
+            "refunds": int(refunds[i]),
+            "payment_failures": int(failures[i]),
+            "scored_at": now,
+        }
+        for member_id, i in index.items()
+    ]
+    conn.execute(insert(_scores), rows)
+    return {"scored": n, "at_risk": int((scores >= 0.5).sum())}
+
+
+def at_risk_members(
+    db: Session, min_score: float = 0.5, page: int = 1, page_size: int = 50
+) -> Dict[str, Any]:
+    """Scored members at or above `min_score`, riskiest first, one page at a time."""
+    where = MemberChurnScore.score >= min_score
+    total = db.execute(select(func.count()).select_from(MemberChurnScore).where(where)).scalar_one()
+    rows = db.execute(
+        select(MemberChurnScore, Member.full_name, Member.phone, Member.email)
+        .join(Member, Member.id == MemberChurnScore.member_id)
+        .where(where)
+        .order_by(MemberChurnScore.score.desc(), MemberChurnScore.member_id)
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    ).all()
+    items: List[Dict[str, Any]] = [
+        {
+            "member_id": row.member_id,
+            "full_name": full_name,
+            "phone": phone,
+            "email": email,
+            "score": row.score,
+            "days_since_visit": row.days_since_visit,
+            "recent_visits": row.recent_visits,
+            "prior_visits": row.prior_visits,
+            "cancellation_ratio": row.cancellation_ratio,
+            "refunds": row.refunds,
+            "payment_failures": row.payment_failures,
+            "scored_at": row.scored_at,
+        }
+        for row, full_name, phone, email in rows
+    ]
+    return {"items": items, "total": int(total)}
+
+
+def start_churn_refresher(stop: threading.Event) -> Optional[threading.Thread]:
+    """Rescore members now and then every APP_CHURN_REFRESH_SECONDS until `stop` is set (0 disables)."""
+    return start_periodic("churn-refresh", get_settings().churn_refresh_seconds, score_members, stop)
@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: In-memory columnar snapshot (NumPy) of bookings, visits, payments and refunds for ad hoc filter/group-by/aggregate queries.
+EMBED_TAGS: analytics, columnar, numpy, snapshot, dictionary encoding, group by, ad hoc, watermark
+
+Layout: one ColumnTable per source table. Ids, statuses, sources and class types are dictionary
+encoded (int32 codes into a per-column value list); timestamps are int64 seconds since the epoch
+(naive UTC, like the stored columns); amounts are int64. Deleted rows are masked, not compacted.
+
+Refresh is incremental and runs only when something may have changed:
+- Writes through SessionLocal record the primary keys they touched per table; on commit those ids
+  become pending for the snapshot (same hook points as analytics_cache). Bulk statements schedule a
+  full reload of the affected tables. So do edits to the event columns that bookings and visits take
+  from their event (class_type_id, and start for bookings), and deleted events. Inserted events and
+  edits to other event columns leave the snapshot alone: no stored row reads them.
+- Each refresh re-reads pending ids plus rows past the table's watermark: max(id) for the
+  append-only member_visits, max(created_at) for the rest, which also picks up rows inserted by
+  other processes. Status changes made by other processes are only seen by the periodic full
+  reload every APP_ANALYTICS_SNAPSHOT_RELOAD_SECONDS.
+With nothing pending and the reload not due, a query never touches the database.
+
+Queries: equality filters on encoded columns (ORed values), a [start, end] range on the table's
+time column, group-by on encoded columns and time parts (hour, weekday, hour_of_week, day), and
+count / sum / avg of the amount column / distinct members. Grouping packs the per-dimension codes
+into one int64 key and aggregates with np.bincount.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal
+from .models import Booking, Event, MemberVisit, Payment, Refund
+
+
+EPOCH = datetime(1970, 1, 1)
+TIME_PARTS = ("hour", "weekday", "hour_of_week", "day")
+AGGREGATES = ("count", "sum", "avg", "distinct_members")
+
+
+def to_epoch(value: Optional[datetime]) -> int:
+    if value is None:
+        return 0
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((value - EPOCH).total_seconds())
+
+
+class Dictionary:
+    """Value <-> int32 code mapping; code 0 is reserved for NULL."""
+
+    def __init__(self) -> None:
+        self.values: List[Optional[str]] = [None]
+        self.codes: Dict[Optional[str], int] = {None: 0}
+
+    def encode(self, value: Any) -> int:
+        key = None if value is None else str(value)
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(key)
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    name: str
+    model: type
+    time_column: str
+    encoded: Tuple[str, ...]
+    amount: Optional[str] = None
+    # Tables whose writes invalidate every row of this one (joined columns) ...
+    reload_on: Tuple[str, ...] = ()
+    # ... and which of their columns those joined values come from (empty: any column)
+    reload_columns: Tuple[str, ...] = ()
+
+    def select(self):
+        model = self.model
+        created = model.ts if model is MemberVisit else model.created_at
+        columns = [model.id.label("id"), created.label("created_at")]
+        columns += [getattr(model, c).label(c) for c in self.encoded if c != "class_type_id"]
+        if self.amount:
+            columns.append(getattr(model, self.amount).label(self.amount))
+        stmt = select(*columns)
+        if "class_type_id" in self.encoded:
+            stmt = stmt.add_columns(Event.class_type_id.label("class_type_id"), Event.start.label("event_start"))
+            stmt = stmt.outerjoin(Event, Event.id == model.event_id)
+        return stmt
+
+
+SPECS: Dict[str, TableSpec] = {
+    s.name: s
+    for s in (
+        TableSpec(
+            "bookings",
+            Booking,
+            "event_start",
+            ("member_id", "event_id", "class_type_id", "status"),
+            reload_on=("events",),
+            reload_columns=("class_type_id", "start"),
+        ),
+        TableSpec(
+            "visits",
+            MemberVisit,
+            "created_at",
+            ("member_id", "event_id", "class_type_id", "source"),
+            reload_on=("events",),
+            reload_columns=("class_type_id",),
+        ),
+        TableSpec("payments", Payment, "created_at", ("member_id", "status"), amount="amount_cents"),
+        TableSpec("refunds", Refund, "created_at", ("payment_id", "status"), amount="amount_cents"),
+    )
+}
+_SPEC_BY_TABLE = {s.model.__tablename__: s for s in SPECS.values()}
+
+
+class ColumnTable:
+    """Growable NumPy columns for one table, addressed by row position; `alive` masks deleted rows."""
+
+    def __init__(self, spec: TableSpec) -> None:
+        self.spec = spec
+        self.dicts: Dict[str, Dictionary] = {name: Dictionary() for name in spec.encoded}
+        self.size = 0
+        self.positions: Dict[Any, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.ts = np.zeros(0, dtype=np.int64)
+        self.codes: Dict[str, np.ndarray] = {name: np.zeros(0, dtype=np.int32) for name in spec.encoded}
+        self.amount = np.zeros(0, dtype=np.int64)
+        self.max_id: Any = None
+        self.max_created: Optional[datetime] = None
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+
+        def grow(arr: np.ndarray) -> np.ndarray:
+            out = np.zeros(new_capacity, dtype=arr.dtype)
+            out[: self.size] = arr[: self.size]
+            return out
+
+        self.alive = grow(self.alive)
+        self.ts = grow(self.ts)
+        self.amount = grow(self.amount)
+        self.codes = {name: grow(arr) for name, arr in self.codes.items()}
+
+    def upsert(self, rows: Iterable[Any]) -> int:
+        count = 0
+        for row in rows:
+            values = row._mapping
+            pos = self.positions.get(values["id"])
+            if pos is None:
+                self._grow(self.size + 1)
+                pos = self.positions[values["id"]] = self.size
+                self.size += 1
+            self.alive[pos] = True
+            self.ts[pos] = to_epoch(values[self.spec.time_column])
+            created = values["created_at"]
+            for name in self.spec.encoded:
+                self.codes[name][pos] = self.dicts[name].encode(values.get(name))
+            if self.spec.amount:
+                self.amount[pos] = int(values[self.spec.amount] or 0)
+            if self.max_id is None or values["id"] > self.max_id:
+                self.max_id = values["id"]
+            if created is not None and (self.max_created is None or created > self.max_created):
+                self.max_created = created
+            count += 1
+        return count
+
+    def drop(self, ids: Iterable[Any]) -> None:
+        for row_id in ids:
+            pos = self.positions.get(row_id)
+            if pos is not None:
+                self.alive[pos] = False
+
+    @property
+    def live_rows(self) -> int:
+        return int(self.alive[: self.size].sum())
+
+
+@dataclass
+class QueryResult:
+    groups: List[Dict[str, Any]]
+    matched: int
+    elapsed_ms: float
+
+
+@dataclass
+class _Pending:
+    ids: Dict[str, Set[Any]] = field(default_factory=dict)
+    reload: Set[str] = field(default_factory=set)
+
+
+class ColumnarSnapshot:
+    def __init__(self) -> None:
+        self.tables: Dict[str, ColumnTable] = {}
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self._pending = _Pending()
+        self._lock = threading.RLock()
+
+    # --- change tracking (called from session events) -------------------------------------
+
+    def mark(self, ids: Dict[str, Set[Any]], reload: Set[str]) -> None:
+        with self._lock:
+            for name, table_ids in ids.items():
+                self._pending.ids.setdefault(name, set()).update(table_ids)
+            self._pending.reload.update(reload)
+
+    # --- refresh ------------------------------------------------------------------------------
+
+    def refresh(self, db: Session, force: bool = False) -> None:
+        with self._lock:
+            reload_every = get_settings().analytics_snapshot_reload_seconds
+            now = time.monotonic()
+            if force or not self.tables or (reload_every > 0 and now - self.loaded_at >= reload_every):
+                self._load_all(db)
+                return
+            if not self._pending.ids and not self._pending.reload:
+                return
+            pending, self._pending = self._pending, _Pending()
+            for name in pending.reload:
+                self.tables[name] = self._load(db, SPECS[name])
+            for name, ids in pending.ids.items():
+                if name in pending.reload:
+                    continue
+                self._refresh_table(db, self.tables[name], ids)
+            self.refreshed_at = time.time()
+
+    def _load_all(self, db: Session) -> None:
+        self._pending = _Pending()
+        self.tables = {name: self._load(db, spec) for name, spec in SPECS.items()}
+        self.loaded_at = time.monotonic()
+        self.refreshed_at = time.time()
+
+    @staticmethod
+    def _load(db: Session, spec: TableSpec) -> ColumnTable:
+        table = ColumnTable(spec)
+        table.upsert(db.execute(spec.select()))
+        return table
+
+    @staticmethod
+    def _refresh_table(db: Session, table: ColumnTable, ids: Set[Any]) -> None:
+        model = table.spec.model
+        conditions = []
+        if ids:
+            conditions.append(model.id.in_(list(ids)))
+        # Rows other processes appended since the last refresh
+        if model is MemberVisit and table.max_id is not None:
+            conditions.append(model.id > table.max_id)
+        elif table.max_created is not None:
+            conditions.append(model.created_at >= table.max_created)
+        if not conditions:
+            return
+        rows = list(db.execute(table.spec.select().where(or_(*conditions))))
+        table.upsert(rows)
+        table.drop(ids - {row._mapping["id"] for row in rows})
+
+    # --- queries ------------------------------------------------------------------------------
+
+    def query(
+        self,
+        table_name: str,
+        where: Optional[Dict[str, Sequence[str]]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        group_by: Sequence[str] = (),
+        agg: str = "count",
+    ) -> QueryResult:
+        """Filter, group and aggregate one table; raises ValueError on unknown columns or aggregates."""
+        spec = SPECS.get(table_name)
+        if spec is None:
+            raise ValueError(f"Unknown table: {table_name}")
+        if agg not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {agg}")
+        if agg in ("sum", "avg") and not spec.amount:
+            raise ValueError(f"Table {table_name} has no amount to {agg}")
+        if agg == "distinct_members" and "member_id" not in spec.encoded:
+            raise ValueError(f"Table {table_name} has no member_id")
+        for column in list(where or {}) + list(group_by):
+            if column not in spec.encoded and column not in TIME_PARTS:
+                raise ValueError(f"Unknown column for {table_name}: {column}")
+
+        started = time.perf_counter()
+        with self._lock:
+            table = self.tables[table_name]
+            n = table.size
+            mask = table.alive[:n].copy()
+            ts = table.ts[:n]
+            if start is not None:
+                mask &= ts >= to_epoch(start)
+            if end is not None:
+                mask &= ts <= to_epoch(end)
+            for column, values in (where or {}).items():
+                if column in TIME_PARTS:
+                    wanted = np.array([int(v) for v in values], dtype=np.int64)
+                    mask &= np.isin(_time_part(ts, column), wanted)
+                    continue
+                codes = [table.dicts[column].lookup(v) for v in values]
+                wanted = np.array([c for c in codes if c is not None], dtype=np.int32)
+                mask &= np.isin(table.codes[column][:n], wanted)
+
+            idx = np.flatnonzero(mask)
+            keys: List[np.ndarray] = []
+            decoders: List[Any] = []
+            for column in group_by:
+                if column in TIME_PARTS:
+                    part = _time_part(ts[idx], column)
+                    if column == "day":
+                        first = int(part.min()) if len(part) else 0
+                        part = part - first
+                        decoders.append(lambda code, first=first: _day_label(code + first))
+                    else:
+                        decoders.append(int)
+                    keys.append(part)
+                else:
+                    dictionary = table.dicts[column]
+                    keys.append(table.codes[column][idx].astype(np.int64))
+                    decoders.append(lambda code, values=dictionary.values: values[code])
+            # Number only the key combinations present in the rows: the full product of the dictionary
+            # sizes (e.g. members x events x hours) can be far larger than memory
+            if keys and len(idx):
+                combos, group = np.unique(np.column_stack(keys), axis=0, return_inverse=True)
+                group = group.reshape(-1)
+            else:
+                combos = np.zeros((1 if not keys else 0, len(keys)), dtype=np.int64)
+                group = np.zeros(len(idx), dtype=np.int64)
+            total_groups = len(combos)
+
+            counts = np.bincount(group, minlength=total_groups)
+            if agg == "count":
+                values = counts
+            elif agg in ("sum", "avg"):
+                sums = np.bincount(group, weights=table.amount[idx], minlength=total_groups)
+                values = sums if agg == "sum" else np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+            else:
+                # Distinct (group, member) pairs, then count pairs per group; NULL members are skipped
+                members = table.codes["member_id"][idx].astype(np.int64)
+                known = members > 0
+                width = len(table.dicts["member_id"].values)
+                pairs = np.unique(group[known] * width + members[known])
+                values = np.bincount(pairs // width, minlength=total_groups)
+
+            groups: List[Dict[str, Any]] = []
+            for flat in np.flatnonzero(counts):
+                entry: Dict[str, Any] = {}
+                for column, code, decode in zip(group_by, combos[flat], decoders):
+                    entry[column] = decode(int(code))
+                value = values[flat]
+                entry["value"] = round(float(value), 4) if agg == "avg" else int(value)
+                groups.append(entry)
+            matched = int(len(idx))
+        return QueryResult(groups=groups, matched=matched, elapsed_ms=(time.perf_counter() - started) * 1000.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tables": {name: table.live_rows for name, table in self.tables.items()},
+                "refreshed_at": datetime.utcfromtimestamp(self.refreshed_at).isoformat() if self.refreshed_at else None,
+            }
+
+
+def parse_where(value: Optional[str]) -> Dict[str, List[str]]:
+    """Parse `column=a|b,column2=c` into {column: [a, b], column2: [c]}; raises ValueError when malformed."""
+    where: Dict[str, List[str]] = {}
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        column, sep, values = part.partition("=")
+        if not sep or not column.strip():
+            raise ValueError(f"Malformed filter: {part}")
+        where.setdefault(column.strip(), []).extend(v.strip() for v in values.split("|"))
+    return where
+
+
+def _day_label(days: int) -> str:
+    return datetime.utcfromtimestamp(days * 86400).date().isoformat()
+
+
+def _time_part(ts: np.ndarray, part: str) -> np.ndarray:
+    days = ts // 86400
+    hour = (ts % 86400) // 3600
+    # 1970-01-01 was a Thursday; weekday 0 = Monday like datetime.weekday()
+    weekday = (days + 3) % 7
+    if part == "hour":
+        return hour
+    if part == "weekday":
+        return weekday
+    if part == "hour_of_week":
+        return weekday * 24 + hour
+    return days
+
+
+_snapshot = ColumnarSnapshot()
+
+
+def get_snapshot(db: Session) -> ColumnarSnapshot:
+    """The process-wide snapshot, refreshed first if writes are pending or the full reload is due."""
+    _snapshot.refresh(db)
+    return _snapshot
+
+
+# --- change tracking ----------------------------------------------------------------------------
+
+_PENDING_KEY = "analytics_columnar_pending"
+
+
+def _session_pending(session: Session) -> _Pending:
+    return session.info.setdefault(_PENDING_KEY, _Pending())
+
+
+def _changes_joined_columns(obj: Any, spec: TableSpec, deleted: bool) -> bool:
+    if deleted:
+        return True
+    attrs = inspect(obj).attrs
+    columns = spec.reload_columns or [attr.key for attr in attrs]
+    return any(attrs[column].history.has_changes() for column in columns)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_flushed_ids(session: Session, flush_context) -> None:
+    pending = _session_pending(session)
+    deleted = set(session.deleted)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        spec = _SPEC_BY_TABLE.get(table)
+        if spec is not None:
+            pending.ids.setdefault(spec.name, set()).add(obj.id)
+        if obj in session.new:
+            # A new row of a joined table (e.g. a just-created event) has no dependent rows stored yet
+            continue
+        for name, other in SPECS.items():
+            if table in other.reload_on and _changes_joined_columns(obj, other, obj in deleted):
+                pending.reload.add(name)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _collect_bulk_writes(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is None:
+            return
+        pending = _session_pending(orm_execute_state.session)
+        for name, spec in SPECS.items():
+            if table.name == spec.model.__tablename__ or (
+                table.name in spec.reload_on and not orm_execute_state.is_insert
+            ):
+                pending.reload.add(name)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_committed(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is not None and (pending.ids or pending.reload):
+        _snapshot.mark(pending.ids, pending.reload)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Running totals for /api/analytics.totals, incremented in the same transaction as each write.
+EMBED_TAGS: analytics, counters, totals, running totals, after_flush, rebuild
+
+Counters (analytics_counters.name):
+- payments, refunds, member_visits: row counts
+- whatsapp.delivered, whatsapp.read: status events with that status
+
+An after_flush listener on SessionLocal turns inserted/deleted rows and status changes into deltas
+and applies them with an atomic upsert-increment on the flushing connection, so counters commit or
+roll back together with the rows. Bulk statements on the counted tables run through SessionLocal
+(insert/update/delete) delete the INITIALIZED marker row instead; writes from other tools bypass both,
+and `python -m app.maintenance counters-rebuild` recomputes everything.
+The first read without the marker (never rebuilt, or invalidated) rebuilds in place. Readers in one
+process wait on a lock and re-read; a rebuild that loses the race to another process rolls back and
+re-reads the winner's rows.
+"""
+
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, increment_rows
+from .models import AnalyticsCounter, MemberVisit, Payment, Refund, WhatsAppStatusEvent
+
+
+INITIALIZED = "_initialized"
+COUNTED_MODELS = {Payment: "payments", Refund: "refunds", MemberVisit: "member_visits"}
+WHATSAPP_STATUSES = ("delivered", "read")
+SOURCE_TABLES = {model.__tablename__ for model in (*COUNTED_MODELS, WhatsAppStatusEvent)}
+
+_rebuild_lock = threading.Lock()
+
+
+def _status_key(status: Optional[str]) -> Optional[str]:
+    return f"whatsapp.{status}" if status in WHATSAPP_STATUSES else None
+
+
+def flush_deltas(session: Session) -> Dict[str, int]:
+    deltas: Counter = Counter()
+    for objs, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            name = COUNTED_MODELS.get(type(obj))
+            if name:
+                deltas[name] += sign
+            elif isinstance(obj, WhatsAppStatusEvent):
+                key = _status_key(obj.status)
+                if key:
+                    deltas[key] += sign
+    for obj in session.dirty:
+        if not isinstance(obj, WhatsAppStatusEvent):
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.has_changes():
+            continue
+        for old in history.deleted:
+            key = _status_key(old)
+            if key:
+                deltas[key] -= 1
+        for new in history.added:
+            key = _status_key(new)
+            if key:
+                deltas[key] += 1
+    return {name: delta for name, delta in deltas.items() if delta}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _apply_counter_deltas(session: Session, flush_context) -> None:
+    deltas = flush_deltas(session)
+    if deltas:
+        increment_rows(
+            session.connection(),
+            AnalyticsCounter.__table__,
+            ["name"],
+            ["value"],
+            [{"name": name, "value": delta} for name, delta in sorted(deltas.items())],
+        )
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in SOURCE_TABLES:
+            orm_execute_state.session.connection().execute(
+                delete(AnalyticsCounter.__table__).where(AnalyticsCounter.name == INITIALIZED)
+            )
+
+
+def rebuild_counters(db: Session) -> Dict[str, int]:
+    """Recompute every counter from the source tables in one statement (caller commits)."""
+    row = db.execute(
+        select(
+            select(func.count()).select_from(Payment).scalar_subquery().label("payments"),
+            select(func.count()).select_from(Refund).scalar_subquery().label("refunds"),
+            select(func.count()).select_from(MemberVisit).scalar_subquery().label("member_visits"),
+            *(
+                select(func.count())
+                .select_from(WhatsAppStatusEvent)
+                .where(WhatsAppStatusEvent.status == status)
+                .scalar_subquery()
+                .label(f"whatsapp.{status}")
+                for status in WHATSAPP_STATUSES
+            ),
+        )
+    ).one()
+    values = {name: int(value or 0) for name, value in row._mapping.items()}
+    db.execute(delete(AnalyticsCounter))
+    db.execute(
+        insert(AnalyticsCounter),
+        [{"name": name, "value": value} for name, value in values.items()] + [{"name": INITIALIZED, "value": 1}],
+    )
+    return values
+
+
+def _stored_counters(db: Session) -> Dict[str, int]:
+    return {name: int(value) for name, value in db.execute(select(AnalyticsCounter.name, AnalyticsCounter.value))}
+
+
+def read_counters(db: Session) -> Dict[str, int]:
+    counters = _stored_counters(db)
+    if INITIALIZED not in counters:
+        with _rebuild_lock:
+            counters = _stored_counters(db)
+            if INITIALIZED not in counters:
+                try:
+                    counters = rebuild_counters(db)
+                    db.commit()
+                except IntegrityError:
+                    # Another process inserted the rebuilt rows first
+                    db.rollback()
+                    counters = _stored_counters(db)
+    counters.pop(INITIALIZED, None)
+    return counters
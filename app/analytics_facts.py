@@ -14,19 +14,28 @@ This module exposes compute_facts(db) returning independent counts/sums:
 - WhatsApp: messages_total, status_events_total, delivered, read, error, distinct_statused_messages
 - MemberVisits: total, unique_members
 
+Each table is scanned once with conditional aggregates, so a facts call issues a fixed number of
+statements (FACTS_STATEMENTS) no matter how many facts are added: a new fact is one more labeled
+aggregate in an existing scan, not another round-trip.
+
 SQL sketches:
-- Members by status: SELECT status, COUNT(*) FROM members GROUP BY status;
-- Events capacity sum: SELECT SUM(capacity) FROM events WHERE capacity IS NOT NULL;
-- Bookings by status: SELECT status, COUNT(*) FROM bookings GROUP BY status;
-- Payments sum: SELECT COALESCE(SUM(amount_cents),0) FROM payments;
-- Refunds sum: SELECT COALESCE(SUM(amount_cents),0) FROM refunds;
-- WhatsApp delivered/read/error: SELECT COUNT(*) FROM whatsapp_status_events WHERE status='delivered'; ...
+- Members by status: SELECT status, COUNT(*) FROM members GROUP BY status;  -- total = sum of groups
+- Events: SELECT COUNT(*), COUNT(capacity), COALESCE(SUM(capacity), 0) FROM events;
+- Bookings: SELECT status, COUNT(*) FROM bookings GROUP BY status;
+            SELECT COUNT(DISTINCT member_id), COUNT(DISTINCT event_id) FROM bookings;
+- Lookup totals: SELECT (SELECT COUNT(*) FROM class_types), (SELECT COUNT(*) FROM groups), ...;
+- Payments: SELECT COUNT(*), SUM(CASE WHEN status='succeeded' THEN 1 ELSE 0 END),
+            COALESCE(SUM(amount_cents), 0), COALESCE(AVG(amount_cents), 0) FROM payments;
+- Refunds: SELECT COUNT(*), COALESCE(SUM(amount_cents), 0) FROM refunds;
+- WhatsApp: SELECT COUNT(*), SUM(CASE WHEN status='delivered' THEN 1 ELSE 0 END), ...,
+            COUNT(DISTINCT message_id) FROM whatsapp_status_events;
 - Member visits: SELECT COUNT(*), COUNT(DISTINCT member_id) FROM member_visits;
 """
 
-from typing import Dict
-from sqlalchemy import select, func
+from typing import Any, Dict
+from sqlalchemy import case, select, func
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
 
 from .models import (
     Member,
@@ -43,104 +52,176 @@ from .models import (
 )
 
 
+# Statements issued by one compute_facts() call; asserted in tests
+FACTS_STATEMENTS = 9
+
+
 def _counts_by_status(db: Session, model, field) -> Dict[str, int]:
     rows = db.execute(select(field, func.count()).select_from(model).group_by(field)).all()
     return {str(status or ""): int(cnt) for status, cnt in rows}
 
 
-def compute_facts(db: Session) -> dict:
-    members_total = db.execute(select(func.count()).select_from(Member)).scalar_one()
-    members_by_status = _counts_by_status(db, Member, Member.status)
-
-    events_total = db.execute(select(func.count()).select_from(Event)).scalar_one()
-    events_with_capacity = db.execute(
-        select(func.count()).select_from(Event).where(Event.capacity.is_not(None))
-    ).scalar_one()
-    events_capacity_sum = db.execute(
-        select(func.coalesce(func.sum(Event.capacity), 0)).where(Event.capacity.is_not(None))
-    ).scalar_one()
-
-    bookings_total = db.execute(select(func.count()).select_from(Booking)).scalar_one()
-    bookings_by_status = _counts_by_status(db, Booking, Booking.status)
-    bookings_unique_members = db.execute(
-        select(func.count(func.distinct(Booking.member_id)))
-    ).scalar_one()
-    bookings_unique_events = db.execute(
-        select(func.count(func.distinct(Booking.event_id)))
-    ).scalar_one()
-
-    class_types_total = db.execute(select(func.count()).select_from(ClassType)).scalar_one()
-    groups_total = db.execute(select(func.count()).select_from(Group)).scalar_one()
-    campaigns_total = db.execute(select(func.count()).select_from(FacebookCampaign)).scalar_one()
-
-    payments_count = db.execute(select(func.count()).select_from(Payment)).scalar_one()
-    payments_gross = db.execute(
-        select(func.coalesce(func.sum(Payment.amount_cents), 0))
-    ).scalar_one()
-    payments_avg = db.execute(
-        select(func.coalesce(func.avg(Payment.amount_cents), 0.0))
-    ).scalar_one()
-
-    refunds_count = db.execute(select(func.count()).select_from(Refund)).scalar_one()
-    refunds_gross = db.execute(
-        select(func.coalesce(func.sum(Refund.amount_cents), 0))
-    ).scalar_one()
-
-    whatsapp_messages_total = db.execute(
-        select(func.count()).select_from(WhatsAppMessage)
-    ).scalar_one()
-    whatsapp_events_total = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent)
-    ).scalar_one()
-    whatsapp_delivered = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status == "delivered")
-    ).scalar_one()
-    whatsapp_read = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status == "read")
-    ).scalar_one()
-    whatsapp_error = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status == "error")
-    ).scalar_one()
-    whatsapp_distinct_statused_messages = db.execute(
-        select(func.count(func.distinct(WhatsAppStatusEvent.message_id)))
-    ).scalar_one()
-
-    visits_total = db.execute(select(func.count()).select_from(MemberVisit)).scalar_one()
-    visits_unique_members = db.execute(
-        select(func.count(func.distinct(MemberVisit.member_id)))
-    ).scalar_one()
+def _count_where(condition) -> ColumnElement:
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _scan(db: Session, model, aggregates: Dict[str, ColumnElement]) -> Dict[str, Any]:
+    """Evaluate all labeled aggregates over `model` in a single SELECT."""
+    row = db.execute(select(*(expr.label(name) for name, expr in aggregates.items())).select_from(model)).one()
+    return dict(row._mapping)
+
+
+def _table_totals(db: Session, models: Dict[str, Any]) -> Dict[str, int]:
+    """COUNT(*) for several small tables in one round-trip via scalar subqueries."""
+    row = db.execute(
+        select(
+            *(select(func.count()).select_from(model).scalar_subquery().label(name) for name, model in models.items())
+        )
+    ).one()
+    return {name: int(value or 0) for name, value in row._mapping.items()}
+
+
+# Base scans: one statement each; shared with the request-scoped evaluator in analytics_metrics.py
+
+
+def members_by_status(db: Session) -> Dict[str, int]:
+    return _counts_by_status(db, Member, Member.status)
+
+
+def events_scan(db: Session) -> Dict[str, Any]:
+    return _scan(
+        db,
+        Event,
+        {
+            "total": func.count(),
+            "with_capacity_count": func.count(Event.capacity),
+            "capacity_sum": func.coalesce(func.sum(Event.capacity), 0),
+        },
+    )
 
+
+def bookings_by_status(db: Session) -> Dict[str, int]:
+    return _counts_by_status(db, Booking, Booking.status)
+
+
+def bookings_distinct(db: Session) -> Dict[str, Any]:
+    return _scan(
+        db,
+        Booking,
+        {
+            "unique_members": func.count(func.distinct(Booking.member_id)),
+            "unique_events": func.count(func.distinct(Booking.event_id)),
+        },
+    )
+
+
+def lookup_totals(db: Session) -> Dict[str, int]:
+    return _table_totals(
+        db,
+        {
+            "class_types": ClassType,
+            "groups": Group,
+            "campaigns": FacebookCampaign,
+            "whatsapp_messages": WhatsAppMessage,
+        },
+    )
+
+
+def payments_scan(db: Session) -> Dict[str, Any]:
+    return _scan(
+        db,
+        Payment,
+        {
+            "count": func.count(),
+            "succeeded": _count_where(Payment.status == "succeeded"),
+            "gross_amount_cents": func.coalesce(func.sum(Payment.amount_cents), 0),
+            "avg_amount_cents": func.coalesce(func.avg(Payment.amount_cents), 0.0),
+        },
+    )
+
+
+def refunds_scan(db: Session) -> Dict[str, Any]:
+    return _scan(
+        db,
+        Refund,
+        {"count": func.count(), "gross_amount_cents": func.coalesce(func.sum(Refund.amount_cents), 0)},
+    )
+
+
+def whatsapp_scan(db: Session, exact_distinct: bool = True) -> Dict[str, Any]:
+    """With exact_distinct=False the COUNT(DISTINCT) is left out; callers fill it from a sketch."""
+    aggregates = {
+        "status_events_total": func.count(),
+        "delivered": _count_where(WhatsAppStatusEvent.status == "delivered"),
+        "read": _count_where(WhatsAppStatusEvent.status == "read"),
+        "error": _count_where(WhatsAppStatusEvent.status == "error"),
+    }
+    if exact_distinct:
+        aggregates["distinct_statused_messages"] = func.count(func.distinct(WhatsAppStatusEvent.message_id))
+    return _scan(db, WhatsAppStatusEvent, aggregates)
+
+
+def visits_scan(db: Session, exact_distinct: bool = True) -> Dict[str, Any]:
+    aggregates = {"total": func.count()}
+    if exact_distinct:
+        aggregates["unique_members"] = func.count(func.distinct(MemberVisit.member_id))
+    return _scan(db, MemberVisit, aggregates)
+
+
+def build_facts(
+    members_by_status: Dict[str, int],
+    events: Dict[str, Any],
+    bookings_by_status: Dict[str, int],
+    bookings_distinct: Dict[str, Any],
+    lookup_totals: Dict[str, int],
+    payments: Dict[str, Any],
+    refunds: Dict[str, Any],
+    whatsapp: Dict[str, Any],
+    visits: Dict[str, Any],
+) -> dict:
     return {
-        "members": {"total": int(members_total), "by_status": {k: int(v) for k, v in members_by_status.items()}},
+        "members": {"total": sum(members_by_status.values()), "by_status": dict(members_by_status)},
         "events": {
-            "total": int(events_total),
-            "with_capacity_count": int(events_with_capacity),
-            "capacity_sum": int(events_capacity_sum or 0),
+            "total": int(events["total"]),
+            "with_capacity_count": int(events["with_capacity_count"]),
+            "capacity_sum": int(events["capacity_sum"] or 0),
         },
         "bookings": {
-            "total": int(bookings_total),
-            "by_status": {k: int(v) for k, v in bookings_by_status.items()},
-            "unique_members": int(bookings_unique_members),
-            "unique_events": int(bookings_unique_events),
+            "total": sum(bookings_by_status.values()),
+            "by_status": dict(bookings_by_status),
+            "unique_members": int(bookings_distinct["unique_members"]),
+            "unique_events": int(bookings_distinct["unique_events"]),
         },
-        "class_types": {"total": int(class_types_total)},
-        "groups": {"total": int(groups_total)},
-        "campaigns": {"total": int(campaigns_total)},
+        "class_types": {"total": lookup_totals["class_types"]},
+        "groups": {"total": lookup_totals["groups"]},
+        "campaigns": {"total": lookup_totals["campaigns"]},
         "payments": {
-            "count": int(payments_count),
-            "gross_amount_cents": int(payments_gross or 0),
-            "avg_amount_cents": float(payments_avg or 0.0),
+            "count": int(payments["count"]),
+            "gross_amount_cents": int(payments["gross_amount_cents"] or 0),
+            "avg_amount_cents": float(payments["avg_amount_cents"] or 0.0),
         },
-        "refunds": {"count": int(refunds_count), "gross_amount_cents": int(refunds_gross or 0)},
+        "refunds": {"count": int(refunds["count"]), "gross_amount_cents": int(refunds["gross_amount_cents"] or 0)},
         "whatsapp": {
-            "messages_total": int(whatsapp_messages_total),
-            "status_events_total": int(whatsapp_events_total),
-            "delivered": int(whatsapp_delivered),
-            "read": int(whatsapp_read),
-            "error": int(whatsapp_error),
-            "distinct_statused_messages": int(whatsapp_distinct_statused_messages),
+            "messages_total": lookup_totals["whatsapp_messages"],
+            "status_events_total": int(whatsapp["status_events_total"]),
+            "delivered": int(whatsapp["delivered"]),
+            "read": int(whatsapp["read"]),
+            "error": int(whatsapp["error"]),
+            "distinct_statused_messages": int(whatsapp["distinct_statused_messages"]),
         },
-        "visits": {"total": int(visits_total), "unique_members": int(visits_unique_members)},
+        "visits": {"total": int(visits["total"]), "unique_members": int(visits["unique_members"])},
     }
 
 
+def compute_facts(db: Session) -> dict:
+    return build_facts(
+        members_by_status=members_by_status(db),
+        events=events_scan(db),
+        bookings_by_status=bookings_by_status(db),
+        bookings_distinct=bookings_distinct(db),
+        lookup_totals=lookup_totals(db),
+        payments=payments_scan(db),
+        refunds=refunds_scan(db),
+        whatsapp=whatsapp_scan(db),
+        visits=visits_scan(db),
+    )
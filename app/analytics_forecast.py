@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Next-week demand forecast per class type and weekly time slot (weekday, hour), compared with event capacity.
+EMBED_TAGS: analytics, forecast, demand, capacity, scheduling, class types, bookings, visits, numpy, smoothing
+
+Demand of a past session = max(approved bookings, distinct visiting members), so drop-ins that
+checked in without a booking count too. refresh_demand_forecast():
+- reads the sessions of the last APP_FORECAST_HISTORY_WEEKS whole weeks with their approved
+  bookings and visitors in one statement (two grouped subqueries joined onto events)
+- bins them into a (slot, week) matrix of mean demand per session with np.add.at, where a slot is
+  (class type, weekday, hour of the event start) and weeks without a session stay NaN
+- exponentially smooths every slot's weekly series at once (one vectorized step per week, factor
+  APP_FORECAST_SMOOTHING) and rewrites demand_forecasts
+
+It runs daily in one app worker (APP_FORECAST_REFRESH_SECONDS, see periodic.py) and as
+`python -m app.maintenance forecast-refresh`; the first schedule read computes it when it never ran
+(database.rebuild_once: once per process, a concurrent computation elsewhere wins).
+schedule_forecast() puts the forecast of each upcoming event's slot next to its capacity, falling back
+to the class type's session-weighted mean for slots without history.
+"""
+
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .analytics_timeseries import bucket_start
+from .booking_counts import ensure_booking_counts
+from .config import get_settings
+from .database import rebuild_once
+from .models import Booking, ConfigEntry, DemandForecast, Event, EventBookingCounts, MemberVisit
+from .periodic import start_periodic
+
+
+COMPUTED_KEY = "forecast.through_week"
+SLOTS_PER_WEEK = 7 * 24
+
+_forecasts = DemandForecast.__table__
+
+
+def smooth(weekly: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponentially smoothed level of every row of a (slots, weeks) matrix; NaN weeks are skipped."""
+    level = np.full(weekly.shape[0], np.nan)
+    for week in weekly.T:
+        seen = ~np.isnan(week)
+        blended = np.where(np.isnan(level), week, alpha * week + (1 - alpha) * level)
+        level = np.where(seen, blended, level)
+    return level
+
+
+def _sessions(db: Session, since: datetime, until: datetime) -> List[Tuple[str, datetime, int, int]]:
+    """(class type, start, approved bookings, distinct visitors) of every event starting in [since, until)."""
+    approved = (
+        select(Booking.event_id, func.count().label("n"))
+        .where(Booking.status == "approved")
+        .group_by(Booking.event_id)
+        .subquery()
+    )
+    visitors = (
+        select(MemberVisit.event_id, func.count(func.distinct(MemberVisit.member_id)).label("n"))
+        .where(MemberVisit.event_id.is_not(None))
+        .group_by(MemberVisit.event_id)
+        .subquery()
+    )
+    stmt = (
+        select(Event.class_type_id, Event.start, func.coalesce(approved.c.n, 0), func.coalesce(visitors.c.n, 0))
+        .outerjoin(approved, approved.c.event_id == Event.id)
+        .outerjoin(visitors, visitors.c.event_id == Event.id)
+        .where(Event.start >= since, Event.start < until)
+    )
+    return [(class_type_id, start, int(n), int(v)) for class_type_id, start, n, v in db.execute(stmt)]
+
+
+def refresh_demand_forecast(db: Session, today: Optional[date] = None) -> Dict[str, Any]:
+    """Recompute every slot's expected demand from the last whole weeks of sessions (caller commits)."""
+    settings = get_settings()
+    week_start = bucket_start(today or datetime.utcnow().date(), "week")
+    n_weeks = max(1, settings.forecast_history_weeks)
+    first_week = week_start - timedelta(days=7 * n_weeks)
+    sessions = _sessions(db, datetime.combine(first_week, time.min), datetime.combine(week_start, time.min))
+
+    conn = db.connection()
+    conn.execute(delete(_forecasts))
+    rows: List[Dict[str, Any]] = []
+    if sessions:
+        class_keys, class_idx = np.unique(np.array([s[0] for s in sessions], dtype=object), return_inverse=True)
+        stamps = np.array([s[1] for s in sessions], dtype="datetime64[s]")
+        demand = np.maximum([s[2] for s in sessions], [s[3] for s in sessions]).astype(np.float64)
+        days = stamps.astype("datetime64[D]")
+        hours = ((stamps - days) // np.timedelta64(1, "h")).astype(np.int64)
+        weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        weeks = (days - np.datetime64(first_week, "D")).astype(np.int64) // 7
+        slot_keys, slot_idx = np.unique(class_idx * SLOTS_PER_WEEK + weekdays * 24 + hours, return_inverse=True)
+
+        totals = np.zeros((len(slot_keys), n_weeks))
+        counts = np.zeros((len(slot_keys), n_weeks))
+        np.add.at(totals, (slot_idx, weeks), demand)
+        np.add.at(counts, (slot_idx, weeks), 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weekly = np.where(counts > 0, totals / counts, np.nan)
+        expected = smooth(weekly, settings.forecast_smoothing)
+
+        for key, level, n_sessions, n_weeks_seen in zip(
+            slot_keys, expected, counts.sum(axis=1), (counts > 0).sum(axis=1)
+        ):
+            class_i, slot = divmod(int(key), SLOTS_PER_WEEK)
+            rows.append(
+                {
+                    "class_type_id": str(class_keys[class_i]),
+                    "weekday": slot // 24,
+                    "hour": slot % 24,
+                    "expected": round(float(level), 3),
+                    "sessions": int(n_sessions),
+                    "weeks": int(n_weeks_seen),
+                }
+            )
+        conn.execute(insert(_forecasts), rows)
+    db.merge(ConfigEntry(key=COMPUTED_KEY, value=week_start.isoformat()))
+    db.flush()
+    return {"slots": len(rows), "sessions": len(sessions), "through_week": week_start.isoformat()}
+
+
+def ensure_forecast(db: Session) -> str:
+    """Monday of the week the stored forecast was computed for; computes (and commits) it when it never ran."""
+    rebuild_once(db, COMPUTED_KEY, refresh_demand_forecast)
+    return db.execute(select(ConfigEntry.value).where(ConfigEntry.key == COMPUTED_KEY)).scalar_one()
+
+
+def _outlook(fill_rate: Optional[float]) -> Optional[str]:
+    if fill_rate is None:
+        return None
+    if fill_rate > 1.0:
+        return "over"
+    if fill_rate < get_settings().forecast_under_fill_rate:
+        return "under"
+    return "ok"
+
+
+def schedule_forecast(
+    db: Session, start: datetime, end: datetime, class_type_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Events starting in [start, end) with capacity, current bookings and predicted demand / fill rate."""
+    through = ensure_forecast(db)
+    ensure_booking_counts(db)
+    stmt = (
+        select(Event, func.coalesce(EventBookingCounts.approved_count, 0))
+        .outerjoin(EventBookingCounts, EventBookingCounts.event_id == Event.id)
+        .where(Event.start >= start, Event.start < end)
+        .order_by(Event.start, Event.id)
+    )
+    if class_type_id is not None:
+        stmt = stmt.where(Event.class_type_id == class_type_id)
+    events = db.execute(stmt).all()
+
+    by_slot: Dict[Tuple[str, int, int], float] = {}
+    weighted: Dict[str, List[float]] = {}
+    class_ids = sorted({ev.class_type_id for ev, _ in events})
+    if class_ids:
+        for row in db.execute(select(DemandForecast).where(DemandForecast.class_type_id.in_(class_ids))).scalars():
+            by_slot[(row.class_type_id, row.weekday, row.hour)] = row.expected
+            acc = weighted.setdefault(row.class_type_id, [0.0, 0.0])
+            acc[0] += row.expected * row.sessions
+            acc[1] += row.sessions
+
+    items: List[Dict[str, Any]] = []
+    for ev, booked in events:
+        predicted = by_slot.get((ev.class_type_id, ev.start.weekday(), ev.start.hour))
+        basis = "slot" if predicted is not None else None
+        fallback = weighted.get(ev.class_type_id)
+        if predicted is None and fallback and fallback[1] > 0:
+            predicted, basis = fallback[0] / fallback[1], "class_type"
+        fill_rate = round(predicted / ev.capacity, 3) if predicted is not None and ev.capacity else None
+        items.append(
+            {
+                "event_id": ev.id,
+                "name": ev.name,
+                "class_type_id": ev.class_type_id,
+                "start": ev.start,
+                "end": ev.end,
+                "capacity": ev.capacity,
+                "booked": int(booked),
+                "predicted_demand": round(predicted, 1) if predicted is not None else None,
+                "predicted_fill_rate": fill_rate,
+                "basis": basis,
+                "outlook": _outlook(fill_rate),
+            }
+        )
+    return {"forecast_through_week": through, "items": items}
+
+
+def start_forecast_refresher(stop: threading.Event) -> Optional[threading.Thread]:
+    """Recompute the forecast now and then every APP_FORECAST_REFRESH_SECONDS until `stop` is set (0 disables)."""
+    return start_periodic("forecast-refresh", get_settings().forecast_refresh_seconds, refresh_demand_forecast, stop)
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Weekday x hour occupancy heatmap (approved bookings, QR check-ins) per class type, stored as monthly 7x24 arrays.
+EMBED_TAGS: analytics, heatmap, occupancy, scheduling, bookings, check-ins, class types, numpy
+
+Kinds:
+- bookings: approved bookings, placed at their event's start (weekday, hour) and class type
+- checkins: member visits with source "qr_checkin", placed at the visit time; the class type is the
+  visit's event's, or "" for walk-ins without an event
+
+Storage: occupancy_heatmaps holds one 7x24 int32 grid (zlib) per (month, kind, class type).
+- rebuild_heatmap() reads each kind's (class type, timestamp) rows once and bins all of them in a
+  single vectorized np.add.at into a (month, class type, weekday, hour) array.
+- An after_flush listener turns inserted/deleted rows and booking status changes into cell deltas
+  and adds them onto the affected grids in the same transaction: a missing grid is inserted with
+  ON CONFLICT DO NOTHING, an existing one is read FOR UPDATE (where supported) and rewritten.
+  Rescheduled or deleted events, edited visits and bulk statements on the source tables clear the
+  READY_KEY marker in `config` instead; the next read rebuilds (once per process, see
+  database.rebuild_once).
+
+Reads sum the stored grids of whole months in the range and bin the raw rows of partial months the
+same vectorized way, returning a K x 7 x 24 array per kind (K = class types, sorted).
+"""
+
+import zlib
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, event, inspect, insert, select, update
+from sqlalchemy.orm import Session
+
+from .analytics_rollups import EdgeRange, in_ranges
+from .database import SessionLocal, insert_or_ignore, rebuild_once
+from .models import Booking, ConfigEntry, Event, MemberVisit, OccupancyHeatmap
+
+
+READY_KEY = "heatmap.ready"
+KINDS = ("bookings", "checkins")
+CHECKIN_SOURCE = "qr_checkin"
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+SOURCE_TABLES = {Booking.__tablename__, Event.__tablename__, MemberVisit.__tablename__}
+
+_grids = OccupancyHeatmap.__table__
+Cell = Tuple[str, str, str, int, int]  # (month, kind, class_type_id, weekday, hour)
+
+
+def encode(grid: np.ndarray) -> bytes:
+    return zlib.compress(np.ascontiguousarray(grid, dtype="<i4").tobytes())
+
+
+def decode(blob: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(blob), dtype="<i4").reshape(7, 24).astype(np.int64)
+
+
+def _cell(kind: str, class_type_id: Optional[str], ts: datetime) -> Cell:
+    return (ts.strftime("%Y-%m"), kind, class_type_id or "", ts.weekday(), ts.hour)
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _at(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+# --- vectorized binning -------------------------------------------------------------------------
+
+
+def _points(db: Session, kind: str, edges: Optional[List[EdgeRange]] = None) -> Tuple[List[str], np.ndarray]:
+    """Class type ids and timestamps (datetime64[s]) of every row of `kind`, optionally within `edges`."""
+    if kind == "bookings":
+        ts = Event.start
+        stmt = (
+            select(Event.class_type_id, Event.start)
+            .join(Booking, Booking.event_id == Event.id)
+            .where(Booking.status == "approved")
+        )
+    else:
+        ts = MemberVisit.ts
+        stmt = (
+            select(Event.class_type_id, MemberVisit.ts)
+            .outerjoin(Event, Event.id == MemberVisit.event_id)
+            .where(MemberVisit.source == CHECKIN_SOURCE)
+        )
+    if edges is not None:
+        stmt = stmt.where(in_ranges(ts, edges))
+    rows = db.execute(stmt).all()
+    return [row[0] or "" for row in rows], np.array([row[1] for row in rows], dtype="datetime64[s]")
+
+
+def _bin(stamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(month, weekday, hour) of every timestamp, without a Python-level loop."""
+    days = stamps.astype("datetime64[D]")
+    hours = ((stamps - days) // np.timedelta64(1, "h")).astype(np.int64)
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    return days.astype("datetime64[M]"), weekdays, hours
+
+
+def _cube(class_ids: List[str], stamps: np.ndarray) -> Tuple[List[str], List[str], np.ndarray]:
+    """(months, class types, counts[month, class type, weekday, hour]) binned in one np.add.at."""
+    months, weekdays, hours = _bin(stamps)
+    month_keys, month_idx = np.unique(months, return_inverse=True)
+    class_keys, class_idx = np.unique(np.array(class_ids, dtype=object), return_inverse=True)
+    cube = np.zeros((len(month_keys), len(class_keys), 7, 24), dtype=np.int64)
+    np.add.at(cube, (month_idx, class_idx, weekdays, hours), 1)
+    return [str(m) for m in month_keys], [str(c) for c in class_keys], cube
+
+
+# --- rebuild ------------------------------------------------------------------------------------
+
+
+def rebuild_heatmap(db: Session) -> Dict[str, int]:
+    """Recompute every stored grid from bookings and visits and mark the heatmap ready (caller commits)."""
+    conn = db.connection()
+    conn.execute(delete(_grids))
+    written: Dict[str, int] = {}
+    for kind in KINDS:
+        class_ids, stamps = _points(db, kind)
+        rows = []
+        if len(stamps):
+            months, classes, cube = _cube(class_ids, stamps)
+            for m, c in zip(*np.nonzero(cube.reshape(len(months), len(classes), -1).any(axis=2))):
+                rows.append(
+                    {"month": months[m], "kind": kind, "class_type_id": classes[c], "counts": encode(cube[m, c])}
+                )
+        if rows:
+            conn.execute(insert(_grids), rows)
+        written[kind] = len(rows)
+    db.merge(ConfigEntry(key=READY_KEY, value=datetime.utcnow().isoformat()))
+    db.flush()
+    return written
+
+
+def ensure_heatmap(db: Session) -> None:
+    rebuild_once(db, READY_KEY, rebuild_heatmap)
+
+
+# --- incremental maintenance --------------------------------------------------------------------
+
+
+def _invalidate(session: Session) -> None:
+    session.connection().execute(delete(ConfigEntry.__table__).where(ConfigEntry.key == READY_KEY))
+
+
+def _changed(obj, *attrs: str) -> bool:
+    state = inspect(obj).attrs
+    return any(getattr(state, attr).history.has_changes() for attr in attrs)
+
+
+def _old_status(obj: Booking) -> Optional[str]:
+    history = inspect(obj).attrs.status.history
+    return history.deleted[0] if history.deleted else obj.status
+
+
+def _apply(conn, deltas: Counter) -> None:
+    """Add cell deltas onto their stored grids, one read-modify-write per (month, kind, class type)."""
+    grids: Dict[Tuple[str, str, str], np.ndarray] = {}
+    for (month, kind, class_type_id, weekday, hour), delta in deltas.items():
+        if delta:
+            grid = grids.setdefault((month, kind, class_type_id), np.zeros((7, 24), dtype=np.int64))
+            grid[weekday, hour] += delta
+    for (month, kind, class_type_id), grid in sorted(grids.items()):
+        # Create a missing grid first (a concurrent creator wins), so FOR UPDATE always has a row to lock
+        values = {"month": month, "kind": kind, "class_type_id": class_type_id, "counts": encode(grid)}
+        if insert_or_ignore(conn, _grids, values):
+            continue
+        key = [_grids.c.month == month, _grids.c.kind == kind, _grids.c.class_type_id == class_type_id]
+        blob = conn.execute(select(_grids.c.counts).where(*key).with_for_update()).scalar_one()
+        conn.execute(update(_grids).where(*key).values(counts=encode(decode(blob) + grid)))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _apply_heatmap_deltas(session: Session, flush_context) -> None:
+    conn = session.connection()
+    events: Dict[str, Optional[Tuple[datetime, str]]] = {}
+
+    def event_slot(event_id: Optional[str]) -> Optional[Tuple[datetime, str]]:
+        if not event_id:
+            return None
+        if event_id not in events:
+            row = conn.execute(select(Event.start, Event.class_type_id).where(Event.id == event_id)).first()
+            events[event_id] = tuple(row) if row else None
+        return events[event_id]
+
+    deltas: Counter = Counter()
+
+    def booking(obj: Booking, sign: int) -> None:
+        slot = event_slot(obj.event_id)
+        if slot is not None:
+            deltas[_cell("bookings", slot[1], slot[0])] += sign
+
+    def checkin(obj: MemberVisit, sign: int) -> None:
+        if obj.source == CHECKIN_SOURCE:
+            slot = event_slot(obj.event_id)
+            deltas[_cell("checkins", slot[1] if slot else "", obj.ts)] += sign
+
+    for obj in session.dirty:
+        if isinstance(obj, Event) and _changed(obj, "start", "class_type_id"):
+            _invalidate(session)
+            return
+        if isinstance(obj, MemberVisit) and _changed(obj, "ts", "source", "event_id"):
+            _invalidate(session)
+            return
+        if isinstance(obj, Booking):
+            if _changed(obj, "event_id"):
+                _invalidate(session)
+                return
+            old, new = _old_status(obj), obj.status
+            if old != new and "approved" in (old, new):
+                booking(obj, 1 if new == "approved" else -1)
+    for obj in session.deleted:
+        if isinstance(obj, Event):
+            _invalidate(session)
+            return
+        if isinstance(obj, Booking) and _old_status(obj) == "approved":
+            booking(obj, -1)
+        elif isinstance(obj, MemberVisit):
+            checkin(obj, -1)
+    for obj in session.new:
+        if isinstance(obj, Booking) and obj.status == "approved":
+            booking(obj, 1)
+        elif isinstance(obj, MemberVisit):
+            checkin(obj, 1)
+    _apply(conn, deltas)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in SOURCE_TABLES:
+            _invalidate(orm_execute_state.session)
+
+
+# --- reads --------------------------------------------------------------------------------------
+
+
+def _split_months(
+    start: Optional[date], end: Optional[date]
+) -> Tuple[Optional[Tuple[Optional[str], Optional[str]]], List[EdgeRange]]:
+    """Whole months ([first, last_excl) as YYYY-MM, None = unbounded) and raw edge ranges of [start, end]."""
+    hi = end + timedelta(days=1) if end is not None else None
+    first = start if start is None or start.day == 1 else _next_month(start)
+    last_excl = hi if hi is None or hi.day == 1 else hi.replace(day=1)
+    if first is not None and last_excl is not None and first >= last_excl:
+        return None, [(_at(start), _at(hi), False)]
+    edges: List[EdgeRange] = []
+    if start is not None and start < first:
+        edges.append((_at(start), _at(first), False))
+    if hi is not None and last_excl < hi:
+        edges.append((_at(last_excl), _at(hi), False))
+    months = tuple(day.strftime("%Y-%m") if day is not None else None for day in (first, last_excl))
+    return months, edges
+
+
+def heatmap(
+    db: Session, start: Optional[date] = None, end: Optional[date] = None, class_type_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Per-kind K x 7 x 24 counts over [start, end] (inclusive days, either bound optional)."""
+    ensure_heatmap(db)
+    months, edges = _split_months(start, end)
+    totals: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def add(kind: str, cls: str, grid: np.ndarray) -> None:
+        if class_type_id is None or cls == class_type_id:
+            totals[(kind, cls)] = totals.get((kind, cls), 0) + grid
+
+    if months is not None:
+        where = []
+        if months[0] is not None:
+            where.append(OccupancyHeatmap.month >= months[0])
+        if months[1] is not None:
+            where.append(OccupancyHeatmap.month < months[1])
+        if class_type_id is not None:
+            where.append(OccupancyHeatmap.class_type_id == class_type_id)
+        for row in db.execute(select(OccupancyHeatmap).where(*where)).scalars():
+            add(row.kind, row.class_type_id, decode(row.counts))
+    if edges:
+        for kind in KINDS:
+            class_ids, stamps = _points(db, kind, edges)
+            if len(stamps):
+                _, classes, cube = _cube(class_ids, stamps)
+                for i, cls in enumerate(classes):
+                    add(kind, cls, cube[:, i].sum(axis=0))
+
+    class_types = sorted({cls for _, cls in totals})
+    result: Dict[str, Any] = {"weekdays": list(WEEKDAYS), "class_types": class_types}
+    for kind in KINDS:
+        array = np.zeros((len(class_types), 7, 24), dtype=np.int64)
+        for i, cls in enumerate(class_types):
+            array[i] += totals.get((kind, cls), 0)
+        result[kind] = array.tolist()
+        result[f"{kind}_total"] = int(array.sum())
+    return result
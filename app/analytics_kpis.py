@@ -11,6 +11,7 @@ KPIs:
 - booking_approval_rate = count(Booking.status='approved') / max(1, count(Booking))
 - visits_avg_per_member = count(MemberVisit) / max(1, count(DISTINCT member_id))
 - event_capacity_utilization_avg = average(min(1.0, approved_bookings / capacity)) for events with capacity
+  (approved_bookings read from event_booking_counts, see booking_counts.py)
 
 SQL sketches:
 - Success rate: SELECT CAST(SUM(CASE WHEN status='succeeded' THEN 1 ELSE 0 END) AS FLOAT) / MAX(1, COUNT(*)) FROM payments;
@@ -19,61 +20,47 @@ SQL sketches:
 - Visits avg: SELECT CAST(COUNT(*) AS FLOAT) / MAX(1, COUNT(DISTINCT member_id)) FROM member_visits;
 """
 
-from typing import Optional
-from sqlalchemy import select, func, and_
+from typing import Any, Dict, Optional
 from sqlalchemy.orm import Session
 
-from .models import Payment, Refund, WhatsAppStatusEvent, Booking, MemberVisit, Event
+from .analytics_facts import bookings_by_status, payments_scan, refunds_scan, visits_scan, whatsapp_scan
+from .booking_counts import average_utilization
 
 
-def compute_kpis(db: Session) -> dict:
-    payments_total = db.execute(select(func.count()).select_from(Payment)).scalar_one() or 0
-    payments_succeeded = db.execute(
-        select(func.count()).select_from(Payment).where(Payment.status == "succeeded")
-    ).scalar_one() or 0
-    refunds_total = db.execute(select(func.count()).select_from(Refund)).scalar_one() or 0
-
-    whats_total = db.execute(select(func.count()).select_from(WhatsAppStatusEvent)).scalar_one() or 0
-    whats_error = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status == "error")
-    ).scalar_one() or 0
-
-    bookings_total = db.execute(select(func.count()).select_from(Booking)).scalar_one() or 0
-    bookings_approved = db.execute(
-        select(func.count()).select_from(Booking).where(Booking.status == "approved")
-    ).scalar_one() or 0
+def _safe_rate(n: int, d: int) -> Optional[float]:
+    if d <= 0:
+        return None
+    return float(n) / float(d)
 
-    visits_total = db.execute(select(func.count()).select_from(MemberVisit)).scalar_one() or 0
-    visits_unique_members = db.execute(
-        select(func.count(func.distinct(MemberVisit.member_id))).select_from(MemberVisit)
-    ).scalar_one() or 0
-
-    # Utilization average across events with capacity
-    events_with_capacity = db.execute(
-        select(Event.id, Event.capacity).where(Event.capacity.is_not(None))
-    ).all()
-    util_values = []
-    for event_id, capacity in events_with_capacity:
-        if not capacity or capacity <= 0:
-            continue
-        approved_count = db.execute(
-            select(func.count()).select_from(Booking).where(and_(Booking.event_id == event_id, Booking.status == "approved"))
-        ).scalar_one() or 0
-        util_values.append(min(1.0, float(approved_count) / float(capacity)))
-    utilization_avg = round(sum(util_values) / len(util_values), 4) if util_values else None
-
-    def safe_rate(n: int, d: int) -> Optional[float]:
-        if d <= 0:
-            return None
-        return float(n) / float(d)
 
+def build_kpis(
+    payments: Dict[str, Any],
+    refunds: Dict[str, Any],
+    whatsapp: Dict[str, Any],
+    bookings_by_status: Dict[str, int],
+    visits: Dict[str, Any],
+    utilization_avg: Optional[float],
+) -> dict:
+    payments_total = int(payments["count"])
     return {
-        "payments_success_rate": safe_rate(int(payments_succeeded), int(payments_total)),
-        "refunds_per_payment_rate": safe_rate(int(refunds_total), int(payments_total)),
-        "whatsapp_error_rate": safe_rate(int(whats_error), int(whats_total)),
-        "booking_approval_rate": safe_rate(int(bookings_approved), int(bookings_total)),
-        "visits_avg_per_member": safe_rate(int(visits_total), int(visits_unique_members)),
+        "payments_success_rate": _safe_rate(int(payments["succeeded"]), payments_total),
+        "refunds_per_payment_rate": _safe_rate(int(refunds["count"]), payments_total),
+        "whatsapp_error_rate": _safe_rate(int(whatsapp["error"]), int(whatsapp["status_events_total"])),
+        "booking_approval_rate": _safe_rate(
+            int(bookings_by_status.get("approved", 0)), sum(bookings_by_status.values())
+        ),
+        "visits_avg_per_member": _safe_rate(int(visits["total"]), int(visits["unique_members"])),
         "event_capacity_utilization_avg": utilization_avg,
     }
 
 
+def compute_kpis(db: Session) -> dict:
+    # Base aggregates are the same single-scan queries compute_facts uses
+    return build_kpis(
+        payments=payments_scan(db),
+        refunds=refunds_scan(db),
+        whatsapp=whatsapp_scan(db),
+        bookings_by_status=bookings_by_status(db),
+        visits=visits_scan(db),
+        utilization_avg=average_utilization(db),
+    )
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Member leaderboards (top visitors per month or overall, weekly visit streaks) maintained incrementally on visit writes.
+EMBED_TAGS: analytics, leaderboards, visits, streaks, members, attendance, coaches, incremental
+
+State:
+- member_visit_counts: visits per (period, member) where period is "YYYY-MM" or "all"; the
+  (period, visits) index serves "top N this month" as an index-ordered LIMIT query.
+- member_visit_streaks: per member, the Monday of the last week with a visit and the current and
+  longest runs of consecutive visited weeks. A current streak stays alive through the week after
+  last_week (the member may still come in this week).
+
+Maintenance (after_flush on SessionLocal, same transaction as the visit):
+- Inserted visits add one to their month and to "all" via an upsert-increment, and advance the
+  member's streak from its stored state (read FOR UPDATE): same week is a no-op, the next week
+  extends the run, a later week starts a new run. A first streak row that a concurrent visit
+  inserted meanwhile (ON CONFLICT DO NOTHING skipped ours) is recomputed from the visit weeks.
+- Deleted visits subtract one; they and backdated visits (older than the member's last_week)
+  recompute that member's streak from their distinct visit weeks.
+- Moving a visit (ts/member_id edits) and bulk statements on member_visits clear the READY_KEY marker
+  in `config`; the next read rebuilds everything (once per process, see database.rebuild_once), as
+  does `python -m app.maintenance leaderboards-rebuild`.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, func, inspect, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from .analytics_timeseries import bucket_expr, bucket_label, bucket_start
+from .database import SessionLocal, increment_rows, insert_or_ignore, rebuild_once
+from .models import ConfigEntry, Member, MemberVisit, MemberVisitCount, MemberVisitStreak
+
+
+READY_KEY = "leaderboards.ready"
+ALL_PERIOD = "all"
+STREAK_KINDS = ("current", "longest")
+
+_counts = MemberVisitCount.__table__
+_streaks = MemberVisitStreak.__table__
+
+
+def period_of(ts: datetime) -> str:
+    return ts.strftime("%Y-%m")
+
+
+def week_of(ts: datetime) -> date:
+    return bucket_start(ts.date() if isinstance(ts, datetime) else ts, "week")
+
+
+def streak_of(weeks: Iterable[date]) -> Tuple[date, int, int]:
+    """(last week, current run, longest run) for distinct visited weeks in ascending order."""
+    last: Optional[date] = None
+    run = longest = 0
+    for week in weeks:
+        run = run + 1 if last is not None and (week - last).days == 7 else 1
+        longest = max(longest, run)
+        last = week
+    if last is None:
+        raise ValueError("streak_of needs at least one week")
+    return last, run, longest
+
+
+def _week_rows(conn, member_ids: Optional[Iterable[str]] = None):
+    """Distinct (member_id, week Monday) pairs ordered by member then week, in one statement."""
+    week = bucket_expr(conn.dialect.name, MemberVisit.ts, "week").label("week")
+    stmt = select(MemberVisit.member_id, week).group_by(MemberVisit.member_id, week)
+    if member_ids is not None:
+        stmt = stmt.where(MemberVisit.member_id.in_(list(member_ids)))
+    rows = conn.execute(stmt.order_by(MemberVisit.member_id, week))
+    return ((member_id, date.fromisoformat(bucket_label(value))) for member_id, value in rows)
+
+
+def _streak_rows(conn, member_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    weeks: Dict[str, List[date]] = {}
+    for member_id, week in _week_rows(conn, member_ids):
+        weeks.setdefault(member_id, []).append(week)
+    rows = []
+    for member_id, member_weeks in weeks.items():
+        last, current, longest = streak_of(member_weeks)
+        rows.append({"member_id": member_id, "last_week": last, "current_weeks": current, "longest_weeks": longest})
+    return rows
+
+
+def _recompute_streaks(conn, member_ids: Set[str]) -> None:
+    if not member_ids:
+        return
+    conn.execute(delete(_streaks).where(_streaks.c.member_id.in_(sorted(member_ids))))
+    rows = _streak_rows(conn, sorted(member_ids))
+    if rows:
+        conn.execute(insert(_streaks), rows)
+
+
+# --- rebuild ------------------------------------------------------------------------------------
+
+
+def rebuild_leaderboards(db: Session) -> Dict[str, int]:
+    """Recompute every counter and streak from member_visits and mark the state ready (caller commits)."""
+    conn = db.connection()
+    conn.execute(delete(_counts))
+    conn.execute(delete(_streaks))
+    month = bucket_expr(conn.dialect.name, MemberVisit.ts, "month").label("month")
+    monthly = [
+        {"period": bucket_label(value)[:7], "member_id": member_id, "visits": int(visits)}
+        for value, member_id, visits in conn.execute(
+            select(month, MemberVisit.member_id, func.count()).group_by(month, MemberVisit.member_id)
+        )
+    ]
+    if monthly:
+        conn.execute(insert(_counts), monthly)
+    conn.execute(
+        insert(_counts).from_select(
+            ["period", "member_id", "visits"],
+            select(literal(ALL_PERIOD), MemberVisit.member_id, func.count()).group_by(MemberVisit.member_id),
+        )
+    )
+    streaks = _streak_rows(conn)
+    if streaks:
+        conn.execute(insert(_streaks), streaks)
+    db.merge(ConfigEntry(key=READY_KEY, value=datetime.utcnow().isoformat()))
+    db.flush()
+    return {"counters": len(monthly), "streaks": len(streaks)}
+
+
+def ensure_leaderboards(db: Session) -> None:
+    """Rebuild (and commit) when the state was never built or a bulk write invalidated it."""
+    rebuild_once(db, READY_KEY, rebuild_leaderboards)
+
+
+# --- incremental maintenance --------------------------------------------------------------------
+
+
+def _invalidate(session: Session) -> None:
+    session.connection().execute(delete(ConfigEntry.__table__).where(ConfigEntry.key == READY_KEY))
+
+
+def _advance_streaks(conn, weeks_by_member: Dict[str, Set[date]], recompute: Set[str]) -> None:
+    """
+    Apply newly visited weeks to stored streaks; members with backdated weeks go to `recompute`, as do
+    members whose first streak row another transaction inserted meanwhile.
+    """
+    if not weeks_by_member:
+        return
+    # Locked, so concurrent visits of one member advance its streak one after the other
+    stored = {
+        row.member_id: row
+        for row in conn.execute(
+            select(_streaks).where(_streaks.c.member_id.in_(sorted(weeks_by_member))).with_for_update()
+        )
+    }
+    for member_id, weeks in sorted(weeks_by_member.items()):
+        row = stored.get(member_id)
+        last, current, longest = (row.last_week, row.current_weeks, row.longest_weeks) if row else (None, 0, 0)
+        if last is not None and min(weeks) < last:
+            recompute.add(member_id)
+            continue
+        for week in sorted(weeks):
+            if week == last:
+                continue
+            current = current + 1 if last is not None and (week - last).days == 7 else 1
+            longest = max(longest, current)
+            last = week
+        values = {"last_week": last, "current_weeks": current, "longest_weeks": longest}
+        if row is None:
+            if not insert_or_ignore(conn, _streaks, {"member_id": member_id, **values}):
+                recompute.add(member_id)
+        else:
+            conn.execute(update(_streaks).where(_streaks.c.member_id == member_id).values(**values))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_visits(session: Session, flush_context) -> None:
+    for obj in session.dirty:
+        if isinstance(obj, MemberVisit):
+            attrs = inspect(obj).attrs
+            if attrs.ts.history.has_changes() or attrs.member_id.history.has_changes():
+                _invalidate(session)
+                return
+    added = [obj for obj in session.new if isinstance(obj, MemberVisit)]
+    removed = [obj for obj in session.deleted if isinstance(obj, MemberVisit)]
+    if not added and not removed:
+        return
+    deltas: Counter = Counter()
+    for sign, visits in ((1, added), (-1, removed)):
+        for visit in visits:
+            deltas[(period_of(visit.ts), visit.member_id)] += sign
+            deltas[(ALL_PERIOD, visit.member_id)] += sign
+    rows = [
+        {"period": period, "member_id": member_id, "visits": delta}
+        for (period, member_id), delta in sorted(deltas.items())
+        if delta
+    ]
+    conn = session.connection()
+    increment_rows(conn, _counts, ["period", "member_id"], ["visits"], rows)
+
+    recompute = {visit.member_id for visit in removed}
+    weeks_by_member: Dict[str, Set[date]] = {}
+    for visit in added:
+        if visit.member_id not in recompute:
+            weeks_by_member.setdefault(visit.member_id, set()).add(week_of(visit.ts))
+    _advance_streaks(conn, weeks_by_member, recompute)
+    _recompute_streaks(conn, recompute)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name == MemberVisit.__tablename__:
+            _invalidate(orm_execute_state.session)
+
+
+# --- reads --------------------------------------------------------------------------------------
+
+
+def top_visitors(db: Session, period: str = ALL_PERIOD, limit: int = 20) -> List[Dict[str, Any]]:
+    """Members with the most visits in `period` ("YYYY-MM" or "all"), most first."""
+    ensure_leaderboards(db)
+    rows = db.execute(
+        select(MemberVisitCount.member_id, Member.full_name, MemberVisitCount.visits)
+        .outerjoin(Member, Member.id == MemberVisitCount.member_id)
+        .where(MemberVisitCount.period == period, MemberVisitCount.visits > 0)
+        .order_by(MemberVisitCount.visits.desc(), MemberVisitCount.member_id)
+        .limit(limit)
+    ).all()
+    return [
+        {"rank": rank, "member_id": member_id, "full_name": name, "visits": int(visits)}
+        for rank, (member_id, name, visits) in enumerate(rows, start=1)
+    ]
+
+
+def top_streaks(
+    db: Session, kind: str = "current", limit: int = 20, today: Optional[date] = None
+) -> List[Dict[str, Any]]:
+    """Longest weekly streaks: still-alive current runs, or the longest run ever per member."""
+    if kind not in STREAK_KINDS:
+        raise ValueError(f"Unknown streak kind: {kind}")
+    ensure_leaderboards(db)
+    alive_since = week_of(today or datetime.utcnow().date()) - timedelta(days=7)
+    stmt = select(MemberVisitStreak, Member.full_name).outerjoin(Member, Member.id == MemberVisitStreak.member_id)
+    if kind == "current":
+        stmt = stmt.where(MemberVisitStreak.last_week >= alive_since).order_by(MemberVisitStreak.current_weeks.desc())
+    else:
+        stmt = stmt.order_by(MemberVisitStreak.longest_weeks.desc())
+    rows = db.execute(stmt.order_by(MemberVisitStreak.member_id).limit(limit)).all()
+    return [
+        {
+            "rank": rank,
+            "member_id": streak.member_id,
+            "full_name": name,
+            "current_weeks": streak.current_weeks if streak.last_week >= alive_since else 0,
+            "longest_weeks": streak.longest_weeks,
+            "last_week": streak.last_week.isoformat(),
+        }
+        for rank, (streak, name) in enumerate(rows, start=1)
+    ]
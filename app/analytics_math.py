@@ -9,17 +9,24 @@ well-documented, and easy to test with small fixtures. Formulas:
 - revenue_cents = sum(Payment.amount_cents in window) - sum(Refund.amount_cents in window)
 - refund_rate = sum(Refund.amount_cents in window) / max(1, sum(Payment.amount_cents in window))
 - whatsapp_delivery_rate = delivered_messages / max(1, sent_messages) where delivered_messages are
-  distinct message_ids that saw a delivered/read status in the window, and sent_messages are
+  messages whose FIRST delivered/read status falls in the window, and sent_messages are
   WhatsAppMessage rows created in the window.
+
+Windows are served by analytics_rollups.window_totals: whole days come from daily_rollups and only
+the partial first/last day is read from raw rows. The SQL sketches below are the raw equivalents.
+
+Period-over-period: compare_windows(db, start, end) evaluates every KPI for [start, end] and for the
+equally long window right before it. Each underlying metric reads both windows in one statement
+(conditional aggregates over the combined range, see analytics_rollups.windows_totals); each KPI
+comes back as {"current", "previous", "delta", "pct_change"}.
 """
 
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple, Union
 
-from sqlalchemy import and_, func, select
 from sqlalchemy.orm import Session
 
-from .models import Payment, Refund, WhatsAppMessage, WhatsAppStatusEvent
+from .analytics_rollups import window_totals, windows_totals
 
 
 def compute_revenue_cents(db: Session, start: datetime, end: datetime) -> int:
@@ -34,22 +41,8 @@ def compute_revenue_cents(db: Session, start: datetime, end: datetime) -> int:
       COALESCE((SELECT SUM(r.amount_cents) FROM refunds r WHERE r.created_at BETWEEN :start AND :end), 0)
       AS revenue_cents;
     """
-    payments_sum = (
-        db.execute(
-            select(func.coalesce(func.sum(Payment.amount_cents), 0)).where(
-                and_(Payment.created_at >= start, Payment.created_at <= end)
-            )
-        ).scalar_one()
-        or 0
-    )
-    refunds_sum = (
-        db.execute(
-            select(func.coalesce(func.sum(Refund.amount_cents), 0)).where(
-                and_(Refund.created_at >= start, Refund.created_at <= end)
-            )
-        ).scalar_one()
-        or 0
-    )
+    _, payments_sum = window_totals(db, "payments", start, end)
+    _, refunds_sum = window_totals(db, "refunds", start, end)
     return int(payments_sum) - int(refunds_sum)
 
 
@@ -67,30 +60,16 @@ def compute_refund_rate(db: Session, start: datetime, end: datetime) -> Optional
     SELECT CASE WHEN pay_sum <= 0 THEN NULL ELSE CAST(ref_sum AS FLOAT)/CAST(pay_sum AS FLOAT) END AS refund_rate
     FROM sums;
     """
-    payments_sum = (
-        db.execute(
-            select(func.coalesce(func.sum(Payment.amount_cents), 0)).where(
-                and_(Payment.created_at >= start, Payment.created_at <= end)
-            )
-        ).scalar_one()
-        or 0
-    )
+    _, payments_sum = window_totals(db, "payments", start, end)
     if payments_sum <= 0:
         return None
-    refunds_sum = (
-        db.execute(
-            select(func.coalesce(func.sum(Refund.amount_cents), 0)).where(
-                and_(Refund.created_at >= start, Refund.created_at <= end)
-            )
-        ).scalar_one()
-        or 0
-    )
+    _, refunds_sum = window_totals(db, "refunds", start, end)
     return float(refunds_sum) / float(payments_sum)
 
 
 def compute_whatsapp_delivery_rate(db: Session, start: datetime, end: datetime) -> Optional[float]:
     """
-    EMBED_SUMMARY: WhatsApp delivery rate equals distinct messages with status in (delivered, read) divided by messages sent in window; returns None if none sent.
+    EMBED_SUMMARY: WhatsApp delivery rate equals messages first delivered/read in the window divided by messages sent in window; returns None if none sent.
     EMBED_TAGS: analytics, whatsapp, delivery rate, read, delivered, ratio, window
 
     SQL sketch (windowed):
@@ -98,35 +77,69 @@ def compute_whatsapp_delivery_rate(db: Session, start: datetime, end: datetime)
       SELECT COUNT(*) AS cnt FROM whatsapp_messages m
       WHERE m.created_at BETWEEN :start AND :end
     ), delivered AS (
-      SELECT COUNT(DISTINCT e.message_id) AS cnt
-      FROM whatsapp_status_events e
-      WHERE e.status IN ('delivered','read') AND e.created_at BETWEEN :start AND :end
+      SELECT COUNT(*) AS cnt FROM (
+        SELECT e.message_id, MIN(e.created_at) AS first_at
+        FROM whatsapp_status_events e
+        WHERE e.status IN ('delivered','read')
+        GROUP BY e.message_id
+      ) f WHERE f.first_at BETWEEN :start AND :end
     )
     SELECT CASE WHEN sent.cnt <= 0 THEN NULL ELSE CAST(delivered.cnt AS FLOAT)/CAST(sent.cnt AS FLOAT) END AS delivery_rate
     FROM sent, delivered;
     """
-    sent_count = (
-        db.execute(
-            select(func.count()).select_from(WhatsAppMessage).where(
-                and_(WhatsAppMessage.created_at >= start, WhatsAppMessage.created_at <= end)
-            )
-        ).scalar_one()
-        or 0
-    )
+    sent_count, _ = window_totals(db, "whatsapp.sent", start, end)
     if sent_count <= 0:
         return None
-    delivered_distinct = (
-        db.execute(
-            select(func.count(func.distinct(WhatsAppStatusEvent.message_id))).where(
-                and_(
-                    WhatsAppStatusEvent.status.in_(["delivered", "read"]),
-                    WhatsAppStatusEvent.created_at >= start,
-                    WhatsAppStatusEvent.created_at <= end,
-                )
-            )
-        ).scalar_one()
-        or 0
-    )
-    return float(delivered_distinct) / float(sent_count)
+    delivered_count, _ = window_totals(db, "whatsapp.delivered", start, end)
+    return float(delivered_count) / float(sent_count)
+
+
+# --- period-over-period ------------------------------------------------------------------------
+
+
+Number = Union[int, float]
 
 
+def previous_window(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """The equally long window right before [start, end]: [start - (end - start), start), end exclusive."""
+    return start - (end - start), start
+
+
+def change(current: Optional[Number], previous: Optional[Number]) -> Dict[str, Any]:
+    """Current and previous value with the absolute delta and the percent change (None without a base)."""
+    delta = None if current is None or previous is None else current - previous
+    pct_change = None if delta is None or not previous else round(delta / abs(previous) * 100.0, 2)
+    return {"current": current, "previous": previous, "delta": delta, "pct_change": pct_change}
+
+
+def _ratio(numerator: int, denominator: int) -> Optional[float]:
+    return None if denominator <= 0 else float(numerator) / float(denominator)
+
+
+def window_pair(db: Session, metric: str, start: datetime, end: datetime) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """(count, sum) of `metric` for [start, end] and for the previous window, read in one statement."""
+    prev_start, prev_end = previous_window(start, end)
+    current, previous = windows_totals(db, metric, [(start, end, True), (prev_start, prev_end, False)])
+    return current, previous
+
+
+def compare_windows(db: Session, start: datetime, end: datetime) -> Dict[str, Dict[str, Any]]:
+    """
+    EMBED_SUMMARY: This window vs the previous equally long window for revenue, refund rate and WhatsApp delivery rate, with deltas and percent change.
+    EMBED_TAGS: analytics, comparison, period over period, revenue, refund rate, delivery rate, delta, window
+
+    SQL sketch (per metric, both windows in one scan of the combined range):
+    SELECT
+      SUM(CASE WHEN created_at BETWEEN :start AND :end THEN amount_cents ELSE 0 END) AS current_sum,
+      SUM(CASE WHEN created_at >= :prev_start AND created_at < :start THEN amount_cents ELSE 0 END) AS previous_sum
+    FROM payments WHERE created_at >= :prev_start AND created_at <= :end;
+    """
+    (_, payments), (_, prev_payments) = window_pair(db, "payments", start, end)
+    (_, refunds), (_, prev_refunds) = window_pair(db, "refunds", start, end)
+    (sent, _), (prev_sent, _) = window_pair(db, "whatsapp.sent", start, end)
+    (delivered, _), (prev_delivered, _) = window_pair(db, "whatsapp.delivered", start, end)
+    return {
+        "revenue_cents": change(payments - refunds, prev_payments - prev_refunds),
+        "refund_rate": change(_ratio(refunds, payments), _ratio(prev_refunds, prev_payments)),
+        "whatsapp_delivery_rate": change(_ratio(delivered, sent), _ratio(prev_delivered, prev_sent)),
+    }
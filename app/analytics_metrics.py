@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Metric registry and request-scoped evaluator that computes each analytics base aggregate once.
+EMBED_TAGS: analytics, metrics, registry, dependency graph, memoization, facts, kpis, summary
+
+Every metric declares the metrics it is derived from:
+- Base metrics (no inputs) run SQL against the request's session, e.g. "payments.scan" is one
+  conditional-aggregate SELECT over payments.
+- Derived metrics are pure functions of their inputs, e.g. "kpis" combines the payments, refunds,
+  whatsapp, bookings and visits scans with utilization.
+
+A MetricEvaluator lives for one request. evaluate(names) walks the graph for just those names,
+memoizing every node, so a base aggregate feeding the summary body, the facts and the KPIs runs once,
+and metrics nobody asked for are never touched.
+
+Base metrics are independent of each other, so prefetch(names) runs the ones behind `names` at the
+same time, each on its own session (and pooled connection), on a bounded thread pool of
+APP_ANALYTICS_PARALLEL_WORKERS threads. On SQLite they stay sequential on the request session:
+a file database serializes readers against writers anyway and in-memory databases share a single
+connection. Every base metric's wall time lands in `timings` (milliseconds) either way.
+
+With approx=True the all-time distinct counts behind "visits.scan" and "whatsapp.scan" come from
+stored HyperLogLog sketches (analytics_sketches.py) instead of COUNT(DISTINCT) over the raw tables.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from . import analytics_facts as facts
+from . import demographics
+from .analytics_sketches import ensure_total_sketches, total_sketch
+from .analytics_kpis import build_kpis
+from .analytics_math import compute_whatsapp_delivery_rate
+from .analytics_rollups import ensure_rollups, window_totals
+from .booking_counts import average_utilization, ensure_booking_counts
+from .config import get_settings
+from .database import SessionLocal
+from .models import Booking, Event
+
+
+@dataclass(frozen=True)
+class Metric:
+    name: str
+    inputs: Tuple[str, ...]
+    fn: Callable[..., Any]
+
+
+METRICS: Dict[str, Metric] = {}
+
+
+def metric(name: str, *inputs: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Register `fn` under `name`. Base metrics (no inputs) get the evaluator; derived ones get input values."""
+
+    def register(fn: Callable[..., Any]) -> Callable[..., Any]:
+        METRICS[name] = Metric(name=name, inputs=tuple(inputs), fn=fn)
+        return fn
+
+    return register
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_settings().analytics_parallel_workers, thread_name_prefix="analytics"
+            )
+        return _executor
+
+
+def parallel_enabled(db: Session) -> bool:
+    return get_settings().analytics_parallel_workers > 1 and db.get_bind().dialect.name != "sqlite"
+
+
+def base_metrics(names: Iterable[str]) -> List[str]:
+    """Base metrics `names` depend on (including themselves), in first-use order."""
+    order: List[str] = []
+    seen: set = set()
+
+    def visit(name: str) -> None:
+        if name in seen:
+            return
+        seen.add(name)
+        spec = METRICS.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown metric: {name}")
+        for dep in spec.inputs:
+            visit(dep)
+        if not spec.inputs:
+            order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+class MetricEvaluator:
+    """
+    Memoizing evaluator for one request; `evaluated` records base and derived nodes in evaluation order
+    and `timings` the milliseconds spent in each base metric.
+    """
+
+    def __init__(self, db: Session, now: Optional[datetime] = None, approx: bool = False) -> None:
+        self.db = db
+        self.now = now or datetime.utcnow()
+        self.approx = approx
+        self.evaluated: List[str] = []
+        self.timings: Dict[str, float] = {}
+        self._values: Dict[str, Any] = {}
+        self._active: set = set()
+
+    def window_start(self, days: int) -> datetime:
+        return self.now - timedelta(days=days)
+
+    def get(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+        spec = METRICS.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown metric: {name}")
+        if name in self._active:
+            raise ValueError(f"Metric dependency cycle at {name}")
+        self._active.add(name)
+        try:
+            if spec.inputs:
+                value = spec.fn(*(self.get(dep) for dep in spec.inputs))
+            else:
+                started = time.perf_counter()
+                value = spec.fn(self)
+                self.timings[name] = (time.perf_counter() - started) * 1000.0
+        finally:
+            self._active.discard(name)
+        self._set(name, value)
+        return value
+
+    def _set(self, name: str, value: Any) -> None:
+        self._values[name] = value
+        self.evaluated.append(name)
+
+    def evaluate(self, names: Iterable[str]) -> Dict[str, Any]:
+        self.prefetch(names)
+        return {name: self.get(name) for name in names}
+
+    def prefetch(self, names: Iterable[str]) -> None:
+        """Compute the pending base metrics behind `names` concurrently (no-op where parallelism is off)."""
+        pending = [name for name in base_metrics(names) if name not in self._values]
+        if len(pending) < 2 or not parallel_enabled(self.db):
+            return
+        # Windowed metrics read rollups (utilization reads booking counts); rebuild stale state once here
+        # rather than racing in every worker
+        ensure_rollups(self.db)
+        ensure_booking_counts(self.db)
+        bind = self.db.get_bind()
+
+        def run(name: str) -> Tuple[Any, float]:
+            started = time.perf_counter()
+            session = SessionLocal(bind=bind)
+            try:
+                value = METRICS[name].fn(MetricEvaluator(session, now=self.now, approx=self.approx))
+            finally:
+                session.close()
+            return value, (time.perf_counter() - started) * 1000.0
+
+        futures = [(name, _pool().submit(run, name)) for name in pending]
+        for name, future in futures:
+            value, elapsed_ms = future.result()
+            self.timings[name] = elapsed_ms
+            self._set(name, value)
+
+
+# Base metrics: each is one SQL statement
+
+
+@metric("members.by_status")
+def _members_by_status(ev: MetricEvaluator) -> Dict[str, int]:
+    return facts.members_by_status(ev.db)
+
+
+@metric("members.demographics")
+def _members_demographics(ev: MetricEvaluator) -> Dict[str, Dict[str, int]]:
+    return demographics.histograms(ev.db, ev.now.date())
+
+
+@metric("events.scan")
+def _events_scan(ev: MetricEvaluator) -> Dict[str, Any]:
+    return facts.events_scan(ev.db)
+
+
+@metric("events.utilization")
+def _events_utilization(ev: MetricEvaluator) -> Optional[float]:
+    return average_utilization(ev.db)
+
+
+@metric("bookings.by_status")
+def _bookings_by_status(ev: MetricEvaluator) -> Dict[str, int]:
+    return facts.bookings_by_status(ev.db)
+
+
+@metric("bookings.distinct")
+def _bookings_distinct(ev: MetricEvaluator) -> Dict[str, Any]:
+    return facts.bookings_distinct(ev.db)
+
+
+def _attendance_by_class_type(ev: MetricEvaluator, days: int) -> Dict[str, int]:
+    """Approved bookings per class type created in the last `days` days."""
+    rows = ev.db.execute(
+        select(Event.class_type_id, func.count())
+        .join(Booking, Booking.event_id == Event.id)
+        .where(and_(Booking.status == "approved", Booking.created_at >= ev.window_start(days)))
+        .group_by(Event.class_type_id)
+    ).all()
+    return {cls: int(cnt) for cls, cnt in rows}
+
+
+@metric("attendance.30d")
+def _attendance_30d(ev: MetricEvaluator) -> Dict[str, int]:
+    return _attendance_by_class_type(ev, 30)
+
+
+@metric("attendance.90d")
+def _attendance_90d(ev: MetricEvaluator) -> Dict[str, int]:
+    return _attendance_by_class_type(ev, 90)
+
+
+@metric("lookup.totals")
+def _lookup_totals(ev: MetricEvaluator) -> Dict[str, int]:
+    return facts.lookup_totals(ev.db)
+
+
+@metric("payments.scan")
+def _payments_scan(ev: MetricEvaluator) -> Dict[str, Any]:
+    return facts.payments_scan(ev.db)
+
+
+@metric("refunds.scan")
+def _refunds_scan(ev: MetricEvaluator) -> Dict[str, Any]:
+    return facts.refunds_scan(ev.db)
+
+
+def _amount_in_window(ev: MetricEvaluator, metric_name: str, days: int) -> int:
+    return int(window_totals(ev.db, metric_name, ev.window_start(days), ev.now)[1])
+
+
+@metric("payments.amount_30d")
+def _payments_amount_30d(ev: MetricEvaluator) -> int:
+    return _amount_in_window(ev, "payments", 30)
+
+
+@metric("refunds.amount_30d")
+def _refunds_amount_30d(ev: MetricEvaluator) -> int:
+    return _amount_in_window(ev, "refunds", 30)
+
+
+@metric("whatsapp.scan")
+def _whatsapp_scan(ev: MetricEvaluator) -> Dict[str, Any]:
+    if not ev.approx:
+        return facts.whatsapp_scan(ev.db)
+    scan = facts.whatsapp_scan(ev.db, exact_distinct=False)
+    ensure_total_sketches(ev.db, ["whatsapp.statused_messages"], ev.now)
+    scan["distinct_statused_messages"] = total_sketch(ev.db, "whatsapp.statused_messages", ev.now).count()
+    return scan
+
+
+@metric("whatsapp.delivery_rate_30d")
+def _whatsapp_delivery_rate_30d(ev: MetricEvaluator) -> Optional[float]:
+    return compute_whatsapp_delivery_rate(ev.db, ev.window_start(30), ev.now)
+
+
+@metric("visits.scan")
+def _visits_scan(ev: MetricEvaluator) -> Dict[str, Any]:
+    if not ev.approx:
+        return facts.visits_scan(ev.db)
+    scan = facts.visits_scan(ev.db, exact_distinct=False)
+    ensure_total_sketches(ev.db, ["visits.members"], ev.now)
+    scan["unique_members"] = total_sketch(ev.db, "visits.members", ev.now).count()
+    return scan
+
+
+# Derived metrics: pure functions of other metrics
+
+
+@metric("active_members", "members.by_status")
+def _active_members(by_status: Dict[str, int]) -> int:
+    return int(by_status.get("active", 0))
+
+
+@metric("demographic_age_bands", "members.demographics")
+def _demographic_age_bands(demographics: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    return demographics["age_bands"]
+
+
+@metric("gender_breakdown", "members.demographics")
+def _gender_breakdown(demographics: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    return demographics["genders"]
+
+
+@metric("revenue_cents_30d", "payments.amount_30d", "refunds.amount_30d")
+def _revenue_cents_30d(payments_sum: int, refunds_sum: int) -> int:
+    return payments_sum - refunds_sum
+
+
+@metric("refund_rate_30d", "payments.amount_30d", "refunds.amount_30d")
+def _refund_rate_30d(payments_sum: int, refunds_sum: int) -> Optional[float]:
+    if payments_sum <= 0:
+        return None
+    return float(refunds_sum) / float(payments_sum)
+
+
+@metric("totals", "payments.scan", "refunds.scan", "whatsapp.scan")
+def _totals(payments: Dict[str, Any], refunds: Dict[str, Any], whatsapp: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "payments": int(payments["count"]),
+        "refunds": int(refunds["count"]),
+        "whatsapp_delivered_or_read": int(whatsapp["delivered"]) + int(whatsapp["read"]),
+    }
+
+
+metric(
+    "facts",
+    "members.by_status",
+    "events.scan",
+    "bookings.by_status",
+    "bookings.distinct",
+    "lookup.totals",
+    "payments.scan",
+    "refunds.scan",
+    "whatsapp.scan",
+    "visits.scan",
+)(facts.build_facts)
+
+metric(
+    "kpis",
+    "payments.scan",
+    "refunds.scan",
+    "whatsapp.scan",
+    "bookings.by_status",
+    "visits.scan",
+    "events.utilization",
+)(build_kpis)
+
+
+# /api/analytics.summary response field -> metric
+SUMMARY_FIELDS: Dict[str, str] = {
+    "attendance_by_class_type_30d": "attendance.30d",
+    "attendance_by_class_type_90d": "attendance.90d",
+    "average_utilization_rate": "events.utilization",
+    "active_members": "active_members",
+    "demographic_age_bands": "demographic_age_bands",
+    "gender_breakdown": "gender_breakdown",
+    "revenue_cents_30d": "revenue_cents_30d",
+    "refund_rate_30d": "refund_rate_30d",
+    "whatsapp_delivery_rate_30d": "whatsapp.delivery_rate_30d",
+    "totals": "totals",
+    "facts": "facts",
+    "kpis": "kpis",
+}
+
+# Named groups of summary fields for /api/analytics.summary?sections=...
+SUMMARY_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "attendance": ("attendance_by_class_type_30d", "attendance_by_class_type_90d"),
+    "utilization": ("average_utilization_rate",),
+    "members": ("active_members",),
+    "demographics": ("demographic_age_bands", "gender_breakdown"),
+    "revenue": ("revenue_cents_30d", "refund_rate_30d"),
+    "whatsapp": ("whatsapp_delivery_rate_30d",),
+    "totals": ("totals",),
+    "facts": ("facts",),
+    "kpis": ("kpis",),
+}
+
+
+def select_summary_fields(sections: Optional[str], metrics: Optional[str]) -> List[str]:
+    """
+    Resolve comma-separated `sections` and `metrics` (summary field names) into the fields to compute,
+    in response order. Neither given means every field. Raises ValueError on unknown names.
+    """
+    if not sections and not metrics:
+        return list(SUMMARY_FIELDS)
+    wanted: set = set()
+    for section in _split(sections):
+        if section not in SUMMARY_SECTIONS:
+            raise ValueError(f"Unknown section: {section}")
+        wanted.update(SUMMARY_SECTIONS[section])
+    for field in _split(metrics):
+        if field not in SUMMARY_FIELDS:
+            raise ValueError(f"Unknown metric: {field}")
+        wanted.add(field)
+    return [field for field in SUMMARY_FIELDS if field in wanted]
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
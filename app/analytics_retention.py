@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Monthly cohort retention (join-month cohort x months since join) from member visits, using per-cohort bitsets.
+EMBED_TAGS: analytics, retention, cohorts, member visits, bitsets, incremental, cache
+
+A cohort is every member with a join_date in that month. Cell (cohort, k) is the share of the
+cohort with at least one visit in the k-th month after joining (k = 0 is the join month).
+
+Each member gets a bit position inside their cohort. Each cell is a Python int bitset, and the
+cell value is bitset.bit_count() / cohort size. So a visit costs one OR and no query runs per cell.
+Building the state takes two statements: members with a join_date, and distinct
+(member_id, visit month) pairs.
+
+The state is kept per process and cached by calendar month. A request first runs one cheap
+signature statement (member count, max join_date, visit count, max visit id):
+- new visits (max id moved): only visits with id > watermark are read and OR-ed in; they land in
+  the newest column of each cohort unless backdated;
+- member changes, deleted visits, or a new month: full rebuild.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .analytics_cache import table_version
+from .analytics_timeseries import bucket_expr, bucket_label
+from .models import Member, MemberVisit
+
+
+def months_between(start: date, end: date) -> int:
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+def _month(value: Any) -> date:
+    return date.fromisoformat(bucket_label(value)).replace(day=1)
+
+
+@dataclass
+class RetentionState:
+    month: date
+    signature: Tuple[Any, ...]
+    max_visit_id: int
+    cohort_sizes: Dict[date, int] = field(default_factory=dict)
+    # member_id -> (cohort month, bit position within the cohort)
+    positions: Dict[str, Tuple[date, int]] = field(default_factory=dict)
+    # (cohort month, months since join) -> bitset of members with a visit
+    cells: Dict[Tuple[date, int], int] = field(default_factory=dict)
+
+    def add_visits(self, rows: Iterable[Tuple[str, Any]]) -> None:
+        for member_id, visit_month in rows:
+            position = self.positions.get(member_id)
+            if position is None:
+                continue
+            cohort, bit = position
+            offset = months_between(cohort, _month(visit_month))
+            if offset < 0:
+                continue
+            key = (cohort, offset)
+            self.cells[key] = self.cells.get(key, 0) | (1 << bit)
+
+
+_state: Optional[RetentionState] = None
+_lock = threading.Lock()
+
+
+def _signature(db: Session) -> Tuple[Any, ...]:
+    row = db.execute(
+        select(
+            select(func.count()).select_from(Member).where(Member.join_date.is_not(None)).scalar_subquery(),
+            select(func.max(Member.join_date)).scalar_subquery(),
+            select(func.count()).select_from(MemberVisit).scalar_subquery(),
+            select(func.coalesce(func.max(MemberVisit.id), 0)).scalar_subquery(),
+        )
+    ).one()
+    members, max_join, visits, max_visit_id = row
+    # In-process member edits (e.g. a changed join_date) also move the members table version
+    return (int(members), str(max_join), int(visits), int(max_visit_id), table_version("members"))
+
+
+def _visit_months(db: Session, after_id: int = 0):
+    month = bucket_expr(db.get_bind().dialect.name, MemberVisit.ts, "month").label("month")
+    stmt = select(MemberVisit.member_id, month).group_by(MemberVisit.member_id, month)
+    if after_id:
+        stmt = stmt.where(MemberVisit.id > after_id)
+    return db.execute(stmt)
+
+
+def build_state(db: Session, today: Optional[date] = None) -> RetentionState:
+    signature = _signature(db)
+    month = (today or date.today()).replace(day=1)
+    state = RetentionState(month=month, signature=signature, max_visit_id=signature[3])
+    for member_id, join_date in db.execute(
+        select(Member.id, Member.join_date).where(Member.join_date.is_not(None)).order_by(Member.join_date, Member.id)
+    ):
+        cohort = join_date.replace(day=1)
+        bit = state.cohort_sizes.get(cohort, 0)
+        state.positions[member_id] = (cohort, bit)
+        state.cohort_sizes[cohort] = bit + 1
+    state.add_visits(_visit_months(db))
+    return state
+
+
+def refresh_state(db: Session, today: Optional[date] = None) -> RetentionState:
+    """Return the up-to-date process-wide state, extending or rebuilding it as needed."""
+    global _state
+    month = (today or date.today()).replace(day=1)
+    with _lock:
+        state = _state
+        if state is None or state.month != month:
+            _state = build_state(db, today)
+            return _state
+        signature = _signature(db)
+        if signature == state.signature:
+            return state
+        members_changed = signature[:2] != state.signature[:2] or signature[4] != state.signature[4]
+        added = signature[2] - state.signature[2]
+        # Pure appends grow the count by at most the id range; anything else means visits were deleted
+        visits_appended = 0 < added <= signature[3] - state.max_visit_id
+        if members_changed or not visits_appended:
+            _state = build_state(db, today)
+            return _state
+        state.add_visits(_visit_months(db, after_id=state.max_visit_id))
+        state.max_visit_id = signature[3]
+        state.signature = signature
+        return state
+
+
+def retention_matrix(state: RetentionState, since: Optional[date] = None) -> List[Dict[str, Any]]:
+    """One entry per cohort: size, active member counts and retention shares for months 0..now."""
+    cohorts = []
+    for cohort in sorted(state.cohort_sizes):
+        if since is not None and cohort < since:
+            continue
+        size = state.cohort_sizes[cohort]
+        months = max(months_between(cohort, state.month), 0) + 1
+        active = [state.cells.get((cohort, k), 0).bit_count() for k in range(months)]
+        cohorts.append(
+            {
+                "cohort": cohort.strftime("%Y-%m"),
+                "size": size,
+                "active": active,
+                "retention": [round(count / size, 4) for count in active],
+            }
+        )
+    return cohorts
+
+
+def compute_retention(db: Session, since: Optional[date] = None, today: Optional[date] = None) -> Dict[str, Any]:
+    state = refresh_state(db, today)
+    return {
+        "as_of_month": state.month.strftime("%Y-%m"),
+        "cohorts": retention_matrix(state, since),
+    }
+
+
+def parse_month(value: str) -> date:
+    """`YYYY-MM` -> first day of that month; raises ValueError otherwise."""
+    return datetime.strptime(value, "%Y-%m").date()
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Daily rollups (count/sum per day, metric, status, dim) maintained on write and used by windowed analytics.
+EMBED_TAGS: analytics, rollups, daily, windows, revenue, refunds, whatsapp, visits, bookings, backfill
+
+Metrics (daily_rollups.metric -> status / dim):
+- payments: status / ""; sum = amount_cents          - refunds: status / ""; sum = amount_cents
+- whatsapp.sent: messages created                    - visits: "" / source
+- bookings: status / class_type_id (day = booking created_at)
+- whatsapp.delivered: each message once, on the day of its FIRST delivered/read status event.
+  Unlike a per-window COUNT(DISTINCT message_id), a message delivered before a window and read inside
+  it no longer counts for that window; daily counts stay additive this way.
+
+Maintenance:
+- An after_flush listener on SessionLocal turns inserted/deleted rows and status/amount changes into
+  per-day deltas and applies them with an upsert-increment in the same transaction.
+- Writes the listener cannot attribute (bulk INSERT/UPDATE/DELETE through the session, status edits
+  or deletes of whatsapp status events) clear the READY_KEY marker in `config`; the next read
+  rebuilds every rollup from raw rows (database.rebuild_once: one rebuild per process, a concurrent
+  rebuild elsewhere wins), as does `python -m app.maintenance rollups-backfill`.
+- Timestamps are treated as immutable: moving a row's created_at is not reflected until a rebuild.
+
+Windows [start, end] read whole days from rollups and only the partial first/last day from raw rows,
+in a single statement per metric. windows_totals() reads several windows (e.g. this period and the
+previous one) in that same single statement with conditional aggregates over the combined range.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, delete, event, func, inspect, or_, select, true
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, increment_rows, rebuild_once
+from .models import (
+    Booking,
+    ConfigEntry,
+    DailyRollup,
+    Event,
+    MemberVisit,
+    Payment,
+    Refund,
+    WhatsAppMessage,
+    WhatsAppStatusEvent,
+)
+
+
+READY_KEY = "daily_rollups.ready"
+_READY_INFO = "daily_rollups_ready"
+DELIVERED_STATUSES = ("delivered", "read")
+
+RollupKey = Tuple[date, str, str, str]
+
+
+@dataclass(frozen=True)
+class RollupSource:
+    metric: str
+    model: type
+    ts: str
+    amount: Optional[str] = None
+    status: Optional[str] = None
+    dim: Optional[str] = None
+
+
+SOURCES: Dict[str, RollupSource] = {
+    s.metric: s
+    for s in (
+        RollupSource("payments", Payment, "created_at", amount="amount_cents", status="status"),
+        RollupSource("refunds", Refund, "created_at", amount="amount_cents", status="status"),
+        RollupSource("whatsapp.sent", WhatsAppMessage, "created_at"),
+        RollupSource("visits", MemberVisit, "ts", dim="source"),
+        RollupSource("bookings", Booking, "created_at", status="status"),
+    )
+}
+_SOURCE_BY_MODEL = {s.model: s for s in SOURCES.values()}
+TRACKED_TABLES = {s.model.__tablename__ for s in SOURCES.values()} | {WhatsAppStatusEvent.__tablename__}
+METRICS = tuple(SOURCES) + ("whatsapp.delivered",)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# --- incremental maintenance -------------------------------------------------------------
+
+
+def _old(obj, attr: str):
+    history = _history(obj, attr)
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+def _history(obj, attr: str):
+    return inspect(obj).attrs[attr].history
+
+
+def _booking_class_type(session: Session, event_id: str, cache: Dict[str, str]) -> str:
+    if event_id not in cache:
+        cache[event_id] = (
+            session.connection().execute(select(Event.class_type_id).where(Event.id == event_id)).scalar() or ""
+        )
+    return cache[event_id]
+
+
+def _key(session: Session, source: RollupSource, obj, values: dict, cache: Dict[str, str]) -> RollupKey:
+    if source.model is Booking:
+        dim = _booking_class_type(session, obj.event_id, cache)
+    else:
+        dim = str(values.get(source.dim) or "") if source.dim else ""
+    status = str(values.get(source.status) or "") if source.status else ""
+    return (_as_date(values[source.ts]), source.metric, status, dim)
+
+
+def _values(obj, source: RollupSource, old: bool) -> dict:
+    attrs = [a for a in (source.ts, source.amount, source.status, source.dim) if a]
+    return {a: (_old(obj, a) if old else getattr(obj, a)) for a in attrs}
+
+
+def _delivered_deltas(session: Session, new_events: List[WhatsAppStatusEvent], deltas: Counter) -> None:
+    by_message: Dict[str, List[WhatsAppStatusEvent]] = {}
+    for ev in new_events:
+        by_message.setdefault(ev.message_id, []).append(ev)
+    for message_id, events in by_message.items():
+        new_first = min(ev.created_at for ev in events)
+        existing_first = session.connection().execute(
+            select(func.min(WhatsAppStatusEvent.created_at)).where(
+                WhatsAppStatusEvent.message_id == message_id,
+                WhatsAppStatusEvent.status.in_(DELIVERED_STATUSES),
+                WhatsAppStatusEvent.id.not_in([ev.id for ev in events]),
+            )
+        ).scalar()
+        if existing_first is None:
+            deltas[(_as_date(new_first), "whatsapp.delivered", "", "")] += 1
+        elif new_first < existing_first:
+            deltas[(_as_date(existing_first), "whatsapp.delivered", "", "")] -= 1
+            deltas[(_as_date(new_first), "whatsapp.delivered", "", "")] += 1
+
+
+def invalidate_rollups(session: Session) -> None:
+    """Mark rollups stale in this transaction; the next read (or the backfill command) rebuilds them."""
+    session.connection().execute(delete(ConfigEntry.__table__).where(ConfigEntry.key == READY_KEY))
+    session.info.pop(_READY_INFO, None)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _apply_rollup_deltas(session: Session, flush_context) -> None:
+    counts: Counter = Counter()
+    sums: Counter = Counter()
+    cache: Dict[str, str] = {}
+    new_events: List[WhatsAppStatusEvent] = []
+    stale = False
+
+    def add(key: RollupKey, sign: int, values: dict, source: RollupSource) -> None:
+        counts[key] += sign
+        if source.amount:
+            sums[key] += sign * int(values.get(source.amount) or 0)
+
+    for obj in session.new:
+        source = _SOURCE_BY_MODEL.get(type(obj))
+        if source is not None:
+            values = _values(obj, source, old=False)
+            add(_key(session, source, obj, values, cache), 1, values, source)
+        elif isinstance(obj, WhatsAppStatusEvent) and obj.status in DELIVERED_STATUSES:
+            new_events.append(obj)
+    for obj in session.deleted:
+        source = _SOURCE_BY_MODEL.get(type(obj))
+        if source is not None:
+            values = _values(obj, source, old=True)
+            add(_key(session, source, obj, values, cache), -1, values, source)
+        elif isinstance(obj, WhatsAppStatusEvent):
+            stale = True
+    for obj in session.dirty:
+        source = _SOURCE_BY_MODEL.get(type(obj))
+        if source is not None:
+            tracked = [a for a in (source.amount, source.status, source.dim) if a]
+            if not any(_history(obj, a).has_changes() for a in tracked):
+                continue
+            old_values = _values(obj, source, old=True)
+            new_values = _values(obj, source, old=False)
+            add(_key(session, source, obj, old_values, cache), -1, old_values, source)
+            add(_key(session, source, obj, new_values, cache), 1, new_values, source)
+        elif isinstance(obj, WhatsAppStatusEvent) and _history(obj, "status").has_changes():
+            stale = True
+
+    if stale:
+        invalidate_rollups(session)
+        return
+    _delivered_deltas(session, new_events, counts)
+    rows = [
+        {"day": key[0], "metric": key[1], "status": key[2], "dim": key[3], "count": counts[key], "sum": sums[key]}
+        for key in sorted(set(counts) | set(sums))
+        if counts[key] or sums[key]
+    ]
+    increment_rows(
+        session.connection(), DailyRollup.__table__, ["day", "metric", "status", "dim"], ["count", "sum"], rows
+    )
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in TRACKED_TABLES:
+            invalidate_rollups(orm_execute_state.session)
+
+
+# --- rebuild -------------------------------------------------------------------------------
+
+
+def _grouped_rows(db: Session, source: RollupSource) -> Iterable[dict]:
+    model = source.model
+    day = func.date(getattr(model, source.ts))
+    status = getattr(model, source.status) if source.status else None
+    if model is Booking:
+        dim = Event.class_type_id
+    else:
+        dim = getattr(model, source.dim) if source.dim else None
+    amount = func.coalesce(func.sum(getattr(model, source.amount)), 0) if source.amount else None
+    columns = [day, func.count()] + [c for c in (status, dim, amount) if c is not None]
+    group_by = [day] + [c for c in (status, dim) if c is not None]
+    stmt = select(*columns).select_from(model)
+    if model is Booking:
+        stmt = stmt.join(Event, Event.id == Booking.event_id)
+    for row in db.execute(stmt.group_by(*group_by)):
+        values = list(row)
+        out = {"day": _as_date(values[0]), "metric": source.metric, "count": int(values[1]), "status": "", "dim": ""}
+        idx = 2
+        if status is not None:
+            out["status"] = str(values[idx] or "")
+            idx += 1
+        if dim is not None:
+            out["dim"] = str(values[idx] or "")
+            idx += 1
+        out["sum"] = int(values[idx] or 0) if amount is not None else 0
+        yield out
+
+
+def _first_delivered(edges: Optional[List[EdgeRange]] = None):
+    """
+    First delivered/read time per message. With `edges`, only messages that have a delivered/read
+    event inside them are grouped (a first delivery inside the edges is such an event), so the
+    aggregate reads the edge rows through the created_at index rather than the whole table.
+    """
+    delivered = WhatsAppStatusEvent.status.in_(DELIVERED_STATUSES)
+    stmt = select(
+        WhatsAppStatusEvent.message_id,
+        func.min(WhatsAppStatusEvent.created_at).label("first_at"),
+    ).where(delivered)
+    if edges is not None:
+        stmt = stmt.where(
+            WhatsAppStatusEvent.message_id.in_(
+                select(WhatsAppStatusEvent.message_id).where(delivered, in_ranges(WhatsAppStatusEvent.created_at, edges))
+            )
+        )
+    return stmt.group_by(WhatsAppStatusEvent.message_id).subquery()
+
+
+def rebuild_rollups(db: Session) -> Dict[str, int]:
+    """Recompute every rollup from raw rows with one grouped pass per metric (caller commits)."""
+    db.execute(delete(DailyRollup))
+    rows: List[dict] = []
+    for source in SOURCES.values():
+        rows.extend(_grouped_rows(db, source))
+    first = _first_delivered()
+    day = func.date(first.c.first_at)
+    for day_value, cnt in db.execute(select(day, func.count()).group_by(day)):
+        rows.append(
+            {"day": _as_date(day_value), "metric": "whatsapp.delivered", "status": "", "dim": "", "count": int(cnt), "sum": 0}
+        )
+    # Sources with NULL dims can produce duplicate keys after normalization; merge them
+    merged: Dict[RollupKey, dict] = {}
+    for row in rows:
+        key = (row["day"], row["metric"], row["status"], row["dim"])
+        if key in merged:
+            merged[key]["count"] += row["count"]
+            merged[key]["sum"] += row["sum"]
+        else:
+            merged[key] = row
+    if merged:
+        db.execute(DailyRollup.__table__.insert(), list(merged.values()))
+    db.merge(ConfigEntry(key=READY_KEY, value=datetime.utcnow().isoformat()))
+    db.flush()
+    db.info[_READY_INFO] = True
+    result: Counter = Counter()
+    for row in merged.values():
+        result[row["metric"]] += 1
+    return dict(result)
+
+
+def ensure_rollups(db: Session) -> None:
+    """Rebuild (and commit) once if rollups were never built or were invalidated by a bulk write."""
+    if db.info.get(_READY_INFO):
+        return
+    rebuild_once(db, READY_KEY, rebuild_rollups)
+    db.info[_READY_INFO] = True
+
+
+# --- windowed reads --------------------------------------------------------------------------
+
+
+EdgeRange = Tuple[datetime, datetime, bool]
+# (start, end, end_inclusive)
+Window = Tuple[datetime, datetime, bool]
+
+
+def split_window(
+    start: datetime, end: datetime, end_inclusive: bool = True
+) -> Tuple[Optional[Tuple[date, date]], List[EdgeRange]]:
+    """
+    Split [start, end] (or [start, end) when not end_inclusive) into whole days [first_day, end_day)
+    served by rollups and raw edge ranges (lo, hi, hi_inclusive). Returns (None, [(start, end, ...)])
+    when no whole day fits.
+    """
+    first_full = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    last_excl = end.date()
+    if first_full >= last_excl:
+        return None, [(start, end, end_inclusive)]
+    edges: List[EdgeRange] = []
+    head_end = datetime.combine(first_full, time.min)
+    if start < head_end:
+        edges.append((start, head_end, False))
+    edges.append((datetime.combine(last_excl, time.min), end, end_inclusive))
+    return (first_full, last_excl), edges
+
+
+def in_ranges(column, edges: List[EdgeRange]):
+    return or_(*(and_(column >= lo, column <= hi if inclusive else column < hi) for lo, hi, inclusive in edges))
+
+
+def _sum_when(condition, value):
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+def windows_totals(
+    db: Session, metric: str, windows: Sequence[Window], status: Optional[str] = None
+) -> List[Tuple[int, int]]:
+    """
+    (count, sum) of `metric` for each window in ONE statement: a single scan of the rollup rows and
+    a single scan of the raw edge rows over the combined range, with one conditional aggregate
+    (SUM(CASE WHEN <in window> ...)) per window. Used for period-over-period comparisons.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown rollup metric: {metric}")
+    ensure_rollups(db)
+    splits = [split_window(*window) for window in windows]
+    scans = []
+
+    whole = [days for days, _ in splits if days is not None]
+    if whole:
+        where = [
+            DailyRollup.metric == metric,
+            DailyRollup.day >= min(days[0] for days in whole),
+            DailyRollup.day < max(days[1] for days in whole),
+        ]
+        if status is not None:
+            where.append(DailyRollup.status == status)
+        aggregates = []
+        for i, (days, _) in enumerate(splits):
+            if days is not None:
+                in_days = and_(DailyRollup.day >= days[0], DailyRollup.day < days[1])
+                aggregates.append(_sum_when(in_days, DailyRollup.count).label(f"rollup_count_{i}"))
+                aggregates.append(_sum_when(in_days, DailyRollup.sum).label(f"rollup_sum_{i}"))
+        scans.append(select(*aggregates).where(*where).subquery())
+
+    all_edges = [edge for _, edges in splits for edge in edges]
+    if metric == "whatsapp.delivered":
+        first = _first_delivered(all_edges)
+        ts, amount, where = first.c.first_at, None, []
+    else:
+        source = SOURCES[metric]
+        model = source.model
+        ts = getattr(model, source.ts)
+        amount = getattr(model, source.amount) if source.amount else None
+        where = [getattr(model, source.status) == status] if status is not None and source.status else []
+    aggregates = []
+    for i, (_, edges) in enumerate(splits):
+        in_edges = in_ranges(ts, edges)
+        aggregates.append(_sum_when(in_edges, 1).label(f"raw_count_{i}"))
+        if amount is not None:
+            aggregates.append(_sum_when(in_edges, amount).label(f"raw_sum_{i}"))
+    scans.append(select(*aggregates).where(in_ranges(ts, all_edges), *where).subquery())
+
+    # Each scan is an aggregate without GROUP BY (exactly one row), so the cross join is one row too
+    joined = scans[0]
+    for scan in scans[1:]:
+        joined = joined.join(scan, true())
+    row = db.execute(select(*(column for scan in scans for column in scan.c)).select_from(joined)).one()._mapping
+    return [
+        (
+            int(row.get(f"rollup_count_{i}") or 0) + int(row[f"raw_count_{i}"] or 0),
+            int(row.get(f"rollup_sum_{i}") or 0) + int(row.get(f"raw_sum_{i}") or 0),
+        )
+        for i in range(len(windows))
+    ]
+
+
+def window_totals(
+    db: Session, metric: str, start: datetime, end: datetime, status: Optional[str] = None
+) -> Tuple[int, int]:
+    """(count, sum) of `metric` over [start, end]: rollups for whole days plus raw rows for the edges."""
+    return windows_totals(db, metric, [(start, end, True)], status)[0]
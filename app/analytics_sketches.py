@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Stored per-day and all-time HyperLogLog sketches answering approximate windowed distinct counts.
+EMBED_TAGS: analytics, hyperloglog, sketches, distinct counts, approximate, visits, whatsapp, windows
+
+Sketched distinct counts (SKETCHES):
+- visits.members: distinct member_id over member_visits
+- whatsapp.statused_messages: distinct message_id over whatsapp_status_events
+- whatsapp.delivered_messages: the same, restricted to delivered/read status events
+
+Storage (hll_sketches, one blob per metric and scope):
+- scope "YYYY-MM-DD": the sketch of that day. Only sealed days are stored, i.e. days that ended at
+  least SEAL_GRACE ago, so late writes for today never have to touch a stored blob.
+- scope "all": every sealed day before through_day. It is extended with the raw rows of the days
+  sealed since, never rescanned.
+
+Reads:
+- window_sketch(start, end) merges stored day sketches for the whole days in the window (building
+  and storing missing sealed days from one grouped SELECT DISTINCT day, value) and adds raw values
+  for the partial first/last day and for unsealed days.
+- total_sketch() is the "all" sketch plus the raw values of unsealed days.
+- Bounded raw reads (edges, unsealed days) are plain ts-range SELECTs without DISTINCT, so they use
+  the ts index; add_many() dedupes. Only the unbounded first build of "all" uses SELECT DISTINCT.
+The estimate's relative standard error is HyperLogLog.relative_error (~1.6% at precision 12).
+
+Reads only write the sketches they build or extend in the caller's transaction; ensure_total_sketches() brings the "all"
+sketches up to date and commits, and callers of window_sketch() commit when they are done.
+
+Freshness: an after_flush listener deletes the stored day (and the "all" sketch) touched by
+inserted, deleted or edited rows on sealed days; bulk statements on the source tables delete every
+sketch of the metrics they feed. Either way the next read rebuilds what is missing.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from .analytics_rollups import DELIVERED_STATUSES, in_ranges, split_window
+from .analytics_timeseries import bucket_expr, bucket_label
+from .database import SessionLocal
+from .hll import HyperLogLog
+from .models import HllSketch, MemberVisit, WhatsAppStatusEvent
+
+
+SEAL_GRACE = timedelta(hours=1)
+ALL_SCOPE = "all"
+
+
+@dataclass(frozen=True)
+class SketchSpec:
+    model: Any
+    ts: str
+    value: str
+    statuses: Optional[Tuple[str, ...]] = None
+
+    def where(self) -> list:
+        if self.statuses is None:
+            return []
+        return [self.model.status.in_(self.statuses)]
+
+
+SKETCHES: Dict[str, SketchSpec] = {
+    "visits.members": SketchSpec(MemberVisit, "ts", "member_id"),
+    "whatsapp.statused_messages": SketchSpec(WhatsAppStatusEvent, "created_at", "message_id"),
+    "whatsapp.delivered_messages": SketchSpec(
+        WhatsAppStatusEvent, "created_at", "message_id", statuses=DELIVERED_STATUSES
+    ),
+}
+_WATCHED = {
+    spec.model: (spec.ts, spec.value, "status" if spec.statuses else None) for spec in SKETCHES.values()
+}
+SOURCE_TABLES = {spec.model.__tablename__ for spec in SKETCHES.values()}
+
+
+def sealed_before(now: datetime) -> date:
+    """Days strictly before the returned one ended at least SEAL_GRACE before `now`."""
+    return (now - SEAL_GRACE).date()
+
+
+def _spec(metric: str) -> SketchSpec:
+    spec = SKETCHES.get(metric)
+    if spec is None:
+        raise ValueError(f"Unknown sketch metric: {metric}")
+    return spec
+
+
+def _at(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+# --- raw reads ----------------------------------------------------------------------------------
+
+
+def _values(db: Session, spec: SketchSpec, where: list, distinct: bool = False) -> Iterable[Any]:
+    """Raw values matching `where`; repeats are left to HyperLogLog.add_many unless `distinct`."""
+    stmt = select(getattr(spec.model, spec.value)).where(*where, *spec.where())
+    return db.execute(stmt.distinct() if distinct else stmt).scalars()
+
+
+def _values_by_day(db: Session, spec: SketchSpec, first: date, last_excl: date) -> Dict[date, HyperLogLog]:
+    """Sketch of every day in [first, last_excl) with rows, from one SELECT day, value ... GROUP BY day, value."""
+    ts = getattr(spec.model, spec.ts)
+    day = bucket_expr(db.get_bind().dialect.name, ts, "day").label("day")
+    value = getattr(spec.model, spec.value)
+    rows = db.execute(
+        select(day, value).where(ts >= _at(first), ts < _at(last_excl), *spec.where()).group_by(day, value)
+    )
+    values: Dict[date, List[Any]] = {}
+    for bucket, item in rows:
+        values.setdefault(date.fromisoformat(bucket_label(bucket)), []).append(item)
+    sketches = {}
+    for key, items in values.items():
+        sketches[key] = HyperLogLog()
+        sketches[key].add_many(items)
+    return sketches
+
+
+# --- stored sketches ----------------------------------------------------------------------------
+
+
+def _store(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Write freshly built sketches in the caller's transaction; rows a concurrent reader stored first win."""
+    if not rows:
+        return
+    conn = db.connection()
+    table = HllSketch.__table__
+    if conn.dialect.name in ("sqlite", "postgresql"):
+        if conn.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        conn.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+        return
+    for row in rows:
+        db.merge(HllSketch(**row))
+    db.flush()
+
+
+def _day_sketches(db: Session, metric: str, first: date, last_excl: date, now: datetime) -> HyperLogLog:
+    """Merged sketch of the whole days [first, last_excl)."""
+    spec = _spec(metric)
+    sealed = sealed_before(now)
+    merged = HyperLogLog()
+    stored: Set[date] = set()
+    for scope, blob in db.execute(
+        select(HllSketch.scope, HllSketch.registers).where(
+            HllSketch.metric == metric,
+            HllSketch.scope != ALL_SCOPE,
+            HllSketch.scope >= first.isoformat(),
+            HllSketch.scope < min(last_excl, sealed).isoformat(),
+        )
+    ):
+        stored.add(date.fromisoformat(scope))
+        merged.merge(HyperLogLog.from_bytes(blob))
+    missing = [first + timedelta(days=i) for i in range((last_excl - first).days)]
+    missing = [day for day in missing if day not in stored]
+    if not missing:
+        return merged
+    built = _values_by_day(db, spec, missing[0], missing[-1] + timedelta(days=1))
+    new_rows = []
+    for day in missing:
+        sketch = built.get(day)
+        if sketch is not None:
+            merged.merge(sketch)
+        if day < sealed:
+            # Empty days are stored too, so they are not rescanned on the next read
+            blob = (sketch or HyperLogLog()).to_bytes()
+            new_rows.append({"metric": metric, "scope": day.isoformat(), "through_day": None, "registers": blob})
+    _store(db, new_rows)
+    return merged
+
+
+def window_sketch(
+    db: Session, metric: str, start: datetime, end: datetime, now: Optional[datetime] = None
+) -> HyperLogLog:
+    """Sketch of the distinct values of `metric` with a timestamp in [start, end]."""
+    spec = _spec(metric)
+    now = now or datetime.utcnow()
+    days, edges = split_window(start, end)
+    sketch = _day_sketches(db, metric, days[0], days[1], now) if days is not None else HyperLogLog()
+    sketch.add_many(_values(db, spec, [in_ranges(getattr(spec.model, spec.ts), edges)]))
+    return sketch
+
+
+def _sealed_total(db: Session, metric: str, sealed: date) -> Tuple[HyperLogLog, bool]:
+    """The "all" sketch through `sealed`, built or extended (and flushed) when behind; (sketch, changed)."""
+    spec = _spec(metric)
+    ts = getattr(spec.model, spec.ts)
+    row = db.get(HllSketch, (metric, ALL_SCOPE))
+    if row is None:
+        sketch = HyperLogLog()
+        sketch.add_many(_values(db, spec, [ts < _at(sealed)], distinct=True))
+        _store(db, [{"metric": metric, "scope": ALL_SCOPE, "through_day": sealed, "registers": sketch.to_bytes()}])
+        return sketch, True
+    sketch = HyperLogLog.from_bytes(row.registers)
+    through = row.through_day
+    if through is not None and through >= sealed:
+        return sketch, False
+    if through is None:
+        sketch.add_many(_values(db, spec, [ts < _at(sealed)], distinct=True))
+    else:
+        sketch.add_many(_values(db, spec, [ts >= _at(through), ts < _at(sealed)]))
+    row.through_day = sealed
+    row.registers = sketch.to_bytes()
+    db.flush()
+    return sketch, True
+
+
+def ensure_total_sketches(db: Session, metrics: Iterable[str], now: Optional[datetime] = None) -> None:
+    """Build or extend the stored "all" sketches of `metrics` through the last sealed day and commit."""
+    sealed = sealed_before(now or datetime.utcnow())
+    changed = [_sealed_total(db, metric, sealed)[1] for metric in metrics]
+    if any(changed):
+        db.commit()
+
+
+def total_sketch(db: Session, metric: str, now: Optional[datetime] = None) -> HyperLogLog:
+    """Sketch of every distinct value of `metric`: the stored "all" sketch plus unsealed raw rows."""
+    spec = _spec(metric)
+    sealed = sealed_before(now or datetime.utcnow())
+    sketch, _ = _sealed_total(db, metric, sealed)
+    # A ts range: the unsealed tail is read through the ts index, not a DISTINCT over the value index
+    sketch.add_many(_values(db, spec, [getattr(spec.model, spec.ts) >= _at(sealed)]))
+    return sketch
+
+
+def unique_sketch(
+    db: Session, metric: str, start: Optional[datetime], end: datetime, now: Optional[datetime] = None
+) -> HyperLogLog:
+    """Sketch for [start, end]; no start means since the first row, and no bounds at all the "all" sketch."""
+    now = now or datetime.utcnow()
+    if start is None:
+        if end >= now:
+            return total_sketch(db, metric, now)
+        spec = _spec(metric)
+        start = db.execute(select(func.min(getattr(spec.model, spec.ts))).where(*spec.where())).scalar()
+        if start is None or start > end:
+            return HyperLogLog()
+    return window_sketch(db, metric, start, end, now)
+
+
+def exact_distinct(db: Session, metric: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """COUNT(DISTINCT ...) of `metric` over [start, end] (either bound optional)."""
+    spec = _spec(metric)
+    ts = getattr(spec.model, spec.ts)
+    where = spec.where()
+    if start is not None:
+        where.append(ts >= start)
+    if end is not None:
+        where.append(ts <= end)
+    value = getattr(spec.model, spec.value)
+    return int(db.execute(select(func.count(func.distinct(value))).where(*where)).scalar() or 0)
+
+
+def rebuild_sketches(db: Session) -> Dict[str, int]:
+    """Drop every stored sketch and rebuild the "all" sketches (caller commits); day sketches refill on demand."""
+    db.execute(delete(HllSketch))
+    return {metric: total_sketch(db, metric).count() for metric in SKETCHES}
+
+
+# --- invalidation -------------------------------------------------------------------------------
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _touched_days(session: Session) -> Dict[Any, Set[date]]:
+    """Source model -> days whose sketches a pending flush may change (old and new timestamps)."""
+    days: Dict[Any, Set[date]] = {}
+    for obj in list(session.new) + list(session.deleted):
+        watched = _WATCHED.get(type(obj))
+        if watched is not None:
+            days.setdefault(type(obj), set()).add(_as_date(getattr(obj, watched[0])))
+    for obj in session.dirty:
+        watched = _WATCHED.get(type(obj))
+        if watched is None:
+            continue
+        attrs = inspect(obj).attrs
+        if any(attr and getattr(attrs, attr).history.has_changes() for attr in watched):
+            history = getattr(attrs, watched[0]).history
+            touched = days.setdefault(type(obj), set())
+            touched.update(_as_date(v) for v in (*history.deleted, *history.unchanged, *history.added))
+    return days
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _invalidate_touched_days(session: Session, flush_context) -> None:
+    sealed = sealed_before(datetime.utcnow())
+    for model, days in _touched_days(session).items():
+        scopes = [d.isoformat() for d in days if d is not None and d < sealed]
+        if not scopes:
+            continue
+        metrics = [name for name, spec in SKETCHES.items() if spec.model is model]
+        session.connection().execute(
+            delete(HllSketch.__table__).where(
+                HllSketch.metric.in_(metrics), HllSketch.scope.in_(scopes + [ALL_SCOPE])
+            )
+        )
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in SOURCE_TABLES:
+            metrics = [name for name, spec in SKETCHES.items() if spec.model.__tablename__ == table.name]
+            orm_execute_state.session.connection().execute(
+                delete(HllSketch.__table__).where(HllSketch.metric.in_(metrics))
+            )
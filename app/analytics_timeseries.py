@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Time-bucketed analytics series (day/week/month, optional group-by) computed in one grouped SQL pass.
+EMBED_TAGS: analytics, timeseries, buckets, granularity, group by, charting, zero fill
+
+Each metric names a source table, its timestamp column and what to aggregate:
+- payments / payments_cents, refunds / refunds_cents: row count or SUM(amount_cents) by created_at
+- bookings (all statuses), attendance (approved bookings): by booking created_at
+- visits: member visits by ts; new_members: members by join_date; whatsapp_sent: messages by created_at
+
+Group-by dimensions are metric-specific (class_type_id via the booked/visited event, source and
+facebook_campaign_id via the member). One statement groups by (bucket, dim):
+
+SELECT <bucket(ts)> AS bucket, <dim> AS key, COUNT(*) | SUM(amount_cents)
+FROM <table> [JOIN events | members]
+WHERE ts >= :start AND ts <= :end   -- date-only end: ts < :end + 1 day
+GROUP BY bucket, key;
+
+`end` is inclusive. A date-only end covers that whole day, so the last bucket counts the same
+rows as any other. Buckets start on the day, the Monday of the week, or the first of the month. The bucket expression
+is dialect specific (SQLite date()/strftime, date_trunc elsewhere). Missing buckets are zero-filled
+in Python so every series has one value per bucket.
+
+With `compare`, the equally long window right before `start` is read in the same statement: the
+WHERE covers both windows and each group gets SUM(CASE WHEN ts >= :start ...) for the current
+buckets and SUM(CASE WHEN ts < :start ...) for the previous total, as analytics_campaigns does.
+Each series then carries `previous_total` and a `change` of its total.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import Date, case, cast, func, literal, select
+from sqlalchemy.orm import Session
+
+from .analytics_math import change, previous_window
+from .models import Booking, Event, Member, MemberVisit, Payment, Refund, WhatsAppMessage
+
+
+GRANULARITIES = ("day", "week", "month")
+MAX_BUCKETS = 1000
+
+
+@dataclass(frozen=True)
+class Dimension:
+    column: Any
+    # (target, onclause) pairs; joins are outer so rows without a match land in the "unknown" series
+    joins: Tuple[Tuple[Any, Any], ...] = ()
+
+
+@dataclass(frozen=True)
+class SeriesSpec:
+    model: type
+    ts: Any
+    amount: Optional[Any] = None
+    where: Tuple[Any, ...] = ()
+    dims: Dict[str, Dimension] = field(default_factory=dict)
+    # join_date is a DATE column: compare against dates, not datetimes
+    date_column: bool = False
+
+
+_BOOKING_DIMS = {
+    "class_type_id": Dimension(Event.class_type_id, ((Event, Event.id == Booking.event_id),)),
+    "source": Dimension(Member.source, ((Member, Member.id == Booking.member_id),)),
+    "facebook_campaign_id": Dimension(Member.facebook_campaign_id, ((Member, Member.id == Booking.member_id),)),
+}
+_PAYMENT_DIMS = {
+    "source": Dimension(Member.source, ((Member, Member.id == Payment.member_id),)),
+    "facebook_campaign_id": Dimension(Member.facebook_campaign_id, ((Member, Member.id == Payment.member_id),)),
+}
+
+SERIES: Dict[str, SeriesSpec] = {
+    "payments": SeriesSpec(Payment, Payment.created_at, dims=_PAYMENT_DIMS),
+    "payments_cents": SeriesSpec(Payment, Payment.created_at, amount=Payment.amount_cents, dims=_PAYMENT_DIMS),
+    "refunds": SeriesSpec(Refund, Refund.created_at),
+    "refunds_cents": SeriesSpec(Refund, Refund.created_at, amount=Refund.amount_cents),
+    "bookings": SeriesSpec(Booking, Booking.created_at, dims=_BOOKING_DIMS),
+    "attendance": SeriesSpec(Booking, Booking.created_at, where=(Booking.status == "approved",), dims=_BOOKING_DIMS),
+    "visits": SeriesSpec(
+        MemberVisit,
+        MemberVisit.ts,
+        dims={
+            "class_type_id": Dimension(Event.class_type_id, ((Event, Event.id == MemberVisit.event_id),)),
+            "source": Dimension(MemberVisit.source),
+            "facebook_campaign_id": Dimension(
+                Member.facebook_campaign_id, ((Member, Member.id == MemberVisit.member_id),)
+            ),
+        },
+    ),
+    "new_members": SeriesSpec(
+        Member,
+        Member.join_date,
+        where=(Member.join_date.is_not(None),),
+        dims={"source": Dimension(Member.source), "facebook_campaign_id": Dimension(Member.facebook_campaign_id)},
+        date_column=True,
+    ),
+    "whatsapp_sent": SeriesSpec(WhatsAppMessage, WhatsAppMessage.created_at),
+}
+
+# Tables whose writes change a metric's series (for analytics_cache)
+SERIES_TABLES: Tuple[str, ...] = (
+    "payments",
+    "refunds",
+    "bookings",
+    "events",
+    "members",
+    "member_visits",
+    "whatsapp_messages",
+)
+
+
+def bucket_start(value: date, granularity: str) -> date:
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+
+def _next_bucket(value: date, granularity: str) -> date:
+    if granularity == "week":
+        return value + timedelta(days=7)
+    if granularity == "month":
+        return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+    return value + timedelta(days=1)
+
+
+def bucket_labels(start: datetime, end: datetime, granularity: str) -> List[str]:
+    """ISO start date of every bucket touching [start, end], in order."""
+    labels: List[str] = []
+    current = bucket_start(start.date(), granularity)
+    last = end.date()
+    while current <= last:
+        labels.append(current.isoformat())
+        if len(labels) > MAX_BUCKETS:
+            raise ValueError(f"Too many buckets (max {MAX_BUCKETS}); use a coarser granularity")
+        current = _next_bucket(current, granularity)
+    return labels
+
+
+def bucket_expr(dialect: str, column, granularity: str):
+    if dialect == "sqlite":
+        if granularity == "week":
+            # Next Sunday (or today if Sunday), minus six days: the Monday starting the week
+            return func.date(column, "weekday 0", "-6 days")
+        if granularity == "month":
+            return func.strftime("%Y-%m-01", column)
+        return func.date(column)
+    # PostgreSQL (and other date_trunc dialects) truncate weeks to Monday as well
+    return cast(func.date_trunc(granularity, column), Date)
+
+
+def bucket_label(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)[:10]
+
+
+def naive_utc(value: datetime) -> datetime:
+    """`value` as the naive UTC datetime the tables store; naive values are taken as UTC already."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def end_bound(end: Union[date, datetime]) -> Tuple[datetime, bool]:
+    """(bound, inclusive) for an inclusive `end`: a datetime as is, a date as the exclusive next midnight."""
+    if isinstance(end, datetime):
+        return end, True
+    return datetime.combine(end + timedelta(days=1), time.min), False
+
+
+def compute_timeseries(
+    db: Session,
+    metric: str,
+    start: datetime,
+    end: Union[date, datetime],
+    granularity: str = "day",
+    group_by: Optional[str] = None,
+    compare: bool = False,
+) -> Dict[str, Any]:
+    """Dense series for `metric` over [start, end]; raises ValueError on unknown or unsupported arguments."""
+    spec = SERIES.get(metric)
+    if spec is None:
+        raise ValueError(f"Unknown metric: {metric}")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    start = naive_utc(start)
+    if isinstance(end, datetime):
+        end = naive_utc(end)
+    bound, inclusive = end_bound(end)
+    if not isinstance(end, datetime):
+        end = datetime.combine(end, time.min)
+    if end < start:
+        raise ValueError("end must not be before start")
+    dim: Optional[Dimension] = None
+    if group_by:
+        dim = spec.dims.get(group_by)
+        if dim is None:
+            raise ValueError(f"Metric {metric} cannot be grouped by {group_by}")
+    labels = bucket_labels(start, end, granularity)
+
+    bucket = bucket_expr(db.get_bind().dialect.name, spec.ts, granularity).label("bucket")
+    first = previous_window(start, bound)[0] if compare else start
+    if spec.date_column:
+        in_range = (spec.ts >= first.date(), spec.ts <= end.date())
+        current = spec.ts >= start.date()
+    else:
+        in_range = (spec.ts >= first, spec.ts <= bound if inclusive else spec.ts < bound)
+        current = spec.ts >= start
+    if compare:
+        amount = spec.amount if spec.amount is not None else literal(1)
+        columns = [
+            bucket,
+            func.coalesce(func.sum(case((current, amount), else_=0)), 0).label("value"),
+            func.coalesce(func.sum(case((current, 0), else_=amount)), 0).label("previous"),
+        ]
+    else:
+        value = func.coalesce(func.sum(spec.amount), 0) if spec.amount is not None else func.count()
+        columns = [bucket, value.label("value")]
+    group_columns = [bucket]
+    if dim is not None:
+        key = dim.column.label("key")
+        columns.insert(1, key)
+        group_columns.append(key)
+    stmt = select(*columns).select_from(spec.model)
+    if dim is not None:
+        for target, onclause in dim.joins:
+            stmt = stmt.outerjoin(target, onclause)
+    stmt = stmt.where(*in_range, *spec.where).group_by(*group_columns)
+
+    index = {label: i for i, label in enumerate(labels)}
+    series: Dict[Optional[str], List[int]] = {}
+    previous: Dict[Optional[str], int] = {}
+    if dim is None:
+        series[None] = [0] * len(labels)
+    for row in db.execute(stmt):
+        if dim is None:
+            key_value: Optional[str] = None
+        else:
+            key_value = str(row.key) if row.key not in (None, "") else "unknown"
+        values = series.setdefault(key_value, [0] * len(labels))
+        if compare:
+            previous[key_value] = previous.get(key_value, 0) + int(row.previous or 0)
+        position = index.get(bucket_label(row.bucket))
+        if position is not None:
+            values[position] += int(row.value or 0)
+
+    result = {
+        "metric": metric,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "group_by": group_by,
+        "buckets": labels,
+        "series": [],
+    }
+    for key_value, values in sorted(series.items(), key=lambda item: (item[0] is None, item[0] or "")):
+        entry: Dict[str, Any] = {"key": key_value, "values": values, "total": sum(values)}
+        if compare:
+            entry["previous_total"] = previous.get(key_value, 0)
+            entry["change"] = change(entry["total"], entry["previous_total"])
+        result["series"].append(entry)
+    if compare:
+        result["previous_start"], result["previous_end"] = previous_window(start, bound)
+    return result
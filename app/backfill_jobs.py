@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Resumable background backfill jobs for data and code embeddings with checkpoints, progress, and cancel.
+EMBED_TAGS: jobs, backfill, embeddings, code, checkpoint, resume, progress, eta, worker
+
+Lifecycle: queued -> running -> completed | cancelled | failed.
+- A job processes entities in batches ordered by a stable key (entity id, or relative file path as
+  a string, the same key the checkpoint is compared with). Code jobs list the tree once per run.
+  Each batch commits its embeddings together with the job's checkpoint and counters, so a crash
+  loses at most the batch in flight and re-processing it is idempotent.
+- Workers claim jobs with a conditional UPDATE (queued, or running with a stale heartbeat), so
+  several uvicorn workers never run the same job twice; a supervisor thread resumes jobs left
+  behind by a restart once their lease expires.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal
+from .embedding_tasks import ENTITY_MODELS, embed_entities_batch
+from .embeddings import get_embedding_provider
+from .models import BackfillJob
+from .vector_store import append_vectors
+
+
+ENTITY_TYPES = ["member", "event", "class_type"]
+ACTIVE_STATUSES = ("queued", "running")
+CodeListing = Tuple[Path, List[str], List[Path]]  # root, sorted relative paths, files in that order
+
+logger = logging.getLogger("backfill_jobs")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_threads: Dict[str, threading.Thread] = {}
+_threads_lock = threading.Lock()
+
+
+def create_job(db: Session, kind: str, params: dict) -> BackfillJob:
+    job = BackfillJob(id=str(uuid.uuid4()), kind=kind, status="queued", params_json=json.dumps(params))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def cancel_job(db: Session, job: BackfillJob) -> BackfillJob:
+    if job.status in ACTIVE_STATUSES:
+        job.status = "cancelled"
+        job.finished_at = datetime.utcnow()
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+    return job
+
+
+def job_progress(job: BackfillJob, now: Optional[datetime] = None) -> dict:
+    """Processed/total plus rate (items/sec over the current run) and ETA in seconds."""
+    now = now or datetime.utcnow()
+    rate: Optional[float] = None
+    eta: Optional[float] = None
+    if job.run_started_at is not None:
+        elapsed = (now - job.run_started_at).total_seconds()
+        done = job.processed - job.run_start_processed
+        if elapsed > 0 and done > 0:
+            rate = done / elapsed
+            eta = max(0, job.total - job.processed) / rate if job.status == "running" else 0.0
+    return {"rate_per_sec": round(rate, 3) if rate else rate, "eta_seconds": round(eta, 1) if eta is not None else None}
+
+
+def _claim(db: Session, job_id: str) -> bool:
+    stale_before = datetime.utcnow() - timedelta(seconds=get_settings().backfill_job_lease_seconds)
+    now = datetime.utcnow()
+    result = db.execute(
+        update(BackfillJob)
+        .where(
+            BackfillJob.id == job_id,
+            or_(
+                BackfillJob.status == "queued",
+                (BackfillJob.status == "running")
+                & or_(BackfillJob.heartbeat_at.is_(None), BackfillJob.heartbeat_at < stale_before),
+            ),
+        )
+        .values(status="running", worker_id=WORKER_ID, heartbeat_at=now, run_started_at=now,
+                run_start_processed=BackfillJob.processed)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _count_total(db: Session, job: BackfillJob, params: dict, listing: Optional[CodeListing] = None) -> int:
+    if job.kind == "code":
+        return len((listing or _code_files(params))[1])
+    return sum(
+        int(db.execute(select(func.count()).select_from(ENTITY_MODELS[et])).scalar_one())
+        for et in params.get("entity_types") or ENTITY_TYPES
+    )
+
+
+def _code_files(params: dict) -> CodeListing:
+    """Files ordered by their relative path string, the key checkpoints store and compare with."""
+    from .routers.code_index import _collect_code_files
+
+    root, files = _collect_code_files(params.get("root_dir"), params.get("exts"), params.get("ignores"))
+    ordered = sorted((str(f.relative_to(root)), f) for f in files)
+    return root, [key for key, _ in ordered], [f for _, f in ordered]
+
+
+def _embeddings_batch(db: Session, job: BackfillJob, params: dict) -> Tuple[int, int, Optional[str]]:
+    """Process the next batch after the checkpoint ('entity_type|last_id'); returns (processed, updated, checkpoint)."""
+    entity_types = params.get("entity_types") or ENTITY_TYPES
+    batch_size = int(params.get("batch_size") or 50)
+    current_type, last_id = (job.checkpoint.split("|", 1) if job.checkpoint else (entity_types[0], ""))
+    for et in entity_types[entity_types.index(current_type):]:
+        model = ENTITY_MODELS[et]
+        after = last_id if et == current_type else ""
+        objs = db.execute(select(model).where(model.id > after).order_by(model.id).limit(batch_size)).scalars().all()
+        if not objs:
+            continue
+        changed = embed_entities_batch(db, et, objs, get_embedding_provider())
+        job.processed += len(objs)
+        job.updated += len(changed)
+        job.checkpoint = f"{et}|{objs[-1].id}"
+        db.add(job)
+        db.commit()
+        append_vectors(et, changed)
+        return len(objs), len(changed), job.checkpoint
+    return 0, 0, job.checkpoint
+
+
+def _code_batch(
+    db: Session, job: BackfillJob, params: dict, listing: Optional[CodeListing] = None
+) -> Tuple[int, int, Optional[str]]:
+    from .routers.code_index import _iter_code_vectors, _persist_code_vectors
+
+    root, keys, files = listing or _code_files(params)
+    batch_size = int(params.get("batch_size") or 50)
+    start = bisect_right(keys, job.checkpoint or "")
+    batch = files[start : start + batch_size]
+    if not batch:
+        return 0, 0, job.checkpoint
+    records = list(_iter_code_vectors(get_embedding_provider(), root, batch))
+    # Persisting is idempotent per (path, chunk, text hash), so a batch replayed after a crash is harmless.
+    _persist_code_vectors(records)
+    job.processed += len(batch)
+    job.updated += len(records)
+    job.checkpoint = keys[start + len(batch) - 1]
+    db.add(job)
+    db.commit()
+    return len(batch), len(records), job.checkpoint
+
+
+def run_job(job_id: str) -> None:
+    """Claim and run a job to completion in the calling thread, committing a checkpoint after each batch."""
+    db = SessionLocal()
+    try:
+        if not _claim(db, job_id):
+            return
+        job = db.get(BackfillJob, job_id)
+        params = json.loads(job.params_json or "{}")
+        listing = _code_files(params) if job.kind == "code" else None
+        if not job.total:
+            job.total = _count_total(db, job, params, listing)
+            db.add(job)
+            db.commit()
+        while True:
+            db.refresh(job)
+            if job.status != "running" or job.worker_id != WORKER_ID:
+                return  # cancelled, or re-claimed elsewhere after our lease lapsed
+            if job.kind == "code":
+                processed, _, _ = _code_batch(db, job, params, listing)
+            else:
+                processed, _, _ = _embeddings_batch(db, job, params)
+            now = datetime.utcnow()
+            if processed == 0:
+                # Conditional, so a cancel that landed since the refresh above is not overwritten
+                db.execute(
+                    update(BackfillJob)
+                    .where(
+                        BackfillJob.id == job_id, BackfillJob.status == "running", BackfillJob.worker_id == WORKER_ID
+                    )
+                    .values(status="completed", total=max(job.total, job.processed), finished_at=now, heartbeat_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                return
+            job.heartbeat_at = now
+            db.add(job)
+            db.commit()
+    except Exception as exc:  # keep the worker thread from dying silently
+        logger.exception("backfill job %s failed", job_id)
+        db.rollback()
+        # Conditional like completion: a cancelled job, or one re-claimed elsewhere, keeps its state
+        db.execute(
+            update(BackfillJob)
+            .where(BackfillJob.id == job_id, BackfillJob.status == "running", BackfillJob.worker_id == WORKER_ID)
+            .values(status="failed", error=str(exc)[:2000], finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+        with _threads_lock:
+            _threads.pop(job_id, None)
+
+
+def start_job(job_id: str) -> None:
+    """Run the job on a daemon thread unless this process already runs it."""
+    with _threads_lock:
+        if job_id in _threads:
+            return
+        thread = threading.Thread(target=run_job, args=(job_id,), name=f"backfill-{job_id[:8]}", daemon=True)
+        _threads[job_id] = thread
+    thread.start()
+
+
+def resume_jobs() -> int:
+    """Start every queued job and every running job whose lease expired (e.g. after a restart)."""
+    stale_before = datetime.utcnow() - timedelta(seconds=get_settings().backfill_job_lease_seconds)
+    db = SessionLocal()
+    try:
+        ids = db.execute(
+            select(BackfillJob.id).where(
+                or_(
+                    BackfillJob.status == "queued",
+                    (BackfillJob.status == "running")
+                    & or_(BackfillJob.heartbeat_at.is_(None), BackfillJob.heartbeat_at < stale_before),
+                )
+            )
+        ).scalars().all()
+    finally:
+        db.close()
+    for job_id in ids:
+        start_job(job_id)
+    return len(ids)
+
+
+def start_supervisor(stop: threading.Event) -> threading.Thread:
+    """Poll for resumable jobs until `stop` is set; started from the app lifespan."""
+
+    def loop() -> None:
+        while not stop.is_set():
+            try:
+                resume_jobs()
+            except Exception:
+                logger.exception("backfill job supervisor poll failed")
+            stop.wait(get_settings().backfill_job_poll_seconds)
+
+    thread = threading.Thread(target=loop, name="backfill-supervisor", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Maintains per-event approved/pending/cancelled booking counts and derives utilization in one aggregate.
+EMBED_TAGS: bookings, events, utilization, capacity, counters, reconcile, analytics
+
+- Booking endpoints call apply_booking_transition() inside their own transaction, so the counts
+  commit (or roll back) together with the booking row.
+- Counters move with a relative UPDATE (count = count + delta), so concurrent transitions on the
+  same event do not lose increments.
+- An event without a counts row (created before this table existed) is seeded from bookings the
+  first time one of its bookings changes; reconcile_booking_counts() rebuilds every row at once.
+- Readers call ensure_booking_counts(): until READY_KEY is set in `config` (a database that predates
+  the table) or after a bulk statement on bookings cleared it, the first read rebuilds every row
+  (database.rebuild_once: one rebuild per process, a concurrent rebuild elsewhere wins).
+- The rebuild deletes the rows before it counts, so it waits for transitions holding a row and then
+  counts their bookings. A transition whose row the rebuild deleted under it updates nothing; it
+  re-seeds from the rebuilt row and applies its delta there, so no increment is lost.
+
+Utilization SQL sketch:
+SELECT AVG(CASE WHEN COALESCE(c.approved_count, 0) >= e.capacity THEN 1.0
+                ELSE CAST(COALESCE(c.approved_count, 0) AS FLOAT) / e.capacity END)
+FROM events e LEFT JOIN event_booking_counts c ON c.event_id = e.id
+WHERE e.capacity > 0;
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import Float, case, cast, delete, event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, rebuild_once
+from .models import Booking, ConfigEntry, Event, EventBookingCounts
+
+
+READY_KEY = "booking_counts.ready"
+
+
+STATUS_COLUMNS = {
+    "approved": EventBookingCounts.approved_count,
+    "pending": EventBookingCounts.pending_count,
+    "cancelled": EventBookingCounts.cancelled_count,
+}
+
+
+def _grouped_counts(event_id: Optional[str] = None):
+    stmt = select(
+        Booking.event_id,
+        func.sum(case((Booking.status == "approved", 1), else_=0)),
+        func.sum(case((Booking.status == "pending", 1), else_=0)),
+        func.sum(case((Booking.status == "cancelled", 1), else_=0)),
+    ).group_by(Booking.event_id)
+    if event_id is not None:
+        stmt = stmt.where(Booking.event_id == event_id)
+    return stmt
+
+
+def _ensure_row(db: Session, event_id: str) -> None:
+    exists = db.execute(
+        select(EventBookingCounts.event_id).where(EventBookingCounts.event_id == event_id)
+    ).first()
+    if exists:
+        return
+    # Seed from the bookings already committed for this event (pending ORM changes are not flushed yet)
+    row = db.execute(_grouped_counts(event_id)).first()
+    approved, pending, cancelled = (int(v or 0) for v in row[1:]) if row else (0, 0, 0)
+    try:
+        with db.begin_nested():
+            db.execute(
+                insert(EventBookingCounts).values(
+                    event_id=event_id, approved_count=approved, pending_count=pending, cancelled_count=cancelled
+                )
+            )
+    except IntegrityError:
+        # Another transaction seeded it first; its row already reflects the committed bookings
+        pass
+
+
+def apply_booking_transition(db: Session, event_id: str, old_status: Optional[str], new_status: Optional[str]) -> None:
+    """
+    Move one booking between status counters for its event. Call it before adding or mutating the
+    booking in the session: seeding a missing row must not see (or flush) the pending change.
+    """
+    if old_status == new_status:
+        return
+    _ensure_row(db, event_id)
+    values = {}
+    if old_status in STATUS_COLUMNS:
+        col = STATUS_COLUMNS[old_status]
+        values[col.key] = col - 1
+    if new_status in STATUS_COLUMNS:
+        col = STATUS_COLUMNS[new_status]
+        values[col.key] = col + 1
+    if values:
+        stmt = update(EventBookingCounts).where(EventBookingCounts.event_id == event_id).values(**values)
+        if db.execute(stmt).rowcount == 0:
+            # A concurrent rebuild deleted the row after _ensure_row saw it; apply onto the rebuilt one
+            _ensure_row(db, event_id)
+            db.execute(stmt)
+
+
+def reconcile_booking_counts(db: Session) -> Dict[str, int]:
+    """Rebuild every counts row from bookings with one grouped scan and mark them ready (caller commits)."""
+    # Delete first: it waits for in-flight transitions on these rows, so the scan below sees their bookings
+    db.execute(delete(EventBookingCounts))
+    rows = [
+        {
+            "event_id": event_id,
+            "approved_count": int(approved or 0),
+            "pending_count": int(pending or 0),
+            "cancelled_count": int(cancelled or 0),
+        }
+        for event_id, approved, pending, cancelled in db.execute(_grouped_counts())
+    ]
+    if rows:
+        db.execute(insert(EventBookingCounts), rows)
+    db.merge(ConfigEntry(key=READY_KEY, value=datetime.utcnow().isoformat()))
+    db.flush()
+    total = sum(r["approved_count"] + r["pending_count"] + r["cancelled_count"] for r in rows)
+    return {"events": len(rows), "bookings": total}
+
+
+def ensure_booking_counts(db: Session) -> None:
+    """Rebuild (and commit) when the counts were never built or a bulk write invalidated them."""
+    rebuild_once(db, READY_KEY, reconcile_booking_counts)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name == Booking.__tablename__:
+            orm_execute_state.session.connection().execute(
+                delete(ConfigEntry.__table__).where(ConfigEntry.key == READY_KEY)
+            )
+
+
+def average_utilization(db: Session) -> Optional[float]:
+    """Average of min(1, approved / capacity) over events with a positive capacity, in one statement."""
+    ensure_booking_counts(db)
+    approved = func.coalesce(EventBookingCounts.approved_count, 0)
+    ratio = case(
+        (approved >= Event.capacity, 1.0),
+        else_=cast(approved, Float) / Event.capacity,
+    )
+    value = db.execute(
+        select(func.avg(ratio))
+        .select_from(Event)
+        .outerjoin(EventBookingCounts, EventBookingCounts.event_id == Event.id)
+        .where(Event.capacity > 0)
+    ).scalar_one_or_none()
+    return round(float(value), 4) if value is not None else None
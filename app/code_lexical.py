@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: BM25 lexical index over workspace code files with code-aware tokenization and a compact on-disk format.
+EMBED_TAGS: code, search, lexical, bm25, tokenizer, postings, identifiers, index
+
+Identifier lookups ("where is compute_refund_rate") are served without any embedding provider:
+- Tokenizer keeps identifiers whole (lowercased) and also emits their snake_case/camelCase parts,
+  so both `compute_refund_rate` and `refund rate` match.
+- Postings lists map term -> (doc ids, term frequencies) held in memory as uint32 arrays.
+- The index is persisted as a zlib-compressed file keyed by (root, exts, ignores) and rebuilt
+  only when the file signature (relative path, size, mtime) changes.
+
+BM25: score(d, q) = sum_t idf(t) * tf(t,d) * (k1 + 1) / (tf(t,d) + k1 * (1 - b + b * |d| / avgdl))
+with idf(t) = ln(1 + (N - df + 0.5) / (df + 0.5)).
+"""
+
+import hashlib
+import json
+import math
+import re
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import get_settings
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_MAGIC = b"BM25IDX1"
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize_code(text: str) -> List[str]:
+    """Split text into lowercase terms: whole identifiers plus their snake_case/camelCase parts."""
+    tokens: List[str] = []
+    for ident in _IDENTIFIER_RE.findall(text):
+        whole = ident.lower()
+        if len(whole) < 2:
+            continue
+        tokens.append(whole)
+        parts = [p.lower() for chunk in ident.split("_") for p in _CAMEL_RE.findall(chunk)]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) >= 2 and p != whole)
+    return tokens
+
+
+@dataclass
+class LexicalIndex:
+    """In-memory BM25 index: document metadata plus term -> (doc ids, tfs) postings."""
+
+    docs: List[dict] = field(default_factory=list)
+    doc_lengths: array = field(default_factory=lambda: array("I"))
+    postings: Dict[str, Tuple[array, array]] = field(default_factory=dict)
+    signature: str = ""
+
+    @property
+    def avg_doc_length(self) -> float:
+        return (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def add_document(self, meta: dict, text: str) -> None:
+        doc_id = len(self.docs)
+        terms = Counter(tokenize_code(text))
+        self.docs.append(meta)
+        self.doc_lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            ids, tfs = self.postings.setdefault(term, (array("I"), array("I")))
+            ids.append(doc_id)
+            tfs.append(tf)
+
+    def search(self, query: str, limit: Optional[int] = 10) -> List[Tuple[float, dict]]:
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        avgdl = self.avg_doc_length or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize_code(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            ids, tfs = posting
+            df = len(ids)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in zip(ids, tfs):
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(score, self.docs[doc_id]) for doc_id, score in ranked]
+
+    def to_bytes(self) -> bytes:
+        """Serialize as magic | zlib(u32 header_len | header JSON | uint32 postings blob)."""
+        terms = sorted(self.postings)
+        blob = array("I")
+        offsets: List[int] = []
+        for term in terms:
+            ids, tfs = self.postings[term]
+            offsets.append(len(ids))
+            blob.extend(ids)
+            blob.extend(tfs)
+        header = {
+            "signature": self.signature,
+            "docs": self.docs,
+            "doc_lengths": list(self.doc_lengths),
+            "terms": terms,
+            "df": offsets,
+        }
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        if sys.byteorder == "big":
+            blob.byteswap()
+        payload = struct.pack("<I", len(header_bytes)) + header_bytes + blob.tobytes()
+        return INDEX_MAGIC + zlib.compress(payload, 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LexicalIndex":
+        if not data.startswith(INDEX_MAGIC):
+            raise ValueError("Not a lexical index file")
+        payload = zlib.decompress(data[len(INDEX_MAGIC):])
+        (header_len,) = struct.unpack_from("<I", payload, 0)
+        header = json.loads(payload[4 : 4 + header_len].decode("utf-8"))
+        blob = array("I")
+        blob.frombytes(payload[4 + header_len :])
+        if sys.byteorder == "big":
+            blob.byteswap()
+        index = cls(docs=header["docs"], doc_lengths=array("I", header["doc_lengths"]), signature=header["signature"])
+        pos = 0
+        for term, df in zip(header["terms"], header["df"]):
+            index.postings[term] = (blob[pos : pos + df], blob[pos + df : pos + 2 * df])
+            pos += 2 * df
+        return index
+
+
+def files_signature(root: Path, files: Iterable[Path]) -> str:
+    h = hashlib.sha256()
+    for f in files:
+        try:
+            st = f.stat()
+        except OSError:
+            continue
+        h.update(f"{f.relative_to(root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def build_lexical_index(
+    root: Path, files: Iterable[Path], read_text: Callable[[Path], str], signature: Optional[str] = None
+) -> LexicalIndex:
+    files = list(files)
+    index = LexicalIndex(signature=signature or files_signature(root, files))
+    for f in files:
+        content = read_text(f)
+        if not content:
+            continue
+        index.add_document({"path": str(f.relative_to(root))}, content)
+    return index
+
+
+_cache: Dict[str, LexicalIndex] = {}
+_cache_lock = threading.Lock()
+
+
+def _index_path(cache_key: str) -> Path:
+    settings = get_settings()
+    return Path(settings.code_lexical_index_dir) / f"{cache_key}.bm25"
+
+
+def get_lexical_index(
+    root: Path, files: List[Path], scope: str, read_text: Callable[[Path], str]
+) -> LexicalIndex:
+    """
+    EMBED_SUMMARY: Returns an up-to-date BM25 index for the given file set from memory, disk, or a fresh build.
+    EMBED_TAGS: code, lexical, bm25, cache, persistence
+
+    `scope` distinguishes indexes over the same root with different extension/ignore filters.
+    """
+    cache_key = hashlib.sha256(f"{root}\0{scope}".encode("utf-8")).hexdigest()[:24]
+    signature = files_signature(root, files)
+    with _cache_lock:
+        cached: Optional[LexicalIndex] = _cache.get(cache_key)
+        if cached is not None and cached.signature == signature:
+            return cached
+        path = _index_path(cache_key)
+        if path.exists():
+            try:
+                loaded = LexicalIndex.from_bytes(path.read_bytes())
+                if loaded.signature == signature:
+                    _cache[cache_key] = loaded
+                    return loaded
+            except (ValueError, zlib.error, json.JSONDecodeError, struct.error):
+                pass
+        index = build_lexical_index(root, files, read_text, signature)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(index.to_bytes())
+        tmp.replace(path)
+        _cache[cache_key] = index
+        return index
@@ -29,6 +29,59 @@ class Settings(BaseSettings):
     openai_embeddings_model: str = Field(default="text-embedding-3-small")
     embeddings_dimensions: int = Field(default=64, description="Used by fake provider")
 
+    # Shared memory-mapped vector store (disabled when unset)
+    vector_store_dir: Optional[str] = Field(default=None, description="Directory for mmap vector segments")
+
+    # Analytics
+    analytics_cache_ttl_seconds: int = Field(
+        default=10, description="Max age of cached analytics results; writes invalidate earlier (0 disables)"
+    )
+    analytics_cache_max_entries: int = Field(
+        default=1024, description="Cached analytics results kept per process; least recently used are evicted"
+    )
+    analytics_snapshot_reload_seconds: int = Field(
+        default=300, description="Full reload interval of the in-memory columnar analytics snapshot (0: only on demand)"
+    )
+    analytics_parallel_workers: int = Field(
+        default=4, description="Threads running independent analytics queries concurrently (<= 1 or SQLite: sequential)"
+    )
+
+    # Embedding metrics
+    embedding_metrics_log_seconds: int = Field(
+        default=300, description="Interval for the SystemLog metrics summary (0 disables)"
+    )
+
+    # Demographics
+    demographics_refresh_seconds: int = Field(
+        default=86400, description="Interval for refreshing stored member demographic segments (0 disables)"
+    )
+
+    # Churn risk
+    churn_refresh_seconds: int = Field(
+        default=86400, description="Interval for rescoring member churn risk (0 disables)"
+    )
+
+    # Demand forecast
+    forecast_refresh_seconds: int = Field(
+        default=86400, description="Interval for recomputing per-slot demand forecasts (0 disables)"
+    )
+    forecast_history_weeks: int = Field(default=12, description="Weeks of past sessions the demand forecast reads")
+    forecast_smoothing: float = Field(
+        default=0.5, description="Exponential smoothing factor for weekly demand (1.0: only the latest week counts)"
+    )
+    forecast_under_fill_rate: float = Field(
+        default=0.5, description="Predicted fill rate below which a session is flagged as under-subscribed"
+    )
+
+    # Backfill jobs
+    backfill_job_lease_seconds: int = Field(default=60, description="Heartbeat age after which a job is re-claimed")
+    backfill_job_poll_seconds: int = Field(default=15, description="How often the supervisor looks for resumable jobs")
+
+    # Code index
+    code_lexical_index_dir: str = Field(
+        default=str(BASE_DIR / ".code_index"), description="Directory for persisted BM25 code indexes"
+    )
+
     # Rate limiting (per token+IP per minute)
     rate_limit_enabled: bool = Field(default=False)
     rate_limit_per_minute: int = Field(default=600)
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import threading
+from typing import Any, Callable, Dict
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from .config import get_settings
 
@@ -29,3 +33,82 @@ def get_db_session():
         db.close()
 
 
+def increment_rows(conn, table, key_columns, increment_columns, rows) -> None:
+    """
+    Add each row's increment columns onto the existing row with the same key, inserting it if missing.
+    Uses INSERT .. ON CONFLICT DO UPDATE on SQLite/Postgres so concurrent writers never lose an increment.
+    """
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        for row in rows:
+            stmt = dialect_insert(table).values(**row)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c[k] for k in key_columns],
+                set_={c: table.c[c] + stmt.excluded[c] for c in increment_columns},
+            )
+            conn.execute(stmt)
+        return
+    for row in rows:
+        where = [table.c[k] == row[k] for k in key_columns]
+        result = conn.execute(
+            table.update().where(*where).values({c: table.c[c] + row[c] for c in increment_columns})
+        )
+        if result.rowcount == 0:
+            conn.execute(table.insert().values(**row))
+
+
+def insert_or_ignore(conn, table, row) -> bool:
+    """
+    Insert `row` unless a row with the same key exists; True when this call inserted it.
+    Uses INSERT .. ON CONFLICT DO NOTHING on SQLite/Postgres, which waits for a concurrent insert of the key.
+    """
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        return conn.execute(dialect_insert(table).values(**row).on_conflict_do_nothing()).rowcount == 1
+    try:
+        with conn.begin_nested():
+            conn.execute(table.insert().values(**row))
+    except IntegrityError:
+        return False
+    return True
+
+_rebuild_locks: Dict[str, threading.Lock] = {}
+_rebuild_locks_guard = threading.Lock()
+
+
+def rebuild_once(db: Session, ready_key: str, rebuild: Callable[[Session], Any]) -> bool:
+    """
+    Run `rebuild` (which sets the `config` row `ready_key`) and commit, unless that row exists.
+    Readers in this process wait for one rebuild per key instead of racing it; when another process
+    commits the same rows first (IntegrityError), this one rolls back and keeps theirs. Returns True
+    when this call rebuilt.
+    """
+    from .models import ConfigEntry
+
+    def ready() -> bool:
+        return db.execute(select(ConfigEntry.value).where(ConfigEntry.key == ready_key)).first() is not None
+
+    if ready():
+        return False
+    with _rebuild_locks_guard:
+        lock = _rebuild_locks.setdefault(ready_key, threading.Lock())
+    with lock:
+        if ready():
+            return False
+        try:
+            rebuild(db)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+    return True
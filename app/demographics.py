@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Age-band and gender histograms computed in SQL, plus the nightly refresh of Member.demographic_segment.
+EMBED_TAGS: demographics, age band, gender, histogram, sql, case, segment, refresh, nightly
+
+The SQL mirrors utils.compute_age / age_band / compute_demographic_segment:
+- age: whole years between dob and :today (SQLite: year difference minus one if the month-day of
+  :today sorts before the birthday's; PostgreSQL: EXTRACT(YEAR FROM AGE(:today, dob)))
+- band: CASE over the age (under_18, 18_24, ..., 65_plus), 'unknown' without a dob
+- gender: LOWER(TRIM(COALESCE(NULLIF(gender, ''), 'other')))
+
+histograms() groups members by (band, gender) in one statement and folds the few result rows into
+the two histograms. Stored segments go stale as members have birthdays; refresh_demographic_segments()
+rewrites only the rows whose segment changed, in one UPDATE, and runs nightly in one app worker
+(APP_DEMOGRAPHICS_REFRESH_SECONDS, see periodic.py) and as `python -m app.maintenance demographics-refresh`.
+"""
+
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy import Integer, and_, case, cast, func, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .models import Member
+from .periodic import start_periodic
+
+
+AGE_BANDS = ((18, 24), (25, 34), (35, 44), (45, 54), (55, 64))
+
+
+def age_expr(dialect: str, today: date):
+    if dialect == "postgresql":
+        return cast(func.extract("year", func.age(literal(today), Member.dob)), Integer)
+    day = literal(today.isoformat())
+    years = cast(func.strftime("%Y", day), Integer) - cast(func.strftime("%Y", Member.dob), Integer)
+    before_birthday = case((func.strftime("%m-%d", day) < func.strftime("%m-%d", Member.dob), 1), else_=0)
+    return years - before_birthday
+
+
+def age_band_expr(dialect: str, today: date):
+    age = age_expr(dialect, today)
+    whens = [(Member.dob.is_(None), "unknown"), (age < 18, "under_18")]
+    whens.extend((and_(age >= lo, age <= hi), f"{lo}_{hi}") for lo, hi in AGE_BANDS)
+    return case(*whens, else_="65_plus")
+
+
+def gender_expr():
+    return func.lower(func.trim(func.coalesce(func.nullif(Member.gender, ""), "other")))
+
+
+def segment_expr(dialect: str, today: date):
+    return case(
+        (and_(Member.dob.is_(None), or_(Member.gender.is_(None), Member.gender == "")), None),
+        else_=gender_expr() + "_" + age_band_expr(dialect, today),
+    )
+
+
+def histograms(db: Session, today: Optional[date] = None) -> Dict[str, Dict[str, int]]:
+    """{"age_bands": {...}, "genders": {...}} from one grouped SELECT over members."""
+    today = today or date.today()
+    band = age_band_expr(db.get_bind().dialect.name, today).label("band")
+    gender = gender_expr().label("gender")
+    bands: Dict[str, int] = defaultdict(int)
+    genders: Dict[str, int] = defaultdict(int)
+    for band_value, gender_value, cnt in db.execute(select(band, gender, func.count()).group_by(band, gender)):
+        bands[band_value] += int(cnt)
+        genders[gender_value] += int(cnt)
+    return {"age_bands": dict(bands), "genders": dict(genders)}
+
+
+def refresh_demographic_segments(db: Session, today: Optional[date] = None) -> Dict[str, int]:
+    """Recompute every stale Member.demographic_segment in one UPDATE (caller commits)."""
+    today = today or date.today()
+    segment = segment_expr(db.get_bind().dialect.name, today)
+    result = db.execute(
+        update(Member)
+        .where(Member.demographic_segment.is_distinct_from(segment))
+        .values(demographic_segment=segment)
+        .execution_options(synchronize_session=False)
+    )
+    return {"updated": int(result.rowcount or 0)}
+
+
+def start_demographics_refresher(stop: threading.Event) -> Optional[threading.Thread]:
+    """Refresh segments now and then every APP_DEMOGRAPHICS_REFRESH_SECONDS until `stop` is set (0 disables)."""
+    return start_periodic(
+        "demographics-refresh", get_settings().demographics_refresh_seconds, refresh_demographic_segments, stop
+    )
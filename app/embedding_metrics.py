@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: In-process metrics for the embedding subsystem: index lag, provider latency/volume/cache, search phase timings.
+EMBED_TAGS: embeddings, metrics, latency, histogram, lag, freshness, cache, search, observability
+
+- Provider calls record latency, texts, bytes and (when the provider reports them) tokens;
+  cache lookups record hits and misses.
+- Searches record embed / scan / hydrate phase latencies per source (vector_store or db).
+- Lag is computed on demand from the DB: entities whose current text hash differs from the stored
+  Embedding.text_hash (or that have no embedding yet), plus the age of the oldest pending job.
+  One narrow query per entity type reads (id, updated_at, stored hash); current hashes are cached
+  per process by (id, updated_at), so only entities edited since the last call are loaded and hashed.
+
+Counters are per process (each uvicorn worker reports its own traffic); lag is global.
+A reporter thread writes a periodic summary to SystemLog.
+"""
+
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal
+from .models import BackfillJob, Embedding, SystemLog
+
+
+# Upper bounds in milliseconds; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+SEARCH_PHASES = ("embed", "scan", "hydrate")
+
+logger = logging.getLogger("embedding_metrics")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles are estimated as the bucket upper bound."""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return float(self.buckets[idx]) if idx < len(self.buckets) else round(self.max, 3)
+        return round(self.max, 3)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 3),
+            "buckets": {
+                **{f"le_{b}": n for b, n in zip(self.buckets, self.counts)},
+                "le_inf": self.counts[-1],
+            },
+        }
+
+
+class _ProviderStats:
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.calls = 0
+        self.errors = 0
+        self.texts = 0
+        self.bytes = 0
+        self.tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "texts": self.texts,
+            "bytes": self.bytes,
+            "tokens": self.tokens,
+            "bytes_per_call": round(self.bytes / self.calls, 1) if self.calls else None,
+            "tokens_per_call": round(self.tokens / self.calls, 1) if self.calls else None,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": round(self.cache_hits / lookups, 4) if lookups else None,
+            "latency": self.latency.snapshot(),
+        }
+
+
+_lock = threading.Lock()
+_providers: Dict[str, _ProviderStats] = {}
+_search: Dict[str, Dict[str, Histogram]] = {}
+_started_at = datetime.utcnow()
+# entity_type -> {entity_id: (updated_at, current text hash)}
+_text_hashes: Dict[str, Dict[str, Tuple[datetime, str]]] = {}
+_text_hashes_lock = threading.Lock()
+HASH_LOAD_CHUNK = 500
+
+
+def reset_metrics() -> None:
+    global _started_at
+    with _lock:
+        _providers.clear()
+        _search.clear()
+        _started_at = datetime.utcnow()
+    with _text_hashes_lock:
+        _text_hashes.clear()
+
+
+def _provider(name: str) -> _ProviderStats:
+    stats = _providers.get(name)
+    if stats is None:
+        stats = _providers[name] = _ProviderStats()
+    return stats
+
+
+def record_provider_call(
+    provider: str, latency_ms: float, texts: int, nbytes: int, tokens: int = 0, error: bool = False
+) -> None:
+    with _lock:
+        stats = _provider(provider)
+        stats.latency.observe(latency_ms)
+        stats.calls += 1
+        stats.texts += texts
+        stats.bytes += nbytes
+        stats.tokens += tokens
+        if error:
+            stats.errors += 1
+
+
+def record_cache(provider: str, hits: int, misses: int) -> None:
+    with _lock:
+        stats = _provider(provider)
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def record_search_phase(source: str, phase: str, latency_ms: float) -> None:
+    with _lock:
+        phases = _search.setdefault(source, {p: Histogram() for p in SEARCH_PHASES})
+        phases[phase].observe(latency_ms)
+
+
+@contextmanager
+def timed() -> Iterator[List[float]]:
+    """Yield a one-element list that receives the elapsed milliseconds when the block exits."""
+    elapsed = [0.0]
+    start = time.perf_counter()
+    try:
+        yield elapsed
+    finally:
+        elapsed[0] = (time.perf_counter() - start) * 1000.0
+
+
+def _current_hashes(db: Session, entity_type: str, model, versions: Dict[str, datetime]) -> Dict[str, str]:
+    """Current text hash per entity id, recomputing only ids whose updated_at moved since the last call."""
+    from .embedding_tasks import text_hash_for_entity
+
+    with _text_hashes_lock:
+        known = dict(_text_hashes.get(entity_type, {}))
+    hashes = {
+        entity_id: known[entity_id][1]
+        for entity_id, updated_at in versions.items()
+        if entity_id in known and known[entity_id][0] == updated_at
+    }
+    changed = [entity_id for entity_id in versions if entity_id not in hashes]
+    for lo in range(0, len(changed), HASH_LOAD_CHUNK):
+        ids = changed[lo : lo + HASH_LOAD_CHUNK]
+        for obj in db.execute(select(model).where(model.id.in_(ids))).scalars():
+            hashes[obj.id] = text_hash_for_entity(entity_type, obj)
+    with _text_hashes_lock:
+        # Rebuilt from the ids seen, so deleted entities drop out
+        _text_hashes[entity_type] = {
+            entity_id: (versions[entity_id], text_hash) for entity_id, text_hash in hashes.items()
+        }
+    return hashes
+
+
+def embedding_lag(db: Session) -> dict:
+    """Per entity type: entities with no embedding or whose current text hash differs from the stored one."""
+    # Imported here: embedding_tasks -> embeddings -> this module
+    from .embedding_tasks import ENTITY_MODELS
+
+    lag: Dict[str, dict] = {}
+    for entity_type, model in ENTITY_MODELS.items():
+        rows = db.execute(
+            select(model.id, model.updated_at, Embedding.text_hash).outerjoin(
+                Embedding, and_(Embedding.entity_type == entity_type, Embedding.entity_id == model.id)
+            )
+        ).all()
+        stored = {entity_id: text_hash for entity_id, _, text_hash in rows if text_hash is not None}
+        versions = {entity_id: updated_at for entity_id, updated_at, _ in rows if entity_id in stored}
+        current = _current_hashes(db, entity_type, model, versions)
+        stale = sum(1 for entity_id, text_hash in stored.items() if current.get(entity_id) != text_hash)
+        lag[entity_type] = {"total": len(rows), "stale": stale, "missing": len(rows) - len(stored)}
+
+    oldest = db.execute(
+        select(func.min(BackfillJob.created_at)).where(BackfillJob.status.in_(("queued", "running")))
+    ).scalar_one_or_none()
+    return {
+        "entities": lag,
+        "stale_total": sum(v["stale"] + v["missing"] for v in lag.values()),
+        "oldest_pending_job_age_seconds": (
+            round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest is not None else None
+        ),
+    }
+
+
+def metrics_snapshot(db: Session) -> dict:
+    with _lock:
+        providers = {name: stats.snapshot() for name, stats in _providers.items()}
+        search = {
+            source: {phase: hist.snapshot() for phase, hist in phases.items()} for source, phases in _search.items()
+        }
+        since = _started_at
+    return {
+        "since": since.isoformat(),
+        "lag": embedding_lag(db),
+        "provider": providers,
+        "search": search,
+    }
+
+
+def _summary_line(snapshot: dict) -> str:
+    parts = [f"stale={snapshot['lag']['stale_total']}"]
+    age = snapshot["lag"]["oldest_pending_job_age_seconds"]
+    if age is not None:
+        parts.append(f"oldest_job_age_s={age}")
+    for name, stats in snapshot["provider"].items():
+        parts.append(
+            f"{name}: calls={stats['calls']} p95_ms={stats['latency']['p95_ms']} hit_rate={stats['cache_hit_rate']}"
+        )
+    for source, phases in snapshot["search"].items():
+        parts.append(
+            f"search[{source}]: n={phases['embed']['count']} "
+            + " ".join(f"{p}_p95_ms={phases[p]['p95_ms']}" for p in SEARCH_PHASES)
+        )
+    return "; ".join(parts)
+
+
+def write_summary(db: Session) -> SystemLog:
+    snapshot = metrics_snapshot(db)
+    for stats in snapshot["provider"].values():
+        stats["latency"].pop("buckets", None)
+    for phases in snapshot["search"].values():
+        for hist in phases.values():
+            hist.pop("buckets", None)
+    log = SystemLog(
+        actor="embeddings",
+        action="metrics.summary",
+        status="ok",
+        message=_summary_line(snapshot),
+        meta_json=json.dumps(snapshot),
+    )
+    db.add(log)
+    db.commit()
+    return log
+
+
+def start_metrics_reporter(stop: threading.Event) -> Optional[threading.Thread]:
+    """Write a summary every APP_EMBEDDING_METRICS_LOG_SECONDS until `stop` is set (0 disables)."""
+    interval = get_settings().embedding_metrics_log_seconds
+    if interval <= 0:
+        return None
+
+    def loop() -> None:
+        while not stop.wait(interval):
+            db = SessionLocal()
+            try:
+                write_summary(db)
+            except Exception:
+                logger.exception("embedding metrics summary failed")
+            finally:
+                db.close()
+
+    thread = threading.Thread(target=loop, name="embedding-metrics", daemon=True)
+    thread.start()
+    return thread
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import hashlib
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple
 
 from sqlalchemy import select
 
 from .database import SessionLocal
-from .embeddings import get_embedding_provider
+from .embeddings import EmbeddingProvider, get_embedding_provider
 from .models import Embedding, Member, Event, ClassType
+from .vector_store import append_vectors
 
 
 def _text_for_entity(entity_type: str, obj) -> str:
@@ -36,6 +37,53 @@ def _text_for_entity(entity_type: str, obj) -> str:
     raise ValueError(f"Unsupported entity_type: {entity_type}")
 
 
+def text_hash_for_entity(entity_type: str, obj) -> str:
+    return hashlib.sha256(_text_for_entity(entity_type, obj).encode("utf-8")).hexdigest()
+
+
+ENTITY_MODELS = {"member": Member, "event": Event, "class_type": ClassType}
+
+
+def embed_entities_batch(
+    db, entity_type: str, objs: Sequence, provider: EmbeddingProvider
+) -> List[Tuple[str, str, List[float]]]:
+    """
+    Upsert Embedding rows for a batch of entities without committing; returns the changed
+    (entity_id, text_hash, vector) rows. Unchanged texts are not re-embedded.
+    """
+    if not objs:
+        return []
+    texts = [_text_for_entity(entity_type, obj) for obj in objs]
+    hashes = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
+    existing = {
+        e.entity_id: e
+        for e in db.execute(
+            select(Embedding).where(
+                Embedding.entity_type == entity_type, Embedding.entity_id.in_([obj.id for obj in objs])
+            )
+        ).scalars()
+    }
+    pending = [
+        (obj, text, text_hash)
+        for obj, text, text_hash in zip(objs, texts, hashes)
+        if obj.id not in existing or existing[obj.id].text_hash != text_hash
+    ]
+    if not pending:
+        return []
+    vectors = provider.embed_texts([text for _, text, _ in pending])
+    changed: List[Tuple[str, str, List[float]]] = []
+    for (obj, text, text_hash), vector in zip(pending, vectors):
+        row = existing.get(obj.id)
+        if row is None:
+            row = Embedding(entity_type=entity_type, entity_id=obj.id)
+        row.text_hash = text_hash
+        row.vector = vector
+        row.text = text
+        db.add(row)
+        changed.append((obj.id, text_hash, vector))
+    return changed
+
+
 def _load_entity(db, entity_type: str, entity_id: str):
     if entity_type == "member":
         return db.get(Member, entity_id)
@@ -78,6 +126,7 @@ def upsert_entity_embedding(entity_type: str, entity_id: str) -> None:
                 )
             )
         db.commit()
+        append_vectors(entity_type, [(entity_id, text_hash, vector)])
     finally:
         db.close()
 
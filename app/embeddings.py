@@ -8,11 +8,13 @@ EMBED_TAGS: embeddings, vectors, cosine, openai, provider
 import hashlib
 import math
 import random
+import time
 from typing import Iterable, List, Dict
 
 import httpx
 
 from .config import get_settings
+from .embedding_metrics import record_cache, record_provider_call
 
 
 def _l2_normalize(vec: List[float]) -> List[float]:
@@ -31,13 +33,17 @@ class FakeEmbeddingProvider(EmbeddingProvider):
         self._cache: Dict[str, List[float]] = {}
 
     def embed_texts(self, texts: Iterable[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        texts = list(texts)
         vectors: List[List[float]] = []
+        hits = 0
         for text in texts:
             h_bytes = hashlib.sha256(text.encode("utf-8")).digest()
             h_key = h_bytes.hex()
             cached = self._cache.get(h_key)
             if cached is not None:
                 vectors.append(cached)
+                hits += 1
                 continue
             seed = int.from_bytes(h_bytes[:8], byteorder="big", signed=False)
             rng = random.Random(seed)
@@ -45,6 +51,10 @@ class FakeEmbeddingProvider(EmbeddingProvider):
             normed = _l2_normalize(vec)
             self._cache[h_key] = normed
             vectors.append(normed)
+        record_cache("fake", hits, len(texts) - hits)
+        record_provider_call(
+            "fake", (time.perf_counter() - start) * 1000.0, len(texts), sum(len(t.encode("utf-8")) for t in texts)
+        )
         return vectors
 
 
@@ -54,13 +64,22 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
         self.model = model
 
     def embed_texts(self, texts: Iterable[str]) -> List[List[float]]:
-        payload = {"model": self.model, "input": list(texts)}
+        texts = list(texts)
+        payload = {"model": self.model, "input": texts}
         headers = {"Authorization": f"Bearer {self.api_key}"}
-        with httpx.Client(timeout=30) as client:
-            resp = client.post("https://api.openai.com/v1/embeddings", headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            return [item["embedding"] for item in data["data"]]
+        nbytes = sum(len(t.encode("utf-8")) for t in texts)
+        start = time.perf_counter()
+        try:
+            with httpx.Client(timeout=30) as client:
+                resp = client.post("https://api.openai.com/v1/embeddings", headers=headers, json=payload)
+                resp.raise_for_status()
+                data = resp.json()
+        except Exception:
+            record_provider_call("openai", (time.perf_counter() - start) * 1000.0, len(texts), nbytes, error=True)
+            raise
+        tokens = int((data.get("usage") or {}).get("total_tokens") or 0)
+        record_provider_call("openai", (time.perf_counter() - start) * 1000.0, len(texts), nbytes, tokens)
+        return [item["embedding"] for item in data["data"]]
 
 
 def get_embedding_provider() -> EmbeddingProvider:
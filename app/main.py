@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import threading
+
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
+from .analytics_churn import start_churn_refresher
+from .analytics_forecast import start_forecast_refresher
+from .backfill_jobs import start_supervisor
 from .config import get_settings
 from .database import Base, engine
+from .demographics import start_demographics_refresher
+from .embedding_metrics import start_metrics_reporter
 from .observability import RequestTimingLoggingMiddleware, add_exception_handlers
 from .routers import health, campaigns
 from .routers import members as members_router
@@ -22,13 +29,22 @@ from .routers import payments as payments_router
 from .routers import stripe_stub as stripe_router
 from .routers import whatsapp_stub as whatsapp_router
 from .routers import qr_stub as qr_router
+from .routers import jobs as jobs_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize database schema on startup
     Base.metadata.create_all(bind=engine)
+    # Resume backfill jobs interrupted by a restart and pick up newly queued ones
+    stop_background = threading.Event()
+    start_supervisor(stop_background)
+    start_metrics_reporter(stop_background)
+    start_demographics_refresher(stop_background)
+    start_forecast_refresher(stop_background)
+    start_churn_refresher(stop_background)
     yield
+    stop_background.set()
 
 
 def create_app() -> FastAPI:
@@ -63,6 +79,7 @@ def create_app() -> FastAPI:
     application.include_router(whatsapp_router.router)
     application.include_router(qr_router.router)
     application.include_router(payments_router.router)
+    application.include_router(jobs_router.router)
 
     return application
 
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Command-line maintenance tasks for derived data (vector store, booking counts, analytics counters).
+EMBED_TAGS: maintenance, cli, rebuild, compaction, vectors, reconcile, bookings, counters
+
+Usage: python -m app.maintenance <command>
+"""
+
+import argparse
+from typing import Callable, Dict
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .analytics_campaigns import rebuild_campaign_stats
+from .analytics_churn import score_members
+from .analytics_heatmap import rebuild_heatmap
+from .analytics_leaderboards import rebuild_leaderboards
+from .analytics_sketches import rebuild_sketches
+from .analytics_counters import rebuild_counters
+from .analytics_forecast import refresh_demand_forecast
+from .analytics_rollups import rebuild_rollups
+from .booking_counts import reconcile_booking_counts
+from .database import Base, engine, SessionLocal
+from .demographics import refresh_demographic_segments
+from .models import CodeEmbedding, Embedding, Member
+from .vector_store import get_vector_collection
+
+
+VECTOR_COLLECTIONS = ["member", "event", "class_type", "code"]
+
+
+def rebuild_vector_store(db: Session) -> Dict[str, int]:
+    """Rewrite every collection from the DB (latest row per id) and swap it in atomically."""
+    counts: Dict[str, int] = {}
+    for name in VECTOR_COLLECTIONS:
+        collection = get_vector_collection(name)
+        if collection is None:
+            raise SystemExit("APP_VECTOR_STORE_DIR is not configured")
+        if name == "code":
+            latest: Dict[str, tuple] = {}
+            for path, text_hash, vector in db.execute(
+                select(CodeEmbedding.path, CodeEmbedding.text_hash, CodeEmbedding.vector).order_by(CodeEmbedding.id)
+            ):
+                if vector:
+                    latest[path] = (path, text_hash, vector)
+            rows = list(latest.values())
+        else:
+            rows = [
+                (entity_id, text_hash, vector)
+                for entity_id, text_hash, vector in db.execute(
+                    select(Embedding.entity_id, Embedding.text_hash, Embedding.vector).where(
+                        Embedding.entity_type == name
+                    )
+                )
+                if vector
+            ]
+        collection.replace_all(rows)
+        counts[name] = len(rows)
+    return counts
+
+
+def compact_vector_store(db: Session) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for name in VECTOR_COLLECTIONS:
+        collection = get_vector_collection(name)
+        if collection is None:
+            raise SystemExit("APP_VECTOR_STORE_DIR is not configured")
+        collection.compact()
+        counts[name] = collection.snapshot().live_count
+    return counts
+
+
+def refresh_demographics(db: Session) -> dict:
+    """Refresh stale demographic segments; also adds the segment index to databases created before it."""
+    for index in Member.__table__.indexes:
+        if index.name == "ix_members_demographic_segment":
+            index.create(bind=db.connection(), checkfirst=True)
+    return refresh_demographic_segments(db)
+
+
+COMMANDS: Dict[str, Callable[[Session], dict]] = {
+    "vectors-rebuild": rebuild_vector_store,
+    "vectors-compact": compact_vector_store,
+    "booking-counts-reconcile": reconcile_booking_counts,
+    "counters-rebuild": rebuild_counters,
+    "rollups-backfill": rebuild_rollups,
+    "demographics-refresh": refresh_demographics,
+    "campaign-stats-rebuild": rebuild_campaign_stats,
+    "sketches-rebuild": rebuild_sketches,
+    "leaderboards-rebuild": rebuild_leaderboards,
+    "heatmap-rebuild": rebuild_heatmap,
+    "forecast-refresh": refresh_demand_forecast,
+    "churn-score": score_members,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        result = COMMANDS[args.command](db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"{args.command}: {result}")
+
+
+if __name__ == "__main__":
+    main()
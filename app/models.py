@@ -15,8 +15,10 @@ from sqlalchemy import (
     Column,
     Date,
     DateTime,
+    Float,
     ForeignKey,
     Integer,
+    LargeBinary,
     String,
     Table,
     Text,
@@ -124,6 +126,7 @@ class Member(Base):
     __table_args__ = (
         Index("ix_members_status", "status"),
         Index("ix_members_source", "source"),
+        Index("ix_members_demographic_segment", "demographic_segment"),
     )
 
 
@@ -170,7 +173,7 @@ class Booking(Base):
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     event_id: Mapped[str] = mapped_column(String(36), ForeignKey("events.id", ondelete="CASCADE"), index=True)
     member_id: Mapped[str] = mapped_column(String(36), ForeignKey("members.id", ondelete="CASCADE"), index=True)
-    status: Mapped[str] = mapped_column(String(16), default="approved", nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="approved", nullable=False, active_history=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     approved_by: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
@@ -183,6 +186,186 @@ class Booking(Base):
     )
 
 
+class EventBookingCounts(Base):
+    __tablename__ = "event_booking_counts"
+    """
+    EMBED_SUMMARY: Per-event booking counts by status, maintained on booking transitions for O(1) utilization.
+    EMBED_TAGS: bookings, events, capacity, utilization, counters, materialized
+
+    Rebuild from bookings with: python -m app.maintenance booking-counts-reconcile
+    """
+
+    event_id: Mapped[str] = mapped_column(String(36), ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    approved_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    pending_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    cancelled_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class AnalyticsCounter(Base):
+    __tablename__ = "analytics_counters"
+    """
+    EMBED_SUMMARY: Running totals (payments, refunds, whatsapp delivered/read, visits) kept in step with writes.
+    EMBED_TAGS: analytics, counters, totals, running totals
+
+    Maintained by app/analytics_counters.py; rebuild with: python -m app.maintenance counters-rebuild
+    """
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+    """
+    EMBED_SUMMARY: Per-day pre-aggregated counts and sums per metric (payments, refunds, whatsapp, visits, bookings).
+    EMBED_TAGS: analytics, rollups, daily, aggregates, windows, revenue, bookings
+
+    Maintained on write by app/analytics_rollups.py; backfill with: python -m app.maintenance rollups-backfill
+    """
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    metric: Mapped[str] = mapped_column(String(32), primary_key=True)
+    status: Mapped[str] = mapped_column(String(32), primary_key=True, default="")
+    dim: Mapped[str] = mapped_column(String(64), primary_key=True, default="")
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    sum: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (Index("ix_daily_rollups_metric_day", "metric", "day"),)
+
+
+class HllSketch(Base):
+    __tablename__ = "hll_sketches"
+    """
+    EMBED_SUMMARY: Stored HyperLogLog sketch per distinct-count metric and day (or "all" days through through_day).
+    EMBED_TAGS: analytics, hyperloglog, sketches, distinct counts, approximate, visits, whatsapp
+
+    Built and invalidated by app/analytics_sketches.py; blobs are app.hll.HyperLogLog.to_bytes().
+    """
+
+    metric: Mapped[str] = mapped_column(String(48), primary_key=True)
+    scope: Mapped[str] = mapped_column(String(10), primary_key=True)
+    through_day: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    registers: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class CampaignDailyStats(Base):
+    __tablename__ = "campaign_daily_stats"
+    """
+    EMBED_SUMMARY: Per-campaign, per-day attribution rollup: members acquired and converted, visits, net revenue.
+    EMBED_TAGS: analytics, campaigns, facebook, attribution, rollups, daily, conversion, revenue
+
+    Rebuilt per dirty day by app/analytics_campaigns.py; full rebuild: python -m app.maintenance campaign-stats-rebuild
+    """
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    campaign_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    members_acquired: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    members_converted: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    visits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue_cents: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (Index("ix_campaign_daily_stats_campaign_day", "campaign_id", "day"),)
+
+
+class CampaignStatsDirtyDay(Base):
+    __tablename__ = "campaign_stats_dirty_days"
+    """
+    EMBED_SUMMARY: Days whose campaign_daily_stats rows are stale; marked in the writing transaction, cleared on rebuild.
+    EMBED_TAGS: analytics, campaigns, rollups, dirty, invalidation
+    """
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    marks: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class OccupancyHeatmap(Base):
+    __tablename__ = "occupancy_heatmaps"
+    """
+    EMBED_SUMMARY: Weekday x hour (7x24) counts of approved bookings or QR check-ins per class type and month.
+    EMBED_TAGS: analytics, heatmap, occupancy, scheduling, bookings, check-ins, class types
+
+    Maintained on write by app/analytics_heatmap.py; counts are zlib-compressed little-endian int32 arrays.
+    """
+
+    month: Mapped[str] = mapped_column(String(7), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    class_type_id: Mapped[str] = mapped_column(String(64), primary_key=True, default="")
+    counts: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class DemandForecast(Base):
+    __tablename__ = "demand_forecasts"
+    """
+    EMBED_SUMMARY: Expected demand per session for each class type and weekly time slot (weekday, hour).
+    EMBED_TAGS: analytics, forecast, demand, capacity, scheduling, class types, bookings
+
+    Written by app/analytics_forecast.py from recent weeks of sessions; read by GET /api/events.schedule.
+    """
+
+    class_type_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    weekday: Mapped[int] = mapped_column(Integer, primary_key=True)
+    hour: Mapped[int] = mapped_column(Integer, primary_key=True)
+    expected: Mapped[float] = mapped_column(Float, nullable=False)
+    sessions: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    weeks: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class MemberChurnScore(Base):
+    __tablename__ = "member_churn_scores"
+    """
+    EMBED_SUMMARY: Daily churn-risk score per active member with the features it was computed from.
+    EMBED_TAGS: members, churn, risk, retention, engagement, visits, bookings, payments, refunds
+
+    Rewritten by app/analytics_churn.py; the score index serves the at-risk list as an ordered LIMIT query.
+    """
+
+    member_id: Mapped[str] = mapped_column(String(36), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    days_since_visit: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    recent_visits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    prior_visits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    cancellation_ratio: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    refunds: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    payment_failures: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    scored_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_member_churn_scores_score", "score"),)
+
+
+class MemberVisitCount(Base):
+    __tablename__ = "member_visit_counts"
+    """
+    EMBED_SUMMARY: Visits per member per calendar month ("YYYY-MM") and overall ("all"), kept for leaderboards.
+    EMBED_TAGS: analytics, leaderboards, visits, members, counters, attendance
+
+    Maintained on write by app/analytics_leaderboards.py; rebuild with: python -m app.maintenance leaderboards-rebuild
+    """
+
+    period: Mapped[str] = mapped_column(String(7), primary_key=True)
+    member_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    visits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (Index("ix_member_visit_counts_period_visits", "period", "visits"),)
+
+
+class MemberVisitStreak(Base):
+    __tablename__ = "member_visit_streaks"
+    """
+    EMBED_SUMMARY: Per-member weekly visit streak state (last visited week, current and longest run of consecutive weeks).
+    EMBED_TAGS: analytics, leaderboards, streaks, visits, members, engagement
+    """
+
+    member_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    last_week: Mapped[date] = mapped_column(Date, nullable=False)
+    current_weeks: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    longest_weeks: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_member_visit_streaks_current", "current_weeks"),
+        Index("ix_member_visit_streaks_longest", "longest_weeks"),
+    )
+
+
 class SystemLog(Base):
     __tablename__ = "system_log"
     """
@@ -283,7 +466,8 @@ class WhatsAppStatusEvent(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     message_id: Mapped[str] = mapped_column(String(36), ForeignKey("whatsapp_messages.id", ondelete="CASCADE"))
-    status: Mapped[str] = mapped_column(String(32), nullable=False)
+    # active_history: status changes need the previous value to move analytics counters
+    status: Mapped[str] = mapped_column(String(32), nullable=False, active_history=True)
     error_code: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     provider_ts: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     meta_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -315,9 +499,10 @@ class Payment(Base):
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     member_id: Mapped[Optional[str]] = mapped_column(String(36), ForeignKey("members.id"), nullable=True, index=True)
-    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    # active_history on amount/status: updates need the previous values to move daily rollups
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False, active_history=True)
     currency: Mapped[str] = mapped_column(String(8), default="usd", nullable=False)
-    status: Mapped[str] = mapped_column(String(32), default="created", nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String(32), default="created", nullable=False, index=True, active_history=True)
     provider: Mapped[str] = mapped_column(String(32), default="stripe", nullable=False)
     provider_payment_intent_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, index=True)
     provider_charge_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, index=True)
@@ -340,9 +525,11 @@ class Refund(Base):
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     payment_id: Mapped[str] = mapped_column(String(36), ForeignKey("payments.id", ondelete="CASCADE"), index=True)
-    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False, active_history=True)
     reason: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
-    status: Mapped[str] = mapped_column(String(32), default="requested", nullable=False, index=True)
+    status: Mapped[str] = mapped_column(
+        String(32), default="requested", nullable=False, index=True, active_history=True
+    )
     provider_refund_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, index=True)
     meta_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
@@ -372,6 +559,46 @@ class MemberVisit(Base):
     )
 
 
+class BackfillJob(Base):
+    __tablename__ = "backfill_jobs"
+    """
+    EMBED_SUMMARY: Resumable embeddings/code backfill job with checkpoint, progress counters, and worker lease.
+    EMBED_TAGS: jobs, backfill, embeddings, progress, checkpoint, resume
+    """
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="queued", nullable=False)
+    params_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    processed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    checkpoint: Mapped[Optional[str]] = mapped_column(String(600), nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    run_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    run_start_processed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_backfill_jobs_status", "status"),
+    )
+
+
+class TaskLease(Base):
+    __tablename__ = "task_leases"
+    """
+    EMBED_SUMMARY: Lease per periodic background task so only one app worker runs it at a time.
+    EMBED_TAGS: background, periodic, lease, workers, scheduler
+    """
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    worker_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
 class CodeEmbedding(Base):
     __tablename__ = "code_embeddings"
     """
@@ -380,7 +607,7 @@ class CodeEmbedding(Base):
     """
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    path: Mapped[str] = mapped_column(String(512), index=True)
+    path: Mapped[str] = mapped_column(String(512))
     file_sha256: Mapped[str] = mapped_column(String(64), index=True)
     lang: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
     chunk_idx: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
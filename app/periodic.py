@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Runs a maintenance job periodically on a daemon thread, in one app worker at a time via a lease row.
+EMBED_TAGS: background, periodic, scheduler, lease, workers, maintenance, refresh
+
+start_periodic(name, interval, job, stop) runs `job(db)` now and then every `interval` seconds
+until `stop` is set, committing after each run. Every uvicorn worker starts the same thread, so
+each run first claims the task_leases row `name` with a conditional UPDATE, like backfill job
+claims: the worker holding an unexpired lease renews it, the others skip the run. A lease lasts two
+intervals, so when its worker dies another one takes the task over within that time.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from .backfill_jobs import WORKER_ID
+from .database import SessionLocal, insert_or_ignore
+from .models import TaskLease
+
+
+logger = logging.getLogger(__name__)
+
+_leases = TaskLease.__table__
+
+
+def claim_lease(db: Session, name: str, seconds: float, worker_id: str = WORKER_ID) -> bool:
+    """Take or renew the lease `name` for `seconds` unless another worker holds it; commits."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=seconds)
+    conn = db.connection()
+    claimed = insert_or_ignore(conn, _leases, {"name": name, "worker_id": worker_id, "expires_at": expires_at})
+    if not claimed:
+        result = conn.execute(
+            update(_leases)
+            .where(_leases.c.name == name, or_(_leases.c.worker_id == worker_id, _leases.c.expires_at < now))
+            .values(worker_id=worker_id, expires_at=expires_at)
+        )
+        claimed = result.rowcount == 1
+    db.commit()
+    return claimed
+
+
+def start_periodic(
+    name: str, interval: float, job: Callable[[Session], Any], stop: threading.Event
+) -> Optional[threading.Thread]:
+    """Run `job` (which leaves committing to us) under the lease `name` every `interval` seconds (0 disables)."""
+    if interval <= 0:
+        return None
+
+    def loop() -> None:
+        while True:
+            db = SessionLocal()
+            try:
+                if claim_lease(db, name, 2 * interval):
+                    result = job(db)
+                    db.commit()
+                    logger.info("%s done: %s", name, result)
+            except Exception:
+                db.rollback()
+                logger.exception("%s failed", name)
+            finally:
+                db.close()
+            if stop.wait(interval):
+                return
+
+    thread = threading.Thread(target=loop, name=name, daemon=True)
+    thread.start()
+    return thread
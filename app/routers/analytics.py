@@ -1,147 +1,381 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Union
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import and_, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
+from ..analytics_cache import cached
+from ..analytics_campaigns import campaign_report
+from ..analytics_columnar import AGGREGATES, SPECS as SNAPSHOT_TABLES, get_snapshot, parse_where
+from ..analytics_counters import read_counters
+from ..analytics_heatmap import heatmap
+from ..analytics_leaderboards import ALL_PERIOD, STREAK_KINDS, top_streaks, top_visitors
+from ..analytics_math import compare_windows, previous_window
+from ..analytics_metrics import SUMMARY_FIELDS, SUMMARY_SECTIONS, MetricEvaluator, select_summary_fields
+from ..analytics_retention import compute_retention, parse_month
+from ..analytics_sketches import SKETCHES, exact_distinct, unique_sketch
+from ..analytics_timeseries import GRANULARITIES, SERIES, SERIES_TABLES, compute_timeseries, naive_utc
 from ..deps import get_db, require_token
-from ..models import Booking, Event, Member, Payment, Refund, WhatsAppStatusEvent, MemberVisit
-from ..schemas import AnalyticsSummary
-from ..utils import compute_age, age_band
-from ..analytics_math import compute_revenue_cents, compute_refund_rate, compute_whatsapp_delivery_rate
-from ..analytics_facts import compute_facts
-from ..analytics_kpis import compute_kpis
+from ..schemas import AnalyticsSummary, AnalyticsTimeseries
 
 
 router = APIRouter(prefix="/api", tags=["analytics"], dependencies=[Depends(require_token)])
 
+# Tables whose writes invalidate cached results (see analytics_cache.py)
+SUMMARY_TABLES = (
+    "members",
+    "events",
+    "bookings",
+    "event_booking_counts",
+    "class_types",
+    "groups",
+    "facebook_campaigns",
+    "payments",
+    "refunds",
+    "whatsapp_messages",
+    "whatsapp_status_events",
+    "member_visits",
+)
+TOTALS_TABLES = ("payments", "refunds", "whatsapp_status_events", "member_visits")
 
-@router.get("/analytics.summary", response_model=AnalyticsSummary)
-def analytics_summary(db: Session = Depends(get_db)):
+
+@router.get("/analytics.summary", response_model=AnalyticsSummary, response_model_exclude_unset=True)
+def analytics_summary(
+    response: Response,
+    db: Session = Depends(get_db),
+    sections: Optional[str] = Query(
+        default=None, description="Comma-separated: " + ",".join(SUMMARY_SECTIONS)
+    ),
+    metrics: Optional[str] = Query(default=None, description="Comma-separated summary field names"),
+    approx: bool = Query(default=False, description="Distinct visit/message counts from HyperLogLog sketches"),
+):
+    """
+    EMBED_SUMMARY: Dashboard summary (attendance, utilization, members, revenue, totals, facts, KPIs) from one memoized metric graph.
+    EMBED_TAGS: analytics, summary, kpis, facts, metrics, memoization, sections
+
+    Each base aggregate (e.g. the payments scan feeding totals, facts and KPIs) runs once per request;
+    see analytics_metrics.py for the registry. With `sections` and/or `metrics` only the requested
+    fields (and the aggregates behind them) are evaluated and returned; without them, everything is.
+    Independent base aggregates run concurrently outside SQLite; a freshly computed response carries
+    their wall times in a Server-Timing header. With `approx=true` the all-time unique visitors and
+    statused messages are HyperLogLog estimates (see analytics_sketches.py).
+    """
+    try:
+        fields = select_summary_fields(sections, metrics)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    def compute() -> AnalyticsSummary:
+        evaluator = MetricEvaluator(db, approx=approx)
+        values = evaluator.evaluate([SUMMARY_FIELDS[field] for field in fields])
+        response.headers["Server-Timing"] = server_timing(evaluator.timings)
+        return AnalyticsSummary(**{field: values[SUMMARY_FIELDS[field]] for field in fields})
+
+    return cached(("analytics.summary", tuple(fields), approx), SUMMARY_TABLES, compute)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value with one entry per base metric, e.g. `payments.scan;dur=1.8`."""
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+
+@router.get("/analytics.timeseries", response_model=AnalyticsTimeseries, response_model_exclude_unset=True)
+def analytics_timeseries(
+    metric: str = Query(description="One of: " + ",".join(SERIES)),
+    start: Optional[datetime] = Query(default=None, description="Window start (default: end - 30 days)"),
+    end: Optional[Union[date, datetime]] = Query(
+        default=None, description="Window end, inclusive; a date covers that whole day (default: now)"
+    ),
+    granularity: str = Query(default="day", description="One of: " + ",".join(GRANULARITIES)),
+    group_by: Optional[str] = Query(default=None, description="class_type_id, source or facebook_campaign_id"),
+    compare: bool = Query(default=False, description="Add each series' total over the previous period of equal length"),
+    db: Session = Depends(get_db),
+):
+    """
+    EMBED_SUMMARY: Dense day/week/month series for one metric over any range, optionally split by class type, source or campaign.
+    EMBED_TAGS: analytics, timeseries, buckets, granularity, group by, charting
+
+    All buckets come from one grouped SELECT (see analytics_timeseries.py); empty buckets are
+    zero-filled so every series has exactly one value per entry in `buckets`. With `compare=true`
+    the previous period is read in the same statement and each series gets `previous_total` and `change`.
+    """
+    open_ended = end is None
+    end = end or datetime.utcnow()
+    if start is None:
+        last = end if isinstance(end, datetime) else datetime.combine(end, datetime.min.time())
+        start = last - timedelta(days=30)
+
+    def compute() -> dict:
+        return compute_timeseries(db, metric, start, end, granularity, group_by, compare)
+
+    try:
+        if open_ended:
+            # "Up to now" windows never repeat a key; caching them would only grow the cache
+            return compute()
+        return cached(
+            ("analytics.timeseries", metric, start, end, granularity, group_by, compare), SERIES_TABLES, compute
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/analytics.query")
+def analytics_query(
+    table: str = Query(description="One of: " + ",".join(SNAPSHOT_TABLES)),
+    where: Optional[str] = Query(
+        default=None, description="Filters, e.g. class_type_id=ct_sparring,status=approved|pending"
+    ),
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    group_by: Optional[str] = Query(
+        default=None, description="Comma-separated columns or hour,weekday,hour_of_week,day"
+    ),
+    agg: str = Query(default="count", description="One of: " + ",".join(AGGREGATES)),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Ad hoc filter/group-by/aggregate over the in-memory columnar snapshot of bookings, visits, payments and refunds.
+    EMBED_TAGS: analytics, ad hoc, query, columnar, snapshot, group by, hour of week
+
+    Example: sparring bookings by hour of week last quarter
+    ?table=bookings&where=class_type_id=ct_sparring&start=...&group_by=hour_of_week
+    Bookings are timed by their event's start, the other tables by when the row was created.
+    Answers come from NumPy arrays (see analytics_columnar.py); the database is only read when
+    writes are pending or the periodic full reload is due.
+    """
+    try:
+        snapshot = get_snapshot(db)
+        result = snapshot.query(
+            table,
+            where=parse_where(where),
+            start=start,
+            end=end,
+            group_by=[c.strip() for c in (group_by or "").split(",") if c.strip()],
+            agg=agg,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {
+        "table": table,
+        "agg": agg,
+        "groups": result.groups,
+        "matched": result.matched,
+        "elapsed_ms": round(result.elapsed_ms, 3),
+        "snapshot": snapshot.stats(),
+    }
+
+
+@router.get("/analytics.retention")
+def analytics_retention(
+    since: Optional[str] = Query(default=None, description="First cohort to return, YYYY-MM"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Monthly cohort retention: share of each join-month cohort with a visit in each month since joining.
+    EMBED_TAGS: analytics, retention, cohorts, member visits, join date
+
+    Served from per-cohort bitsets kept in memory for the current month; new visits are OR-ed in
+    incrementally (see analytics_retention.py).
+    """
+    try:
+        since_month = parse_month(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be YYYY-MM")
+    return compute_retention(db, since_month)
+
+
+@router.get("/analytics.campaigns")
+def analytics_campaigns(
+    start: Optional[date] = Query(default=None, description="First day (default: 30 days before end)"),
+    end: Optional[date] = Query(default=None, description="Last day, inclusive (default: today)"),
+    campaign_id: Optional[str] = Query(default=None),
+    daily: bool = Query(default=False, description="Include the per-day breakdown"),
+    compare: bool = Query(default=False, description="Add the previous period of equal length and the changes"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Per-campaign members acquired, first-booking conversion, visits and net revenue over a day range.
+    EMBED_TAGS: analytics, campaigns, facebook, attribution, conversion, revenue, marketing
+
+    Reads campaign_daily_stats (see analytics_campaigns.py); only days dirtied since the last read
+    are recomputed, so reports never join members, payments and refunds across all history.
+    With `compare=true` the previous period is aggregated in the same scan.
+    """
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=30)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    body = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "campaigns": campaign_report(db, start, end, campaign_id, daily, compare),
+    }
+    if compare:
+        span = end - start + timedelta(days=1)
+        body["previous_start"] = (start - span).isoformat()
+        body["previous_end"] = (start - timedelta(days=1)).isoformat()
+    return body
+
+
+@router.get("/analytics.compare")
+def analytics_compare(
+    start: Optional[datetime] = Query(default=None, description="Window start (default: end - 30 days)"),
+    end: Optional[datetime] = Query(default=None, description="Window end, inclusive (default: now)"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Period-over-period KPIs: revenue, refund rate and WhatsApp delivery rate for a window vs the previous one.
+    EMBED_TAGS: analytics, comparison, period over period, revenue, refund rate, delivery rate, dashboard
+
+    The previous window has the same length and ends where the current one starts. Both windows are
+    read in one statement per metric (see analytics_math.compare_windows), so dashboard tiles need
+    a single call instead of one per window.
+    """
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - timedelta(days=30)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    prev_start, prev_end = previous_window(start, end)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "previous_start": prev_start.isoformat(),
+        "previous_end": prev_end.isoformat(),
+        "metrics": compare_windows(db, start, end),
+    }
+
+
+@router.get("/analytics.uniques")
+def analytics_uniques(
+    metric: str = Query(description="One of: " + ",".join(SKETCHES)),
+    start: Optional[datetime] = Query(default=None, description="Window start (default: all time)"),
+    end: Optional[datetime] = Query(default=None, description="Window end, inclusive (default: now)"),
+    approx: bool = Query(default=True, description="Estimate from HyperLogLog sketches; false runs COUNT(DISTINCT)"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Distinct visiting members or WhatsApp messages in a window, estimated from merged HyperLogLog sketches.
+    EMBED_TAGS: analytics, distinct counts, unique visitors, hyperloglog, approximate, whatsapp, visits
+
+    Whole days come from stored per-day sketches and partial days from raw rows (see
+    analytics_sketches.py). The response carries the relative standard error and a ~95% interval;
+    with approx=false the count is exact and both collapse to the value.
+    """
+    if metric not in SKETCHES:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
     now = datetime.utcnow()
-    d30 = now - timedelta(days=30)
-    d90 = now - timedelta(days=90)
-
-    # Attendance per class type over 30/90 days (approved bookings only)
-    q = (
-        select(Event.class_type_id, func.count())
-        .join(Booking, Booking.event_id == Event.id)
-        .where(and_(Booking.status == "approved", Booking.created_at >= d30))
-        .group_by(Event.class_type_id)
-    )
-    rows30 = db.execute(q).all()
-    attendance_30 = {cls: int(cnt) for cls, cnt in rows30}
-
-    q90 = (
-        select(Event.class_type_id, func.count())
-        .join(Booking, Booking.event_id == Event.id)
-        .where(and_(Booking.status == "approved", Booking.created_at >= d90))
-        .group_by(Event.class_type_id)
-    )
-    rows90 = db.execute(q90).all()
-    attendance_90 = {cls: int(cnt) for cls, cnt in rows90}
-
-    # Utilization rate: approved_bookings / capacity, averaged across events with capacity
-    events_with_capacity = db.execute(
-        select(Event.id, Event.capacity).where(Event.capacity.is_not(None))
-    ).all()
-    utilization_values: list[float] = []
-    for event_id, capacity in events_with_capacity:
-        if not capacity or capacity <= 0:
-            continue
-        approved_count = db.execute(
-            select(func.count()).select_from(Booking).where(
-                and_(Booking.event_id == event_id, Booking.status == "approved")
-            )
-        ).scalar_one()
-        utilization_values.append(min(1.0, float(approved_count) / float(capacity)))
-    avg_util = round(sum(utilization_values) / len(utilization_values), 4) if utilization_values else None
-
-    # Active members
-    active_members = db.execute(select(func.count()).select_from(Member).where(Member.status == "active")).scalar_one()
-
-    # Demographics
-    members = db.execute(select(Member.dob, Member.gender)).all()
-    bands: dict[str, int] = defaultdict(int)
-    genders: dict[str, int] = defaultdict(int)
-    for dob, gender in members:
-        a = compute_age(dob)
-        b = age_band(a) or "unknown"
-        bands[b] += 1
-        g = (gender or "other").strip().lower()
-        genders[g] += 1
-
-    # Extended KPIs
-    revenue_30d = compute_revenue_cents(db, d30, now)
-    refund_rate_30d = compute_refund_rate(db, d30, now)
-    whatsapp_delivery_30d = compute_whatsapp_delivery_rate(db, d30, now)
-
-    result = AnalyticsSummary(
-        attendance_by_class_type_30d=attendance_30,
-        attendance_by_class_type_90d=attendance_90,
-        average_utilization_rate=avg_util,
-        active_members=int(active_members),
-        demographic_age_bands=dict(bands),
-        gender_breakdown=dict(genders),
-    )
-
-    # Attach extended metrics as optional fields in response (non-breaking: extra keys allowed)
+    end = naive_utc(end) if end else now
+    start = naive_utc(start) if start else None
+    if start is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if not approx:
+        value = exact_distinct(db, metric, start, end)
+        return {"metric": metric, "approx": False, "value": value, "relative_error": 0.0, "low": value, "high": value}
+    sketch = unique_sketch(db, metric, start, end, now)
+    # Keep the day / "all" sketches built for this read
+    db.commit()
+    value = sketch.count()
+    margin = 2 * sketch.relative_error * value
+    return {
+        "metric": metric,
+        "approx": True,
+        "value": value,
+        "relative_error": round(sketch.relative_error, 4),
+        "low": max(int(value - margin), 0),
+        "high": int(round(value + margin)),
+    }
+
+
+@router.get("/analytics.heatmap")
+def analytics_heatmap(
+    start: Optional[date] = Query(default=None, description="First day (default: all history)"),
+    end: Optional[date] = Query(default=None, description="Last day, inclusive (default: all history)"),
+    class_type_id: Optional[str] = Query(default=None),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Weekday x hour heatmap of approved bookings and QR check-ins per class type for scheduling.
+    EMBED_TAGS: analytics, heatmap, occupancy, scheduling, bookings, check-ins, class types
+
+    `bookings` and `checkins` are K x 7 x 24 arrays (class_types x weekdays Mon..Sun x hours) served
+    from monthly grids kept current on every write; only partial months are binned from raw rows
+    (see analytics_heatmap.py).
+    """
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
     return {
-        **result.model_dump(),
-        "revenue_cents_30d": revenue_30d,
-        "refund_rate_30d": refund_rate_30d,
-        "whatsapp_delivery_rate_30d": whatsapp_delivery_30d,
-        # simple totals (no time buckets) for initial analytics
-        "totals": {
-            "payments": int(db.execute(select(func.count()).select_from(Payment)).scalar_one()),
-            "refunds": int(db.execute(select(func.count()).select_from(Refund)).scalar_one()),
-            "whatsapp_delivered_or_read": int(
-                db.execute(
-                    select(func.count()).select_from(WhatsAppStatusEvent).where(
-                        WhatsAppStatusEvent.status.in_(["delivered", "read"])  # type: ignore[arg-type]
-                    )
-                ).scalar_one()
-            ),
-        },
-        "facts": compute_facts(db),
-        "kpis": compute_kpis(db),
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        **heatmap(db, start, end, class_type_id),
     }
 
 
+@router.get("/analytics.top_visitors")
+def analytics_top_visitors(
+    month: Optional[str] = Query(default=None, description="YYYY-MM (default: current month) or 'all'"),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Leaderboard of members with the most visits in a month or overall.
+    EMBED_TAGS: analytics, leaderboards, visits, members, attendance, coaches
+
+    Reads per-member monthly visit counters kept up to date on every visit (see
+    analytics_leaderboards.py); no member_visits aggregation happens per request.
+    """
+    period = month or datetime.utcnow().strftime("%Y-%m")
+    if period != ALL_PERIOD:
+        try:
+            period = parse_month(period).strftime("%Y-%m")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="month must be YYYY-MM or 'all'")
+    return {"month": period, "members": top_visitors(db, period, limit)}
+
+
+@router.get("/analytics.streaks")
+def analytics_streaks(
+    kind: str = Query(default="current", description="One of: " + ",".join(STREAK_KINDS)),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    EMBED_SUMMARY: Leaderboard of consecutive-week visit streaks, current (still alive) or longest ever.
+    EMBED_TAGS: analytics, leaderboards, streaks, visits, members, engagement
+
+    A week counts when the member visited at least once (Monday to Sunday); a current streak stays
+    alive until a full week passes without a visit.
+    """
+    try:
+        members = top_streaks(db, kind, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"kind": kind, "members": members}
+
+
 @router.get("/analytics.totals")
 def analytics_totals(db: Session = Depends(get_db)) -> dict:
     """
     EMBED_SUMMARY: Returns overall totals for key entities without time bucketing for fast, stable analytics.
-    EMBED_TAGS: analytics, totals, payments, refunds, whatsapp, visits
-
-    SQL sketch:
-    SELECT COUNT(*) FROM payments; -- payments
-    SELECT COUNT(*) FROM refunds; -- refunds
-    SELECT COUNT(*) FROM whatsapp_status_events WHERE status IN ('delivered','read'); -- delivered/read
-    SELECT COUNT(*) FROM member_visits; -- attendance atomics
-    """
-    delivered = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status == "delivered")
-    ).scalar_one()
-    read = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status == "read")
-    ).scalar_one()
-    delivered_or_read = db.execute(
-        select(func.count()).select_from(WhatsAppStatusEvent).where(WhatsAppStatusEvent.status.in_(["delivered", "read"]))  # type: ignore[arg-type]
-    ).scalar_one()
-    payments_total = db.execute(select(func.count()).select_from(Payment)).scalar_one()
-    refunds_total = db.execute(select(func.count()).select_from(Refund)).scalar_one()
-    visits_total = db.execute(select(func.count()).select_from(MemberVisit)).scalar_one()
-    return {
-        "payments": int(payments_total),
-        "refunds": int(refunds_total),
-        "whatsapp_delivered": int(delivered),
-        "whatsapp_read": int(read),
-        "whatsapp_delivered_or_read": int(delivered_or_read),
-        "member_visits": int(visits_total),
-    }
+    EMBED_TAGS: analytics, totals, payments, refunds, whatsapp, visits, counters
+
+    Reads the running totals in analytics_counters (maintained on every write, see
+    analytics_counters.py) instead of counting the event tables:
+    SELECT name, value FROM analytics_counters;
+    """
+    return cached(("analytics.totals",), TOTALS_TABLES, lambda: _compute_totals(db))
 
 
+def _compute_totals(db: Session) -> dict:
+    counters = read_counters(db)
+    delivered = counters.get("whatsapp.delivered", 0)
+    read = counters.get("whatsapp.read", 0)
+    return {
+        "payments": counters.get("payments", 0),
+        "refunds": counters.get("refunds", 0),
+        "whatsapp_delivered": delivered,
+        "whatsapp_read": read,
+        "whatsapp_delivered_or_read": delivered + read,
+        "member_visits": counters.get("member_visits", 0),
+    }
@@ -7,6 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import and_, func, select
 from sqlalchemy.orm import Session
 
+from ..booking_counts import apply_booking_transition
 from ..deps import get_db, require_token
 from ..models import Booking, Event, Member, Group, MemberVisit
 from ..schemas import BookingCreate, BookingAction, BookingOut, BookingsListResponse
@@ -47,6 +48,7 @@ def bookings_create(payload: BookingCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Event at capacity")
 
     status_value = "pending" if _event_requires_approval(db, event, member) else "approved"
+    apply_booking_transition(db, event.id, None, status_value)
 
     booking = Booking(
         id=str(uuid.uuid4()),
@@ -85,6 +87,7 @@ def bookings_approve(payload: BookingAction, db: Session = Depends(get_db)):
         if approved_count >= event.capacity:
             raise HTTPException(status_code=400, detail="Event at capacity")
 
+    apply_booking_transition(db, booking.event_id, booking.status, "approved")
     booking.status = "approved"
     booking.approved_by = payload.approved_by
 
@@ -106,6 +109,7 @@ def bookings_cancel(payload: BookingAction, db: Session = Depends(get_db)):
     booking: Optional[Booking] = db.get(Booking, payload.id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
+    apply_booking_transition(db, booking.event_id, booking.status, "cancelled")
     booking.status = "cancelled"
     db.add(booking)
     db.commit()
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
+import base64
 import hashlib
+import json
+import struct
 from pathlib import Path
 import fnmatch
-from typing import Iterable, List, Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 
 from ..deps import require_token
-from ..embeddings import get_embedding_provider, cosine_similarity
+from ..code_lexical import get_lexical_index
+from ..embeddings import EmbeddingProvider, get_embedding_provider, cosine_similarity
 from ..database import SessionLocal
 from ..models import CodeEmbedding
+from ..vector_store import append_vectors, get_vector_collection
 
 
 router = APIRouter(prefix="/api/code", tags=["code-embeddings"], dependencies=[Depends(require_token)])
@@ -52,86 +59,287 @@ def _read_file(path: Path, max_bytes: int = 20000) -> str:
         return ""
 
 
-@router.post("/backfill")
-def code_backfill(
-    root_dir: Optional[str] = Query(default=None, description="Root directory to index; defaults to CWD"),
-    exts: Optional[str] = Query(default=".py,.ts,.tsx,.js,.json,.md"),
-    ignores: Optional[str] = Query(default=None, description="Comma-separated glob patterns to ignore"),
-    persist: bool = Query(default=False, description="Persist embeddings in DB (dev only)"),
-) -> dict:
-    # This route intentionally DOES NOT persist vectors to DB, avoiding clash with runtime app embeddings
-    # and Cursor's built-in code intelligence. It returns transient vectors so the caller can hold them in memory.
-    provider = get_embedding_provider()
+CODE_EMBED_BATCH_SIZE = 32
+
+
+def _collect_code_files(
+    root_dir: Optional[str], exts: Optional[str], ignores: Optional[str]
+) -> Tuple[Path, List[Path]]:
     root = Path(root_dir or ".").resolve()
     include_exts = set((exts or "").split(","))
     ignore_patterns = DEFAULT_IGNORES + ([p.strip() for p in (ignores or "").split(",") if p.strip()]
         if ignores else [])
-    files = list(_iter_files(root, include_exts, ignore_patterns))
+    return root, sorted(_iter_files(root, include_exts, ignore_patterns))
+
+
+def _iter_code_vectors(
+    provider: EmbeddingProvider, root: Path, files: Iterable[Path], batch_size: int = CODE_EMBED_BATCH_SIZE
+) -> Iterator[Tuple[dict, List[float], str]]:
+    """
+    EMBED_SUMMARY: Reads code files and embeds them in small batches, yielding (meta, vector, content) per file.
+    EMBED_TAGS: code, embeddings, batching, streaming
 
+    Only one batch of texts and vectors is held in memory at a time, so callers can stream
+    results to the client (or persist them) while later files are still being embedded.
+    """
     texts: List[str] = []
     meta: List[dict] = []
+
+    def flush() -> Iterator[Tuple[dict, List[float], str]]:
+        vectors = provider.embed_texts(texts)
+        yield from zip(meta, vectors, texts)
+        texts.clear()
+        meta.clear()
+
     for f in files:
         content = _read_file(f)
         if not content:
             continue
         texts.append(content)
         meta.append({"path": str(f.relative_to(root)), "sha256": hashlib.sha256(content.encode()).hexdigest()})
+        if len(texts) >= batch_size:
+            yield from flush()
+    if texts:
+        yield from flush()
 
-    vectors = provider.embed_texts(texts) if texts else []
-    if persist and vectors:
-        db = SessionLocal()
-        try:
-            for m, vec, content in zip(meta, vectors, texts):
-                db.add(
-                    CodeEmbedding(
-                        path=m["path"],
-                        file_sha256=m["sha256"],
-                        lang=Path(m["path"]).suffix.lstrip("."),
-                        chunk_idx=0,
-                        text_hash=hashlib.sha256(content.encode()).hexdigest(),
-                        vector=vec,
-                    )
+
+def _persist_code_vectors(records: List[Tuple[dict, List[float], str]]) -> None:
+    """Store code vectors, skipping chunks already persisted with the same text hash."""
+    if not records:
+        return
+    db = SessionLocal()
+    try:
+        paths = [m["path"] for m, _, _ in records]
+        existing = set(
+            db.execute(
+                select(CodeEmbedding.path, CodeEmbedding.chunk_idx, CodeEmbedding.text_hash).where(
+                    CodeEmbedding.path.in_(paths)
                 )
-            db.commit()
-        finally:
-            db.close()
-    return {"count": len(vectors), "meta": meta, "vectors": vectors, "persisted": bool(persist)}
+            ).all()
+        )
+        added: List[Tuple[str, str, List[float]]] = []
+        for m, vec, content in records:
+            text_hash = hashlib.sha256(content.encode()).hexdigest()
+            if (m["path"], 0, text_hash) in existing:
+                continue
+            added.append((m["path"], text_hash, vec))
+            db.add(
+                CodeEmbedding(
+                    path=m["path"],
+                    file_sha256=m["sha256"],
+                    lang=Path(m["path"]).suffix.lstrip("."),
+                    chunk_idx=0,
+                    text_hash=text_hash,
+                    vector=vec,
+                )
+            )
+        db.commit()
+        append_vectors("code", added)
+    finally:
+        db.close()
 
 
-@router.post("/search")
-def code_search(
-    q: str,
-    root_dir: Optional[str] = Query(default=None),
+def _iter_persisting(
+    records: Iterable[Tuple[dict, List[float], str]], persist: bool, batch_size: int = CODE_EMBED_BATCH_SIZE
+) -> Iterator[Tuple[dict, List[float], str]]:
+    """Pass records through unchanged, persisting them in batches when requested."""
+    pending: List[Tuple[dict, List[float], str]] = []
+    for record in records:
+        if persist:
+            pending.append(record)
+            if len(pending) >= batch_size:
+                _persist_code_vectors(pending)
+                pending = []
+        yield record
+    if persist:
+        _persist_code_vectors(pending)
+
+
+def encode_vector_base64(vector: List[float]) -> str:
+    """Encode a vector as base64 of little-endian float32 values (4 bytes per dimension)."""
+    return base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+
+
+def decode_vector_base64(data: str) -> List[float]:
+    raw = base64.b64decode(data)
+    return list(struct.unpack(f"<{len(raw) // 4}f", raw))
+
+
+def _vector_record(meta: dict, vector: List[float], encoding: str) -> dict:
+    if encoding == "base64":
+        return {**meta, "dims": len(vector), "vector_b64": encode_vector_base64(vector)}
+    return {**meta, "vector": vector}
+
+
+def _ndjson_stream(
+    records: Iterable[Tuple[dict, List[float], str]], encoding: str, persist: bool
+) -> Iterator[bytes]:
+    count = 0
+    for meta, vector, _ in records:
+        count += 1
+        line = {"type": "vector", **_vector_record(meta, vector, encoding)}
+        yield (json.dumps(line, separators=(",", ":")) + "\n").encode("utf-8")
+    summary = {"type": "summary", "count": count, "persisted": bool(persist)}
+    yield (json.dumps(summary, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def encode_binary_frame(meta: dict, vector: List[float]) -> bytes:
+    """
+    EMBED_SUMMARY: Length-prefixed binary frame for one code vector.
+    EMBED_TAGS: code, embeddings, binary, framing, float32
+
+    Layout (little-endian): u32 meta_len | meta JSON (utf-8) | u32 dims | dims x float32.
+    A summary frame carries {"type": "summary", ...} as meta and dims = 0.
+    """
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    return (
+        struct.pack("<I", len(meta_bytes))
+        + meta_bytes
+        + struct.pack("<I", len(vector))
+        + struct.pack(f"<{len(vector)}f", *vector)
+    )
+
+
+def decode_binary_frames(data: bytes) -> Iterator[Tuple[dict, List[float]]]:
+    offset = 0
+    while offset < len(data):
+        (meta_len,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        meta = json.loads(data[offset : offset + meta_len].decode("utf-8"))
+        offset += meta_len
+        (dims,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        vector = list(struct.unpack_from(f"<{dims}f", data, offset))
+        offset += 4 * dims
+        yield meta, vector
+
+
+def _binary_stream(records: Iterable[Tuple[dict, List[float], str]], persist: bool) -> Iterator[bytes]:
+    count = 0
+    for meta, vector, _ in records:
+        count += 1
+        yield encode_binary_frame({"type": "vector", **meta}, vector)
+    yield encode_binary_frame({"type": "summary", "count": count, "persisted": bool(persist)}, [])
+
+
+@router.post("/backfill")
+def code_backfill(
+    root_dir: Optional[str] = Query(default=None, description="Root directory to index; defaults to CWD"),
     exts: Optional[str] = Query(default=".py,.ts,.tsx,.js,.json,.md"),
-    ignores: Optional[str] = Query(default=None),
-    limit: int = Query(default=10, ge=1, le=100),
-    use_persisted: bool = Query(default=False, description="Search persisted code embeddings if true"),
-) -> dict:
+    ignores: Optional[str] = Query(default=None, description="Comma-separated glob patterns to ignore"),
+    persist: bool = Query(default=False, description="Persist embeddings in DB (dev only)"),
+    format: str = Query(default="json", pattern="^(json|ndjson|binary)$", description="json|ndjson|binary"),
+    encoding: str = Query(default="float", pattern="^(float|base64)$", description="Vector encoding for json/ndjson"),
+):
+    """
+    EMBED_SUMMARY: Embeds workspace code files; returns one JSON document or streams NDJSON/binary frames per file.
+    EMBED_TAGS: code, embeddings, backfill, streaming, ndjson, base64, float32
+
+    format=json keeps the original single-document response. format=ndjson writes one record per
+    file as soon as its batch is embedded, followed by a summary line; format=binary writes
+    length-prefixed float32 frames (see encode_binary_frame). encoding=base64 replaces float lists
+    with base64 float32 strings, roughly 4x smaller than JSON floats.
+    """
+    # This route does not persist vectors unless asked, avoiding clash with runtime app embeddings
+    # and Cursor's built-in code intelligence. It returns transient vectors so the caller can hold them in memory.
+    provider = get_embedding_provider()
+    root, files = _collect_code_files(root_dir, exts, ignores)
+    records = _iter_persisting(_iter_code_vectors(provider, root, files), persist)
+
+    if format == "ndjson":
+        return StreamingResponse(_ndjson_stream(records, encoding, persist), media_type="application/x-ndjson")
+    if format == "binary":
+        return StreamingResponse(_binary_stream(records, persist), media_type="application/octet-stream")
+
+    meta: List[dict] = []
+    vectors: List = []
+    for m, vec, _ in records:
+        meta.append(m)
+        vectors.append(encode_vector_base64(vec) if encoding == "base64" else vec)
+    return {"count": len(vectors), "meta": meta, "vectors": vectors, "persisted": bool(persist)}
+
+
+HYBRID_RRF_K = 60
+
+
+def _vector_ranking(
+    q: str, root_dir: Optional[str], exts: Optional[str], ignores: Optional[str], use_persisted: bool
+) -> List[Tuple[float, dict]]:
     provider = get_embedding_provider()
     q_vec = provider.embed_texts([q])[0]
+    scored: List[Tuple[float, dict]] = []
+    collection = get_vector_collection("code") if use_persisted else None
+    snapshot = collection.snapshot() if collection is not None else None
+    if snapshot is not None and snapshot.live_count and snapshot.dims == len(q_vec):
+        return [(score, {"path": path}) for score, path in snapshot.search(q_vec, snapshot.live_count)]
     if use_persisted:
         db = SessionLocal()
         try:
             rows = db.query(CodeEmbedding).all()
-            scored = []
             for r in rows:
                 if not r.vector:
                     continue
                 score = cosine_similarity(q_vec, r.vector)
                 scored.append((score, {"path": r.path}))
-            scored.sort(key=lambda x: x[0], reverse=True)
-            top = scored[:limit]
-            return {"items": [{"score": round(s, 6), **m} for s, m in top], "total": len(scored), "source": "persisted"}
         finally:
             db.close()
-    # Stateless fallback
-    backfill = code_backfill(root_dir=root_dir, exts=exts, ignores=ignores)
-    scored = []
-    for meta, vec in zip(backfill["meta"], backfill["vectors"]):
-        score = cosine_similarity(q_vec, vec)
-        scored.append((score, meta))
+    else:
+        root, files = _collect_code_files(root_dir, exts, ignores)
+        for meta, vec, _ in _iter_code_vectors(provider, root, files):
+            score = cosine_similarity(q_vec, vec)
+            scored.append((score, meta))
     scored.sort(key=lambda x: x[0], reverse=True)
-    top = scored[:limit]
-    return {"items": [{"score": round(s, 6), **m} for s, m in top], "total": len(scored), "source": "ephemeral"}
+    return scored
+
+
+def _lexical_ranking(
+    q: str, root_dir: Optional[str], exts: Optional[str], ignores: Optional[str]
+) -> List[Tuple[float, dict]]:
+    root, files = _collect_code_files(root_dir, exts, ignores)
+    index = get_lexical_index(root, files, scope=f"{exts}|{ignores}", read_text=_read_file)
+    return index.search(q, limit=None)
+
+
+def _fuse_rankings(rankings: List[List[Tuple[float, dict]]]) -> List[Tuple[float, dict]]:
+    """Reciprocal rank fusion: score(path) = sum over rankings of 1 / (k + rank)."""
+    fused: dict = {}
+    for ranking in rankings:
+        for rank, (_, meta) in enumerate(ranking, start=1):
+            score, _ = fused.get(meta["path"], (0.0, meta))
+            fused[meta["path"]] = (score + 1.0 / (HYBRID_RRF_K + rank), meta)
+    return sorted(fused.values(), key=lambda x: x[0], reverse=True)
+
+
+@router.post("/search")
+def code_search(
+    q: str,
+    root_dir: Optional[str] = Query(default=None),
+    exts: Optional[str] = Query(default=".py,.ts,.tsx,.js,.json,.md"),
+    ignores: Optional[str] = Query(default=None),
+    limit: int = Query(default=10, ge=1, le=100),
+    use_persisted: bool = Query(default=False, description="Search persisted code embeddings if true"),
+    mode: str = Query(default="vector", pattern="^(lexical|vector|hybrid)$", description="lexical|vector|hybrid"),
+) -> dict:
+    """
+    EMBED_SUMMARY: Searches workspace code by BM25 (lexical), embedding cosine (vector), or rank fusion of both (hybrid).
+    EMBED_TAGS: code, search, bm25, lexical, vector, hybrid, rrf
+
+    mode=lexical never calls the embedding provider and always indexes files under root_dir;
+    use_persisted only changes where vector-mode candidates come from.
+    """
+    if mode == "lexical":
+        scored = _lexical_ranking(q, root_dir, exts, ignores)
+        top = scored[:limit]
+        return {"items": [{"score": round(s, 6), **m} for s, m in top], "total": len(scored), "source": "lexical"}
 
+    vector_scored = _vector_ranking(q, root_dir, exts, ignores, use_persisted)
+    if mode == "hybrid":
+        candidates = max(limit * 5, 50)
+        lexical_scored = _lexical_ranking(q, root_dir, exts, ignores)[:candidates]
+        fused = _fuse_rankings([lexical_scored, vector_scored[:candidates]])
+        top = fused[:limit]
+        return {"items": [{"score": round(s, 6), **m} for s, m in top], "total": len(fused), "source": "hybrid"}
 
+    top = vector_scored[:limit]
+    source = "persisted" if use_persisted else "ephemeral"
+    return {"items": [{"score": round(s, 6), **m} for s, m in top], "total": len(vector_scored), "source": source}
@@ -8,8 +8,10 @@ from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
 from ..deps import get_db, require_token
+from ..embedding_metrics import metrics_snapshot, record_search_phase, timed
 from ..embeddings import get_embedding_provider, cosine_similarity
 from ..models import Embedding, Member, Event, ClassType
+from ..vector_store import append_vectors, get_vector_collection
 
 
 router = APIRouter(prefix="/api", tags=["embeddings"], dependencies=[Depends(require_token)])
@@ -59,10 +61,13 @@ def embeddings_backfill(db: Session = Depends(get_db), entity_type: Optional[str
     total_updated = 0
 
     for et in entity_types:
+        collection = get_vector_collection(et)
+        store_hashes = collection.snapshot().live_hashes() if collection is not None else {}
         rows = db.execute(_entity_query(db, et)).scalars().all()
         texts = [_text_for_entity(et, obj) for obj in rows]
         hashes = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
         vectors = provider.embed_texts(texts) if rows else []
+        changed: List[tuple] = []
 
         for obj, text, text_hash, vector in zip(rows, texts, hashes, vectors):
             # Upsert Embedding record
@@ -71,6 +76,9 @@ def embeddings_backfill(db: Session = Depends(get_db), entity_type: Optional[str
             ).scalar_one_or_none()
             if existing:
                 if existing.text_hash == text_hash:
+                    # Unchanged in the DB but missing/stale in the shared store: mirror it there too
+                    if collection is not None and store_hashes.get(existing.entity_id) != text_hash and existing.vector:
+                        changed.append((existing.entity_id, text_hash, existing.vector))
                     continue
                 existing.text_hash = text_hash
                 existing.vector = vector
@@ -86,12 +94,34 @@ def embeddings_backfill(db: Session = Depends(get_db), entity_type: Optional[str
                         text=text,
                     )
                 )
+            changed.append((getattr(obj, "id"), text_hash, vector))
             total_updated += 1
         db.commit()
+        append_vectors(et, changed)
 
     return {"ok": True, "updated": total_updated}
 
 
+def _search_vector_store(db: Session, entity_type: str, query_vec: List[float], limit: int):
+    """Scan the shared mmap store when enabled and populated; returns None to fall back to the DB scan."""
+    collection = get_vector_collection(entity_type)
+    if collection is None:
+        return None
+    snapshot = collection.snapshot()
+    if not snapshot.live_count or snapshot.dims != len(query_vec):
+        return None
+    hits = snapshot.search(query_vec, limit)
+    ids = [entity_id for _, entity_id in hits]
+    records = {
+        rec.entity_id: rec
+        for rec in db.execute(
+            select(Embedding).where(Embedding.entity_type == entity_type, Embedding.entity_id.in_(ids))
+        ).scalars()
+    }
+    top = [(score, records[entity_id]) for score, entity_id in hits if entity_id in records]
+    return top, snapshot.live_count
+
+
 @router.get("/embeddings.search")
 def embeddings_search(
     q: str,
@@ -100,17 +130,26 @@ def embeddings_search(
     db: Session = Depends(get_db),
 ):
     provider = get_embedding_provider()
-    query_vec = provider.embed_texts([q])[0]
-
-    records = db.execute(select(Embedding).where(Embedding.entity_type == entity_type)).scalars().all()
-    scored = []
-    for rec in records:
-        if not rec.vector:
-            continue
-        score = cosine_similarity(query_vec, rec.vector)  # type: ignore[arg-type]
-        scored.append((score, rec))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top = scored[:limit]
+    with timed() as embed_ms:
+        query_vec = provider.embed_texts([q])[0]
+
+    with timed() as scan_ms:
+        store_result = _search_vector_store(db, entity_type, query_vec, limit)
+        if store_result is not None:
+            top, total = store_result
+            source = "vector_store"
+        else:
+            records = db.execute(select(Embedding).where(Embedding.entity_type == entity_type)).scalars().all()
+            scored = []
+            for rec in records:
+                if not rec.vector:
+                    continue
+                score = cosine_similarity(query_vec, rec.vector)  # type: ignore[arg-type]
+                scored.append((score, rec))
+            scored.sort(key=lambda x: x[0], reverse=True)
+            top = scored[:limit]
+            total = len(scored)
+            source = "db"
 
     # Resolve entities for return payload
     def resolve(entity_id: str):
@@ -122,16 +161,26 @@ def embeddings_search(
             return db.get(ClassType, entity_id)
         return None
 
-    items = [
-        {
-            "score": round(score, 6),
-            "entity_type": entity_type,
-            "entity_id": rec.entity_id,
-            "text": rec.text,
-            "item": resolve(rec.entity_id),
-        }
-        for score, rec in top
-    ]
-    return {"items": items, "total": len(scored)}
+    with timed() as hydrate_ms:
+        items = [
+            {
+                "score": round(score, 6),
+                "entity_type": entity_type,
+                "entity_id": rec.entity_id,
+                "text": rec.text,
+                "item": resolve(rec.entity_id),
+            }
+            for score, rec in top
+        ]
+    record_search_phase(source, "embed", embed_ms[0])
+    record_search_phase(source, "scan", scan_ms[0])
+    record_search_phase(source, "hydrate", hydrate_ms[0])
+    return {"items": items, "total": total, "source": source}
+
+
+@router.get("/embeddings.metrics")
+def embeddings_metrics(db: Session = Depends(get_db)) -> dict:
+    """Index lag (global) plus provider and search latency metrics for this worker process."""
+    return metrics_snapshot(db)
 
 
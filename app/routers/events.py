@@ -1,15 +1,17 @@
 from __future__ import annotations
 
 import uuid
+from datetime import date, datetime, time, timedelta
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from ..analytics_forecast import schedule_forecast
 from ..deps import get_db, require_token
 from ..models import Event, ClassType, Group
-from ..schemas import EventCreate, EventUpdate, EventOut, EventsListResponse
+from ..schemas import EventCreate, EventUpdate, EventOut, EventsListResponse, EventsScheduleResponse
 
 
 router = APIRouter(prefix="/api", tags=["events"], dependencies=[Depends(require_token)])
@@ -111,3 +113,25 @@ def events_list(
     return {"items": items, "total": len(total)}
 
 
+@router.get("/events.schedule", response_model=EventsScheduleResponse)
+def events_schedule(
+    start: Optional[date] = Query(default=None, description="First day (default: today)"),
+    end: Optional[date] = Query(default=None, description="Last day, inclusive (default: start + 6 days)"),
+    class_type_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    EMBED_SUMMARY: Upcoming sessions with capacity, current bookings and forecast demand / fill rate per slot.
+    EMBED_TAGS: events, scheduling, capacity, forecast, demand, fill rate, planning
+
+    Predictions come from demand_forecasts (per class type, weekday and hour; see analytics_forecast.py);
+    `outlook` flags sessions likely to be over-subscribed (fill rate > 1) or under-subscribed.
+    """
+    start = start or datetime.utcnow().date()
+    end = end or start + timedelta(days=6)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    forecast = schedule_forecast(
+        db, datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min), class_type_id
+    )
+    return {"start": start, "end": end, **forecast}
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Backfill job endpoints: create a data/code embeddings backfill job, poll progress, cancel.
+EMBED_TAGS: jobs, backfill, embeddings, progress, cancel, api
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..backfill_jobs import cancel_job, create_job, job_progress, start_job
+from ..deps import get_db, require_token
+from ..models import BackfillJob
+from ..schemas import BackfillJobAction, BackfillJobCreate, BackfillJobOut, BackfillJobsListResponse
+
+
+router = APIRouter(prefix="/api", tags=["jobs"], dependencies=[Depends(require_token)])
+
+
+def _job_out(job: BackfillJob) -> BackfillJobOut:
+    return BackfillJobOut(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        total=job.total,
+        processed=job.processed,
+        updated=job.updated,
+        checkpoint=job.checkpoint,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        **job_progress(job),
+    )
+
+
+@router.post("/jobs.create", response_model=BackfillJobOut)
+def jobs_create(payload: BackfillJobCreate, db: Session = Depends(get_db)):
+    if payload.kind == "embeddings":
+        params = {
+            "entity_types": [payload.entity_type] if payload.entity_type else None,
+            "batch_size": payload.batch_size,
+        }
+    else:
+        params = {
+            "root_dir": payload.root_dir,
+            "exts": payload.exts,
+            "ignores": payload.ignores,
+            "batch_size": payload.batch_size,
+        }
+    job = create_job(db, payload.kind, params)
+    start_job(job.id)
+    return _job_out(job)
+
+
+@router.get("/jobs.get", response_model=BackfillJobOut)
+def jobs_get(id: str = Query(...), db: Session = Depends(get_db)):
+    job = db.get(BackfillJob, id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_out(job)
+
+
+@router.post("/jobs.cancel", response_model=BackfillJobOut)
+def jobs_cancel(payload: BackfillJobAction, db: Session = Depends(get_db)):
+    job = db.get(BackfillJob, payload.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_out(cancel_job(db, job))
+
+
+@router.get("/jobs.list", response_model=BackfillJobsListResponse)
+def jobs_list(
+    db: Session = Depends(get_db),
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=50, ge=1, le=500),
+    status: Optional[str] = None,
+):
+    stmt = select(BackfillJob)
+    if status:
+        stmt = stmt.where(BackfillJob.status == status)
+    total = db.execute(select(func.count()).select_from(stmt.subquery())).scalar_one()
+    items = db.execute(
+        stmt.order_by(BackfillJob.created_at.desc(), BackfillJob.id).offset((page - 1) * page_size).limit(page_size)
+    ).scalars().all()
+    return {"items": [_job_out(j) for j in items], "total": int(total)}
@@ -7,9 +7,10 @@ from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from ..analytics_churn import at_risk_members
 from ..deps import get_db, require_token
 from ..models import Member, Group
-from ..schemas import MemberCreate, MemberUpdate, MembersListResponse, MemberOut
+from ..schemas import AtRiskMembersResponse, MemberCreate, MemberUpdate, MembersListResponse, MemberOut
 from ..utils import compute_demographic_segment
 
 
@@ -100,12 +101,15 @@ def members_list(
     status: Optional[str] = None,
     source: Optional[str] = None,
     group_id: Optional[str] = None,
+    demographic_segment: Optional[str] = None,
 ):
     stmt = select(Member)
     if status:
         stmt = stmt.where(Member.status == status)
     if source:
         stmt = stmt.where(Member.source == source)
+    if demographic_segment:
+        stmt = stmt.where(Member.demographic_segment == demographic_segment)
     if group_id:
         stmt = stmt.join(Member.groups).where(Group.id == group_id)
 
@@ -117,6 +121,22 @@ def members_list(
     }
 
 
+@router.get("/members.at_risk", response_model=AtRiskMembersResponse)
+def members_at_risk(
+    db: Session = Depends(get_db),
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=50, ge=1, le=500),
+    min_score: float = Query(default=0.5, ge=0.0, le=1.0),
+):
+    """
+    EMBED_SUMMARY: Paginated list of active members most likely to churn, riskiest first, with the features behind each score.
+    EMBED_TAGS: members, churn, risk, retention, engagement, outreach
+
+    Reads member_churn_scores, rewritten daily by analytics_churn.score_members().
+    """
+    return at_risk_members(db, min_score, page, page_size)
+
+
 def _member_out(m: Member) -> MemberOut:
     return MemberOut(
         id=m.id,
@@ -80,6 +80,26 @@ class MembersListResponse(BaseModel):
     total: int
 
 
+class AtRiskMemberOut(BaseModel):
+    member_id: str
+    full_name: str
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    score: float
+    days_since_visit: Optional[int] = None
+    recent_visits: int
+    prior_visits: int
+    cancellation_ratio: float
+    refunds: int
+    payment_failures: int
+    scored_at: datetime
+
+
+class AtRiskMembersResponse(BaseModel):
+    items: List[AtRiskMemberOut]
+    total: int
+
+
 # Events
 class EventBase(BaseModel):
     name: str
@@ -135,6 +155,27 @@ class EventsListResponse(BaseModel):
     total: int
 
 
+class ScheduleItemOut(BaseModel):
+    event_id: str
+    name: str
+    class_type_id: str
+    start: datetime
+    end: datetime
+    capacity: Optional[int]
+    booked: int
+    predicted_demand: Optional[float]
+    predicted_fill_rate: Optional[float]
+    basis: Optional[str] = Field(default=None, description="slot, class_type (no history for the slot) or null")
+    outlook: Optional[str] = Field(default=None, description="over, under, ok, or null without capacity/forecast")
+
+
+class EventsScheduleResponse(BaseModel):
+    start: date
+    end: date
+    forecast_through_week: str
+    items: List[ScheduleItemOut]
+
+
 # Bookings
 class BookingCreate(BaseModel):
     event_id: str
@@ -164,14 +205,81 @@ class BookingsListResponse(BaseModel):
 
 # Analytics
 class AnalyticsSummary(BaseModel):
-    attendance_by_class_type_30d: dict[str, int]
-    attendance_by_class_type_90d: dict[str, int]
-    average_utilization_rate: Optional[float]
-    active_members: int
-    demographic_age_bands: dict[str, int]
-    gender_breakdown: dict[str, int]
+    # Every field is optional: with sections=/metrics= only the requested ones are computed and returned
+    attendance_by_class_type_30d: Optional[dict[str, int]] = None
+    attendance_by_class_type_90d: Optional[dict[str, int]] = None
+    average_utilization_rate: Optional[float] = None
+    active_members: Optional[int] = None
+    demographic_age_bands: Optional[dict[str, int]] = None
+    gender_breakdown: Optional[dict[str, int]] = None
+    revenue_cents_30d: Optional[int] = None
+    refund_rate_30d: Optional[float] = None
+    whatsapp_delivery_rate_30d: Optional[float] = None
+    totals: Optional[dict[str, int]] = None
+    facts: Optional[dict] = None
+    kpis: Optional[dict[str, Optional[float]]] = None
+
+
+class TotalChange(BaseModel):
+    current: int
+    previous: int
+    delta: int
+    pct_change: Optional[float] = None
+
+
+class TimeseriesSeries(BaseModel):
+    key: Optional[str] = None
+    values: List[int]
+    total: int
+    previous_total: Optional[int] = None
+    change: Optional[TotalChange] = None
 
 
+class AnalyticsTimeseries(BaseModel):
+    metric: str
+    granularity: str
+    start: datetime
+    end: datetime
+    group_by: Optional[str] = None
+    buckets: List[str]
+    series: List[TimeseriesSeries]
+    previous_start: Optional[datetime] = None
+    previous_end: Optional[datetime] = None
+
+
+# Backfill jobs
+class BackfillJobCreate(BaseModel):
+    kind: str = Field(pattern="^(embeddings|code)$")
+    entity_type: Optional[str] = Field(default=None, pattern="^(member|event|class_type)$")
+    root_dir: Optional[str] = None
+    exts: Optional[str] = ".py,.ts,.tsx,.js,.json,.md"
+    ignores: Optional[str] = None
+    batch_size: int = Field(default=50, ge=1, le=1000)
+
+
+class BackfillJobAction(BaseModel):
+    id: str
+
+
+class BackfillJobOut(BaseModel):
+    id: str
+    kind: str
+    status: str
+    total: int
+    processed: int
+    updated: int
+    checkpoint: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    rate_per_sec: Optional[float] = None
+    eta_seconds: Optional[float] = None
+
+
+class BackfillJobsListResponse(BaseModel):
+    items: List[BackfillJobOut]
+    total: int
+
 
 # ClassTypes
 class ClassTypeCreate(BaseModel):
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Append-only, memory-mapped float32 vector segments shared zero-copy across uvicorn workers.
+EMBED_TAGS: embeddings, vectors, memmap, numpy, segments, compaction, search, multiprocess
+
+Layout per collection (member, event, class_type, code) under APP_VECTOR_STORE_DIR/<collection>/:
+- seg-NNNNNN.vseg: immutable segment = 64-byte header | rows x dims float32 matrix | JSON id table.
+  Header (little-endian): magic "VSEG0001", u32 version, u32 dims, u64 rows, u64 ids_offset, u64 ids_length.
+- MANIFEST.json: {"generation", "dims", "segments", "next_segment"}; replaced atomically with os.replace.
+
+Writes append a new segment holding the changed rows; a later row for the same id supersedes
+earlier ones. Compaction merges the live rows into one segment and swaps the manifest, so readers
+either see the old segment set or the new one. Readers np.memmap every segment read-only, so all
+worker processes share the same page-cache pages instead of holding private copies.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import get_settings
+
+try:  # POSIX advisory locks serialize writers across worker processes
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None  # type: ignore[assignment]
+
+
+SEGMENT_MAGIC = b"VSEG0001"
+SEGMENT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")
+HEADER_SIZE = 64
+MAX_SEGMENTS_BEFORE_COMPACTION = 8
+
+logger = logging.getLogger("vector_store")
+
+
+@dataclass
+class Segment:
+    name: str
+    ids: List[str]
+    text_hashes: List[str]
+    matrix: np.ndarray
+
+
+def write_segment(path: Path, ids: Sequence[str], text_hashes: Sequence[str], matrix: np.ndarray) -> None:
+    """Write an immutable segment file atomically (tmp file + rename)."""
+    matrix = np.ascontiguousarray(matrix, dtype="<f4")
+    rows, dims = matrix.shape
+    id_table = json.dumps({"ids": list(ids), "text_hashes": list(text_hashes)}, separators=(",", ":")).encode("utf-8")
+    ids_offset = HEADER_SIZE + matrix.nbytes
+    header = HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, dims, rows, ids_offset, len(id_table))
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(header.ljust(HEADER_SIZE, b"\0"))
+        fh.write(matrix.tobytes())
+        fh.write(id_table)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def open_segment(path: Path) -> Segment:
+    with open(path, "rb") as fh:
+        magic, version, dims, rows, ids_offset, ids_length = HEADER.unpack(fh.read(HEADER.size))
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f"Not a vector segment: {path}")
+        fh.seek(ids_offset)
+        id_table = json.loads(fh.read(ids_length).decode("utf-8"))
+    if rows:
+        matrix = np.memmap(path, dtype="<f4", mode="r", offset=HEADER_SIZE, shape=(rows, dims))
+    else:
+        matrix = np.empty((0, dims), dtype="<f4")
+    return Segment(name=path.name, ids=id_table["ids"], text_hashes=id_table["text_hashes"], matrix=matrix)
+
+
+class VectorSnapshot:
+    """Read-only view over one manifest generation: memmapped segments plus a live-row mask per segment."""
+
+    def __init__(self, generation: int, dims: int, segments: List[Segment]) -> None:
+        self.generation = generation
+        self.dims = dims
+        self.segments = segments
+        latest: Dict[str, Tuple[int, int]] = {}
+        for seg_idx, seg in enumerate(segments):
+            for row, entity_id in enumerate(seg.ids):
+                latest[entity_id] = (seg_idx, row)
+        self.live_masks = [np.zeros(len(seg.ids), dtype=bool) for seg in segments]
+        for seg_idx, row in latest.values():
+            self.live_masks[seg_idx][row] = True
+        self.live_count = len(latest)
+        self.total_rows = sum(len(seg.ids) for seg in segments)
+
+    def live_hashes(self) -> Dict[str, str]:
+        return {
+            seg.ids[row]: seg.text_hashes[row]
+            for seg, mask in zip(self.segments, self.live_masks)
+            for row in np.flatnonzero(mask)
+        }
+
+    def iter_live(self) -> Iterator[Tuple[str, str, np.ndarray]]:
+        for seg, mask in zip(self.segments, self.live_masks):
+            for row in np.flatnonzero(mask):
+                yield seg.ids[row], seg.text_hashes[row], seg.matrix[row]
+
+    def search(self, query: Sequence[float], limit: int = 10) -> List[Tuple[float, str]]:
+        """Top-k ids by dot product (cosine for L2-normalized vectors) over live rows only."""
+        if not self.live_count:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        if q.shape != (self.dims,):
+            raise ValueError("Query dimensions do not match vector store")
+        scores: List[np.ndarray] = []
+        ids: List[str] = []
+        for seg, mask in zip(self.segments, self.live_masks):
+            if not len(seg.ids):
+                continue
+            seg_scores = np.asarray(seg.matrix @ q, dtype=np.float32)
+            seg_scores[~mask] = -np.inf
+            scores.append(seg_scores)
+            ids.extend(seg.ids)
+        all_scores = np.concatenate(scores)
+        k = min(limit, self.live_count)
+        top = np.argpartition(-all_scores, k - 1)[:k]
+        top = top[np.argsort(-all_scores[top])]
+        return [(float(all_scores[i]), ids[i]) for i in top]
+
+
+class VectorCollection:
+    """One named collection of segments with a manifest; safe for concurrent readers and writers."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._snapshot: Optional[VectorSnapshot] = None
+        self._snapshot_lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / "MANIFEST.json"
+
+    def read_manifest(self) -> dict:
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except FileNotFoundError:
+            return {"generation": 0, "dims": None, "segments": [], "next_segment": 1}
+
+    def _write_manifest(self, manifest: dict) -> None:
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, self.manifest_path)
+
+    @contextmanager
+    def _writer_lock(self) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def snapshot(self) -> VectorSnapshot:
+        """Return the current snapshot, reopening segments only when the manifest generation changed."""
+        with self._snapshot_lock:
+            for _ in range(3):
+                manifest = self.read_manifest()
+                if self._snapshot is not None and self._snapshot.generation == manifest["generation"]:
+                    return self._snapshot
+                try:
+                    segments = [open_segment(self.root / name) for name in manifest["segments"]]
+                except FileNotFoundError:
+                    # A compaction swapped the manifest between our read and open; re-read it
+                    continue
+                self._snapshot = VectorSnapshot(manifest["generation"], manifest["dims"] or 0, segments)
+                return self._snapshot
+            raise RuntimeError(f"Vector store at {self.root} kept changing while opening")
+
+    def append(self, rows: Iterable[Tuple[str, str, Sequence[float]]]) -> None:
+        """Append (id, text_hash, vector) rows as a new segment; compacts when segments pile up."""
+        rows = list(rows)
+        if not rows:
+            return
+        matrix = np.asarray([vec for _, _, vec in rows], dtype=np.float32)
+        with self._writer_lock():
+            manifest = self.read_manifest()
+            if manifest["dims"] not in (None, matrix.shape[1]):
+                raise ValueError(f"Vector dims {matrix.shape[1]} do not match collection dims {manifest['dims']}")
+            name = f"seg-{manifest['next_segment']:06d}.vseg"
+            write_segment(self.root / name, [r[0] for r in rows], [r[1] for r in rows], matrix)
+            manifest = {
+                "generation": manifest["generation"] + 1,
+                "dims": int(matrix.shape[1]),
+                "segments": manifest["segments"] + [name],
+                "next_segment": manifest["next_segment"] + 1,
+            }
+            self._write_manifest(manifest)
+            if len(manifest["segments"]) > MAX_SEGMENTS_BEFORE_COMPACTION:
+                self._compact_locked()
+
+    def replace_all(self, rows: Iterable[Tuple[str, str, Sequence[float]]]) -> None:
+        """Atomically swap the collection contents for exactly `rows` (used by rebuilds)."""
+        rows = list(rows)
+        with self._writer_lock():
+            manifest = self.read_manifest()
+            dims = len(rows[0][2]) if rows else (manifest["dims"] or 0)
+            matrix = np.asarray([vec for _, _, vec in rows], dtype=np.float32).reshape(len(rows), dims)
+            self._swap_locked(manifest, [r[0] for r in rows], [r[1] for r in rows], matrix)
+
+    def compact(self) -> None:
+        with self._writer_lock():
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        manifest = self.read_manifest()
+        segments = [open_segment(self.root / name) for name in manifest["segments"]]
+        snapshot = VectorSnapshot(manifest["generation"], manifest["dims"] or 0, segments)
+        if len(segments) <= 1 and snapshot.live_count == snapshot.total_rows:
+            return
+        live = list(snapshot.iter_live())
+        matrix = np.asarray([vec for _, _, vec in live], dtype=np.float32).reshape(len(live), snapshot.dims)
+        self._swap_locked(manifest, [r[0] for r in live], [r[1] for r in live], matrix)
+
+    def _swap_locked(self, manifest: dict, ids: List[str], text_hashes: List[str], matrix: np.ndarray) -> None:
+        name = f"seg-{manifest['next_segment']:06d}.vseg"
+        write_segment(self.root / name, ids, text_hashes, matrix)
+        self._write_manifest(
+            {
+                "generation": manifest["generation"] + 1,
+                "dims": int(matrix.shape[1]) if matrix.size else manifest["dims"],
+                "segments": [name],
+                "next_segment": manifest["next_segment"] + 1,
+            }
+        )
+        # Readers holding memmaps of the old segments keep their inodes alive until they reopen.
+        for old in manifest["segments"]:
+            try:
+                (self.root / old).unlink()
+            except FileNotFoundError:
+                pass
+
+
+_collections: Dict[str, VectorCollection] = {}
+_collections_lock = threading.Lock()
+
+
+def get_vector_collection(name: str) -> Optional[VectorCollection]:
+    """Return the collection when APP_VECTOR_STORE_DIR is configured, else None (store disabled)."""
+    settings = get_settings()
+    if not settings.vector_store_dir:
+        return None
+    root = Path(settings.vector_store_dir) / name
+    with _collections_lock:
+        collection = _collections.get(str(root))
+        if collection is None:
+            collection = VectorCollection(root)
+            _collections[str(root)] = collection
+        return collection
+
+
+def append_vectors(name: str, rows: Iterable[Tuple[str, str, Sequence[float]]]) -> None:
+    """Best-effort mirror of changed Embedding rows into the store; the DB stays the source of truth."""
+    collection = get_vector_collection(name)
+    if collection is None:
+        return
+    try:
+        collection.append(rows)
+    except (OSError, ValueError) as exc:
+        logger.warning("vector store append failed for %s: %s", name, exc)
@@ -0,0 +1 @@
+"""Performance benchmarks run against a synthetic gym; see benchmarks/run_analytics.py."""
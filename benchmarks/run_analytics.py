@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Times the analytics entry points (summary, facts, KPIs, window math) on a synthetic gym and writes a JSON report.
+EMBED_TAGS: benchmarks, analytics, performance, timing, query count, sqlite, report, regression
+
+Usage (from the repository root):
+    python -m benchmarks.run_analytics --scale small --repeat 5
+    python -m benchmarks.run_analytics --scale large --compare .bench/report-<old commit>.json
+
+Steps:
+1. Build (or reuse) .bench/gym-<scale>-<seed>.db with benchmarks.synthetic.build_gym. A database is
+   reused only when it was built for the same scale and seed.
+2. Prepare derived state with the maintenance commands in PREPARE (booking counts, counters, daily
+   rollups, sketches) and time each one; a bulk load bypasses the on-write maintenance.
+3. Call each ENTRY_POINTS function once cold and `repeat` more times, each time in a fresh session
+   with the in-process analytics cache cleared. Record wall times and the number of SQL statements
+   sent to the database per call.
+4. Check the report (see check_report): the approx summary must not be slower than the exact one.
+5. Write .bench/report-<commit>.json and exit non-zero when a check failed. With --compare, print
+   median time and query-count ratios against an older report.
+
+The summary entry points evaluate every analytics_summary field with MetricEvaluator at `now=END`,
+the last instant of the synthetic span, so their 30- and 90-day windows cover data; the endpoint
+itself always measures up to the current time.
+"""
+
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.analytics_cache import clear_cache
+from app.analytics_facts import compute_facts
+from app.analytics_kpis import compute_kpis
+from app.analytics_metrics import SUMMARY_FIELDS, MetricEvaluator
+from app.analytics_math import (
+    compare_windows,
+    compute_refund_rate,
+    compute_revenue_cents,
+    compute_whatsapp_delivery_rate,
+    window_pair,
+)
+from app.database import SessionLocal
+from app.maintenance import COMMANDS
+from app.schemas import AnalyticsSummary
+
+from .synthetic import END, SCALES, Scale, build_gym, gym_fingerprint, is_empty, stored_fingerprint
+
+
+REPORT_VERSION = 2
+PREPARE = ("booking-counts-reconcile", "counters-rebuild", "rollups-backfill", "sketches-rebuild")
+WINDOWS = {"30d": (END - timedelta(days=30), END), "365d": (END - timedelta(days=365), END)}
+# The approx summary may be this much slower than the exact one before check_report fails (timer noise)
+APPROX_TOLERANCE = 1.1
+
+
+def _summary(approx: bool) -> Callable[[Session], Any]:
+    def summary(db: Session) -> AnalyticsSummary:
+        values = MetricEvaluator(db, now=END, approx=approx).evaluate(SUMMARY_FIELDS.values())
+        return AnalyticsSummary(**{field: values[name] for field, name in SUMMARY_FIELDS.items()})
+
+    return summary
+
+
+def _windowed(fn: Callable[..., Any], window: str, *args: Any) -> Callable[[Session], Any]:
+    start, end = WINDOWS[window]
+    return lambda db: fn(db, *args, start, end)
+
+
+ENTRY_POINTS: Dict[str, Callable[[Session], Any]] = {
+    "analytics_summary": _summary(False),
+    "analytics_summary[approx]": _summary(True),
+    "compute_facts": compute_facts,
+    "compute_kpis": compute_kpis,
+}
+for _window in WINDOWS:
+    ENTRY_POINTS.update(
+        {
+            f"compute_revenue_cents[{_window}]": _windowed(compute_revenue_cents, _window),
+            f"compute_refund_rate[{_window}]": _windowed(compute_refund_rate, _window),
+            f"compute_whatsapp_delivery_rate[{_window}]": _windowed(compute_whatsapp_delivery_rate, _window),
+            f"window_pair[payments,{_window}]": _windowed(window_pair, _window, "payments"),
+            f"compare_windows[{_window}]": _windowed(compare_windows, _window),
+        }
+    )
+
+
+class QueryCounter:
+    """Counts statements sent through an engine while active (cursor executes, not ORM calls)."""
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self.count = 0
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.count += 1
+
+    def __enter__(self) -> "QueryCounter":
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def prepare(engine: Engine) -> Dict[str, float]:
+    """Rebuild derived analytics state after a bulk load; seconds per maintenance command."""
+    timings: Dict[str, float] = {}
+    for name in PREPARE:
+        db = SessionLocal(bind=engine)
+        try:
+            started = time.perf_counter()
+            COMMANDS[name](db)
+            db.commit()
+            timings[name] = round(time.perf_counter() - started, 3)
+        finally:
+            db.close()
+    return timings
+
+
+def time_call(engine: Engine, fn: Callable[[Session], Any]) -> Dict[str, float]:
+    clear_cache()
+    db = SessionLocal(bind=engine)
+    try:
+        with QueryCounter(engine) as counter:
+            started = time.perf_counter()
+            fn(db)
+            elapsed = time.perf_counter() - started
+        db.commit()
+    finally:
+        db.close()
+    return {"ms": round(elapsed * 1000, 3), "queries": counter.count}
+
+
+def run_entry_points(
+    engine: Engine, repeat: int = 3, names: Optional[List[str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in names or list(ENTRY_POINTS):
+        fn = ENTRY_POINTS[name]
+        cold = time_call(engine, fn)
+        warm = [time_call(engine, fn) for _ in range(repeat)]
+        times = [run["ms"] for run in warm] or [cold["ms"]]
+        results[name] = {
+            "cold_ms": cold["ms"],
+            "min_ms": min(times),
+            "median_ms": round(statistics.median(times), 3),
+            "max_ms": max(times),
+            "queries": warm[-1]["queries"] if warm else cold["queries"],
+            "cold_queries": cold["queries"],
+        }
+    return results
+
+
+def run(
+    db_path: Path,
+    scale: Scale,
+    seed: int = 0,
+    repeat: int = 3,
+    rebuild: bool = False,
+    names: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Build or reuse the gym at db_path, prepare it, time every entry point and return the report."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    if rebuild and db_path.exists():
+        db_path.unlink()
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False}, future=True)
+    try:
+        build_seconds = None
+        rows = None
+        fingerprint = stored_fingerprint(engine)
+        if fingerprint != gym_fingerprint(scale, seed):
+            if fingerprint is not None or not is_empty(engine):
+                raise SystemExit(f"{db_path} holds other data; pass --rebuild or another --db")
+            started = time.perf_counter()
+            rows = build_gym(engine, scale, seed)
+            build_seconds = round(time.perf_counter() - started, 3)
+        report = {
+            "version": REPORT_VERSION,
+            "commit": _git_commit(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+            },
+            "scale": asdict(scale),
+            "seed": seed,
+            "repeat": repeat,
+            "build_seconds": build_seconds,
+            "rows": rows,
+            "prepare_seconds": prepare(engine),
+            "results": run_entry_points(engine, repeat, names),
+        }
+        report["failures"] = check_report(report)
+        return report
+    finally:
+        engine.dispose()
+
+
+def check_report(report: Dict[str, Any]) -> List[str]:
+    """Failed expectations of one report (empty when it is fine to keep as a baseline)."""
+    results = report["results"]
+    failures = []
+    exact, approx = results.get("analytics_summary"), results.get("analytics_summary[approx]")
+    if exact and approx and approx["median_ms"] > exact["median_ms"] * APPROX_TOLERANCE:
+        failures.append(
+            f"analytics_summary[approx] median {approx['median_ms']:.1f} ms is slower than "
+            f"analytics_summary {exact['median_ms']:.1f} ms"
+        )
+    return failures
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per entry point in both reports: median times, queries and the current/baseline time ratio."""
+    if baseline.get("scale") != current.get("scale") or baseline.get("seed") != current.get("seed"):
+        raise ValueError("reports were run on different synthetic gyms")
+    if baseline.get("version") != current.get("version"):
+        raise ValueError("reports come from different benchmark versions")
+    rows = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        rows.append(
+            {
+                "name": name,
+                "baseline_ms": before["median_ms"],
+                "current_ms": now["median_ms"],
+                "ratio": round(now["median_ms"] / before["median_ms"], 3) if before["median_ms"] else None,
+                "baseline_queries": before["queries"],
+                "current_queries": now["queries"],
+            }
+        )
+    return rows
+
+
+def _print_results(report: Dict[str, Any]) -> None:
+    print(f"{'entry point':<44} {'cold ms':>10} {'median ms':>10} {'queries':>8}")
+    for name, result in report["results"].items():
+        print(f"{name:<44} {result['cold_ms']:>10.1f} {result['median_ms']:>10.1f} {result['queries']:>8}")
+
+
+def _print_comparison(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'entry point':<44} {'before ms':>10} {'after ms':>10} {'ratio':>7} {'queries':>9}")
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        queries = f"{row['baseline_queries']}->{row['current_queries']}"
+        print(f"{row['name']:<44} {row['baseline_ms']:>10.1f} {row['current_ms']:>10.1f} {ratio:>7} {queries:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_analytics")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Warm runs per entry point after the cold one")
+    parser.add_argument("--db", type=Path, default=None, help="SQLite file (default: .bench/gym-<scale>-<seed>.db)")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the synthetic gym even if it exists")
+    parser.add_argument("--only", default=None, help="Comma-separated entry point names (default: all)")
+    parser.add_argument("--out", type=Path, default=None, help="Report path (default: .bench/report-<commit>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(",")] if args.only else None
+    unknown = sorted(set(names or []) - set(ENTRY_POINTS))
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(unknown)}")
+    db_path = args.db or Path(".bench") / f"gym-{args.scale}-{args.seed}.db"
+    report = run(db_path, SCALES[args.scale], args.seed, args.repeat, args.rebuild, names)
+
+    out = args.out or Path(".bench") / f"report-{report['commit'] or 'worktree'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    _print_results(report)
+    print(f"report: {out}")
+    if args.compare is not None:
+        _print_comparison(compare_reports(json.loads(args.compare.read_text()), report))
+    if report["failures"]:
+        raise SystemExit("check failed: " + "; ".join(report["failures"]))
+
+
+if __name__ == "__main__":
+    main()
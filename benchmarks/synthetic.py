@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+"""
+EMBED_SUMMARY: Deterministic synthetic gym (members, events, bookings, visits, payments, WhatsApp) bulk-loaded into SQLite.
+EMBED_TAGS: benchmarks, synthetic data, numpy, sqlite, bulk insert, analytics, performance
+
+build_gym() draws every column with a seeded NumPy Generator, so the same (scale, seed) always yields
+the same rows, and inserts them with Core executemany in chunks on one connection. Core inserts skip
+the SessionLocal listeners (counters, rollups, sketches, heatmap ...); the benchmark runner rebuilds
+that derived state afterwards with the maintenance commands, as an operator would after a bulk load.
+
+Shape of the data (all timestamps inside SPAN_DAYS days ending at END):
+- bookings: booking j goes to event j % events and a member unique within that event, so
+  (event_id, member_id) stays unique; 80% approved, 10% pending, 10% cancelled
+- payments: 92% succeeded (every 20th of those half refunded), 4% failed, 4% still created
+- WhatsApp: every message gets "sent", then "delivered" (3%: "error"), then for half of them "read"
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Engine
+
+from app.database import Base
+from app.models import (
+    Booking,
+    ClassType,
+    ConfigEntry,
+    Event,
+    FacebookCampaign,
+    Member,
+    MemberVisit,
+    Payment,
+    Refund,
+    WhatsAppMessage,
+    WhatsAppStatusEvent,
+)
+
+
+END = datetime(2024, 1, 1)
+SPAN_DAYS = 730
+START = END - timedelta(days=SPAN_DAYS)
+GYM_KEY = "benchmark.gym"
+
+CLASS_TYPES = ("boxing_basics", "sparring", "cardio_box", "kids_boxing")
+CAMPAIGNS = ("fb_spring_promo", "fb_summer_intake", "fb_new_year")
+SOURCES = ("walk_in", "facebook", "referral", "website")
+
+
+@dataclass(frozen=True)
+class Scale:
+    members: int
+    events: int
+    bookings: int
+    visits: int
+    payments: int
+    messages: int
+
+
+SCALES: Dict[str, Scale] = {
+    "tiny": Scale(members=200, events=400, bookings=2_000, visits=5_000, payments=1_000, messages=500),
+    "small": Scale(members=5_000, events=20_000, bookings=200_000, visits=500_000, payments=50_000, messages=20_000),
+    "medium": Scale(
+        members=20_000, events=80_000, bookings=800_000, visits=2_000_000, payments=200_000, messages=80_000
+    ),
+    "large": Scale(
+        members=50_000, events=200_000, bookings=2_000_000, visits=5_000_000, payments=500_000, messages=200_000
+    ),
+}
+
+
+def _stamps(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n uniformly spread timestamps (datetime64[s]) inside the synthetic span."""
+    seconds = rng.integers(0, SPAN_DAYS * 86400, size=n)
+    return np.datetime64(START, "s") + seconds.astype("timedelta64[s]")
+
+
+def _chunks(total: int, size: int) -> Iterator[range]:
+    for lo in range(0, total, size):
+        yield range(lo, min(total, lo + size))
+
+
+def _member_ids(idx: np.ndarray) -> List[str]:
+    return [f"m{i:07d}" for i in idx.tolist()]
+
+
+def gym_fingerprint(scale: Scale, seed: int) -> str:
+    return json.dumps({"scale": asdict(scale), "seed": seed}, sort_keys=True)
+
+
+def stored_fingerprint(engine: Engine) -> Optional[str]:
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return conn.execute(select(ConfigEntry.value).where(ConfigEntry.key == GYM_KEY)).scalar_one_or_none()
+
+
+def is_empty(engine: Engine) -> bool:
+    """True when no members or events exist yet, so a synthetic gym will not mix with real rows."""
+    with engine.connect() as conn:
+        return all(conn.execute(select(model.id).limit(1)).first() is None for model in (Member, Event))
+
+
+def build_gym(
+    engine: Engine,
+    scale: Scale,
+    seed: int = 0,
+    chunk_size: int = 50_000,
+    progress: Optional[Callable[[str, int], None]] = None,
+) -> Dict[str, int]:
+    """Create the schema and insert a synthetic gym of `scale` into an empty database; returns rows per table."""
+    if scale.bookings > scale.events * scale.members:
+        raise ValueError("bookings must fit in events x members without repeating a member per event")
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(seed)
+    counts: Dict[str, int] = {}
+
+    def load(conn, model, rows: List[dict]) -> None:
+        if rows:
+            conn.execute(insert(model.__table__), rows)
+        counts[model.__tablename__] = counts.get(model.__tablename__, 0) + len(rows)
+        if progress is not None:
+            progress(model.__tablename__, counts[model.__tablename__])
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        load(conn, ClassType, [{"id": ct, "name": ct.replace("_", " ").title()} for ct in CLASS_TYPES])
+        load(conn, FacebookCampaign, [{"id": c, "name": c, "platform": "facebook"} for c in CAMPAIGNS])
+
+        for part in _chunks(scale.members, chunk_size):
+            n = len(part)
+            idx = np.arange(part.start, part.stop)
+            joined = _stamps(rng, n).astype("datetime64[D]").tolist()
+            dob = (np.datetime64("1960-01-01") + rng.integers(0, 45 * 365, size=n).astype("timedelta64[D]")).tolist()
+            gender = rng.choice(np.array(["male", "female", "other"]), size=n, p=[0.6, 0.35, 0.05]).tolist()
+            status = np.where(rng.random(n) < 0.9, "active", "inactive").tolist()
+            source = rng.choice(np.array(SOURCES), size=n).tolist()
+            campaign = rng.choice(np.array(CAMPAIGNS), size=n).tolist()
+            from_campaign = (rng.random(n) < 0.3).tolist()
+            load(
+                conn,
+                Member,
+                [
+                    {
+                        "id": member_id,
+                        "full_name": f"Member {i}",
+                        "gender": gender[k],
+                        "dob": dob[k],
+                        "join_date": joined[k],
+                        "status": status[k],
+                        "source": "facebook" if from_campaign[k] else source[k],
+                        "facebook_campaign_id": campaign[k] if from_campaign[k] else None,
+                    }
+                    for k, (i, member_id) in enumerate(zip(idx.tolist(), _member_ids(idx)))
+                ],
+            )
+
+        # Sessions start on the hour between 06:00 and 21:00
+        event_days = rng.integers(0, SPAN_DAYS, size=scale.events)
+        event_start = (
+            np.datetime64(START, "s")
+            + (event_days * 86400 + rng.integers(6, 22, size=scale.events) * 3600).astype("timedelta64[s]")
+        )
+        event_class = rng.integers(0, len(CLASS_TYPES), size=scale.events)
+        event_capacity = rng.integers(8, 31, size=scale.events)
+        for part in _chunks(scale.events, chunk_size):
+            starts = event_start[part.start : part.stop].tolist()
+            load(
+                conn,
+                Event,
+                [
+                    {
+                        "id": f"e{i:07d}",
+                        "name": f"{CLASS_TYPES[int(event_class[i])]} #{i}",
+                        "class_type_id": CLASS_TYPES[int(event_class[i])],
+                        "start": start,
+                        "end": start + timedelta(hours=1),
+                        "recurrence": "none",
+                        "capacity": int(event_capacity[i]),
+                    }
+                    for i, start in zip(part, starts)
+                ],
+            )
+
+        for part in _chunks(scale.bookings, chunk_size):
+            j = np.arange(part.start, part.stop)
+            event_idx = j % scale.events
+            members = (event_idx * 7919 + j // scale.events) % scale.members
+            created = event_start[event_idx] - rng.integers(3600, 14 * 86400, size=len(j)).astype("timedelta64[s]")
+            status = rng.choice(np.array(["approved", "pending", "cancelled"]), size=len(j), p=[0.8, 0.1, 0.1])
+            load(
+                conn,
+                Booking,
+                [
+                    {"id": f"b{b:08d}", "event_id": f"e{e:07d}", "member_id": m, "status": s, "created_at": c}
+                    for b, e, m, s, c in zip(
+                        j.tolist(), event_idx.tolist(), _member_ids(members), status.tolist(), created.tolist()
+                    )
+                ],
+            )
+
+        for part in _chunks(scale.visits, chunk_size):
+            n = len(part)
+            members = _member_ids(rng.integers(0, scale.members, size=n))
+            ts = _stamps(rng, n).tolist()
+            source = np.where(rng.random(n) < 0.7, "qr_checkin", "booking_approve").tolist()
+            load(
+                conn,
+                MemberVisit,
+                [{"ts": t, "member_id": m, "source": s} for t, m, s in zip(ts, members, source)],
+            )
+
+        for part in _chunks(scale.payments, chunk_size):
+            n = len(part)
+            idx = np.arange(part.start, part.stop)
+            amount = rng.choice(np.array([2500, 5000, 8000]), size=n)
+            roll = rng.random(n)
+            status = np.where(roll < 0.92, "succeeded", np.where(roll < 0.96, "failed", "created"))
+            refunded = (status == "succeeded") & (idx % 20 == 0)
+            created = _stamps(rng, n)
+            members = _member_ids(rng.integers(0, scale.members, size=n))
+            load(
+                conn,
+                Payment,
+                [
+                    {
+                        "id": f"p{i:08d}",
+                        "member_id": m,
+                        "amount_cents": a,
+                        "status": s,
+                        "created_at": c,
+                        "refunded_amount_cents": a // 2 if r else 0,
+                    }
+                    for i, m, a, s, c, r in zip(
+                        idx.tolist(), members, amount.tolist(), status.tolist(), created.tolist(), refunded.tolist()
+                    )
+                ],
+            )
+            refund_at = (created + np.timedelta64(3, "D")).tolist()
+            load(
+                conn,
+                Refund,
+                [
+                    {
+                        "id": f"r{i:08d}",
+                        "payment_id": f"p{i:08d}",
+                        "amount_cents": int(amount[k]) // 2,
+                        "status": "succeeded",
+                        "created_at": refund_at[k],
+                    }
+                    for k, i in enumerate(idx.tolist())
+                    if refunded[k]
+                ],
+            )
+
+        for part in _chunks(scale.messages, chunk_size):
+            n = len(part)
+            idx = np.arange(part.start, part.stop)
+            created = _stamps(rng, n)
+            members = _member_ids(rng.integers(0, scale.members, size=n))
+            errored = (rng.random(n) < 0.03).tolist()
+            read = (rng.random(n) < 0.5).tolist()
+            load(
+                conn,
+                WhatsAppMessage,
+                [
+                    {"id": f"w{i:08d}", "created_at": c, "member_id": m, "content": "Class reminder", "status": "sent"}
+                    for i, c, m in zip(idx.tolist(), created.tolist(), members)
+                ],
+            )
+            events: List[dict] = []
+            for k, (i, c) in enumerate(zip(idx.tolist(), created.tolist())):
+                message_id = f"w{i:08d}"
+                events.append({"message_id": message_id, "status": "sent", "created_at": c + timedelta(seconds=5)})
+                second = "error" if errored[k] else "delivered"
+                events.append({"message_id": message_id, "status": second, "created_at": c + timedelta(minutes=1)})
+                if read[k] and not errored[k]:
+                    events.append({"message_id": message_id, "status": "read", "created_at": c + timedelta(hours=2)})
+            load(conn, WhatsAppStatusEvent, events)
+
+        conn.execute(insert(ConfigEntry.__table__).values(key=GYM_KEY, value=gym_fingerprint(scale, seed)))
+    return counts
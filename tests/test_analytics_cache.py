@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app import analytics_cache
+from app.analytics_cache import cached, clear_cache, table_version
+from app.config import get_settings
+from app.models import Payment
+from app.routers.analytics import TOTALS_TABLES
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    clear_cache()
+    return TestClient(app)
+
+
+def test_commit_bumps_versions_only_for_written_tables(client: TestClient) -> None:
+    payments_before = table_version("payments")
+    members_before = table_version("members")
+    db = SessionLocal()
+    try:
+        db.add(Payment(id=str(uuid.uuid4()), amount_cents=100))
+        db.commit()
+        assert table_version("payments") == payments_before + 1
+        db.add(Payment(id=str(uuid.uuid4()), amount_cents=100))
+        db.flush()
+        db.rollback()
+        assert table_version("payments") == payments_before + 1
+    finally:
+        db.close()
+    assert table_version("members") == members_before
+
+
+def test_totals_are_cached_until_a_write(client: TestClient) -> None:
+    first = client.get("/api/analytics.totals", headers=_auth_headers()).json()
+    calls = []
+    # A hit does not recompute
+    assert cached(("analytics.totals",), TOTALS_TABLES, lambda: calls.append(1)) == first
+    assert calls == []
+
+    r = client.post(
+        "/api/payments.create", json={"amount_cents": 2500}, headers=_auth_headers()
+    )
+    assert r.status_code == 200, r.text
+    second = client.get("/api/analytics.totals", headers=_auth_headers()).json()
+    assert second["payments"] == first["payments"] + 1
+
+
+def test_concurrent_misses_compute_once(client: TestClient) -> None:
+    calls = []
+
+    def slow() -> int:
+        calls.append(1)
+        time.sleep(0.1)
+        return 42
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cached(("coalesce",), ("payments",), slow))) for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [42] * 8
+    assert len(calls) == 1
+
+
+def test_cache_evicts_least_recently_used(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("APP_ANALYTICS_CACHE_MAX_ENTRIES", "2")
+    get_settings.cache_clear()
+    try:
+        calls = []
+        for key in ("a", "b", "a", "c"):
+            cached(("lru", key), ("payments",), lambda: calls.append(key) or key)
+        assert calls == ["a", "b", "c"]
+        # "b" was least recently used when "c" arrived: it and its lock are gone, "a" is still a hit
+        assert set(analytics_cache._entries) == {("lru", "a"), ("lru", "c")}
+        assert set(analytics_cache._key_locks) == {("lru", "a"), ("lru", "c")}
+        assert cached(("lru", "a"), ("payments",), lambda: calls.append("again")) == "a"
+        assert calls == ["a", "b", "c"]
+    finally:
+        monkeypatch.delenv("APP_ANALYTICS_CACHE_MAX_ENTRIES")
+        get_settings.cache_clear()
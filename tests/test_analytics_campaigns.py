@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.analytics_campaigns import claim_dirty_days, ensure_campaign_stats, rebuild_campaign_stats
+from app.models import (
+    Booking,
+    CampaignDailyStats,
+    Event,
+    FacebookCampaign,
+    Member,
+    MemberVisit,
+    Payment,
+    Refund,
+)
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _report(client: TestClient, campaign_id: str) -> dict:
+    r = client.get(
+        "/api/analytics.campaigns",
+        params={"start": "2004-05-01", "end": "2004-05-31", "campaign_id": campaign_id, "daily": "true"},
+        headers=_auth_headers(),
+    )
+    assert r.status_code == 200, r.text
+    campaigns = r.json()["campaigns"]
+    assert len(campaigns) == 1
+    return campaigns[0]
+
+
+def _stats(db, campaign_id: str) -> list:
+    rows = db.execute(
+        select(CampaignDailyStats)
+        .where(CampaignDailyStats.campaign_id == campaign_id)
+        .order_by(CampaignDailyStats.day)
+    ).scalars()
+    return [(r.day, r.members_acquired, r.members_converted, r.visits, r.revenue_cents) for r in rows]
+
+
+def test_campaign_rollup_tracks_writes_by_dirty_day(client: TestClient) -> None:
+    campaign_id = f"fb_{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        db.add(FacebookCampaign(id=campaign_id, name="Spring promo"))
+        members = [
+            Member(
+                id=str(uuid.uuid4()),
+                full_name=f"Lead {i}",
+                join_date=date(2004, 5, 1),
+                facebook_campaign_id=campaign_id,
+            )
+            for i in range(2)
+        ]
+        event = Event(
+            id=str(uuid.uuid4()),
+            name="Intro",
+            class_type_id="ct_intro",
+            start=datetime(2004, 5, 2),
+            end=datetime(2004, 5, 2, 1),
+        )
+        payment = Payment(
+            id=str(uuid.uuid4()), member_id=members[0].id, amount_cents=5000, created_at=datetime(2004, 5, 2, 10)
+        )
+        db.add_all([*members, event, payment])
+        db.flush()
+        db.add_all(
+            [
+                Booking(id=str(uuid.uuid4()), event_id=event.id, member_id=members[0].id),
+                MemberVisit(member_id=members[0].id, ts=datetime(2004, 5, 2, 18), source="qr"),
+                MemberVisit(member_id=members[1].id, ts=datetime(2004, 5, 2, 19), source="qr"),
+                Refund(
+                    id=str(uuid.uuid4()), payment_id=payment.id, amount_cents=1000, created_at=datetime(2004, 5, 3)
+                ),
+            ]
+        )
+        db.commit()
+        ensure_campaign_stats(db)
+
+        report = _report(client, campaign_id)
+        assert report["name"] == "Spring promo"
+        assert (report["members_acquired"], report["members_converted"]) == (2, 1)
+        assert (report["visits"], report["revenue_cents"], report["conversion_rate"]) == (2, 4000, 0.5)
+        assert [d["day"] for d in report["days"]] == ["2004-05-01", "2004-05-02", "2004-05-03"]
+
+        # A first booking for the second lead only dirties their join day
+        db.add(Booking(id=str(uuid.uuid4()), event_id=event.id, member_id=members[1].id))
+        db.commit()
+        # A claim takes each mark once; rolling it back hands the mark to the next reader
+        assert claim_dirty_days(db) == [date(2004, 5, 1)]
+        assert claim_dirty_days(db) == []
+        db.rollback()
+        assert ensure_campaign_stats(db) == {"rebuilt_days": 1}
+        assert _report(client, campaign_id)["members_converted"] == 2
+
+        incremental = _stats(db, campaign_id)
+        rebuild_campaign_stats(db)
+        db.commit()
+        assert _stats(db, campaign_id) == incremental
+
+        # Moving a member to another campaign rewrites their whole history
+        members[1].facebook_campaign_id = None
+        db.commit()
+        assert ensure_campaign_stats(db)["rebuilt_days"] == -1
+        report = _report(client, campaign_id)
+        assert (report["members_acquired"], report["visits"]) == (1, 1)
+    finally:
+        db.close()
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.analytics_columnar import SPECS, ColumnarSnapshot, ColumnTable
+from app.database import Base, engine, SessionLocal
+from app.models import Booking, Event, Payment
+
+
+API_TOKEN = "dev-token"
+CLASS_TYPE = "ct_columnar_sparring"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _query(client: TestClient, **params) -> dict:
+    r = client.get("/api/analytics.query", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _seed_bookings(db) -> List[Booking]:
+    bookings = []
+    # Mon 1998-03-02 18:00, Mon 18:00 a week later, Wed 1998-03-04 07:00
+    for i, start in enumerate((datetime(1998, 3, 2, 18), datetime(1998, 3, 9, 18), datetime(1998, 3, 4, 7))):
+        ev = Event(
+            id=str(uuid.uuid4()), name="Sparring", class_type_id=CLASS_TYPE, start=start, end=start + timedelta(hours=1)
+        )
+        db.add(ev)
+        for member in range(i + 1):
+            bookings.append(
+                Booking(id=str(uuid.uuid4()), event_id=ev.id, member_id=f"mem_col_{member}", status="approved")
+            )
+    db.add_all(bookings)
+    db.commit()
+    return bookings
+
+
+def test_bookings_by_hour_of_week_track_writes(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        bookings = _seed_bookings(db)
+        params = {
+            "table": "bookings",
+            "where": f"class_type_id={CLASS_TYPE},status=approved",
+            "group_by": "hour_of_week",
+        }
+        body = _query(client, **params)
+        assert {g["hour_of_week"]: g["value"] for g in body["groups"]} == {18: 3, 2 * 24 + 7: 3}
+
+        bookings[0].status = "cancelled"
+        db.delete(bookings[-1])
+        db.commit()
+        body = _query(client, **params)
+        assert {g["hour_of_week"]: g["value"] for g in body["groups"]} == {18: 2, 2 * 24 + 7: 2}
+
+        body = _query(
+            client, table="bookings", where=f"class_type_id={CLASS_TYPE}", group_by="status", agg="distinct_members"
+        )
+        assert {g["status"]: g["value"] for g in body["groups"]} == {"approved": 2, "cancelled": 1}
+
+        for booking in bookings[:-1]:
+            db.delete(booking)
+        db.commit()
+        assert _query(client, **params)["groups"] == []
+    finally:
+        db.close()
+
+
+def test_only_joined_event_columns_reload_bookings(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        bookings = _seed_bookings(db)
+        params = {"table": "bookings", "where": f"class_type_id={CLASS_TYPE}", "group_by": "status"}
+        assert _query(client, **params)["groups"] == [{"status": "approved", "value": 6}]
+        statements: List[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        # A new event and a renamed one change nothing the snapshot stores
+        start = datetime(1998, 3, 16, 18)
+        end = start + timedelta(hours=1)
+        db.add(Event(id=str(uuid.uuid4()), name="Pads", class_type_id=CLASS_TYPE, start=start, end=end))
+        moved = db.get(Event, bookings[0].event_id)
+        moved.name = "Sparring (renamed)"
+        db.commit()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            _query(client, **params)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert statements == []
+
+        # Moving an event to another class type reloads the joined column
+        moved.class_type_id = "ct_columnar_pads"
+        db.commit()
+        assert _query(client, **params)["groups"] == [{"status": "approved", "value": 5}]
+    finally:
+        for booking in bookings:
+            db.delete(booking)
+        db.commit()
+        db.close()
+
+
+def test_warm_queries_do_not_touch_the_database(client: TestClient) -> None:
+    _query(client, table="payments", group_by="status", agg="sum")
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        body = _query(client, table="payments", group_by="status", agg="sum")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert statements == []
+
+    db = SessionLocal()
+    try:
+        expected = {
+            status: int(total)
+            for status, total in db.execute(
+                select(Payment.status, func.sum(Payment.amount_cents)).group_by(Payment.status)
+            )
+        }
+    finally:
+        db.close()
+    assert {g["status"]: g["value"] for g in body["groups"]} == expected
+
+
+def test_payments_day_buckets_and_errors(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        rows = [
+            Payment(id=str(uuid.uuid4()), amount_cents=amount, status="succeeded", created_at=ts)
+            for amount, ts in (
+                (100, datetime(1997, 5, 1, 9)),
+                (300, datetime(1997, 5, 1, 23)),
+                (50, datetime(1997, 5, 3)),
+            )
+        ]
+        db.add_all(rows)
+        db.commit()
+        body = _query(
+            client, table="payments", start="1997-05-01T00:00:00", end="1997-05-31T00:00:00", group_by="day", agg="avg"
+        )
+        assert body["groups"] == [{"day": "1997-05-01", "value": 200.0}, {"day": "1997-05-03", "value": 50.0}]
+        assert body["matched"] == 3
+        for row in rows:
+            db.delete(row)
+        db.commit()
+    finally:
+        db.close()
+
+    for params in (
+        {"table": "members"},
+        {"table": "refunds", "agg": "distinct_members"},
+        {"table": "bookings", "agg": "sum"},
+        {"table": "bookings", "where": "nope=1"},
+        {"table": "bookings", "where": "status"},
+        {"table": "visits", "group_by": "amount_cents"},
+    ):
+        assert client.get("/api/analytics.query", params=params, headers=_auth_headers()).status_code == 400
+
+
+def test_grouping_by_high_cardinality_columns_counts_only_present_keys() -> None:
+    # 2,500 members x 3,000 events x 168 hours would be ~1.3e9 bincount slots (~10 GiB)
+    table = ColumnTable(SPECS["bookings"])
+    start = datetime(1998, 3, 2, 18)
+    table.upsert(
+        SimpleNamespace(
+            _mapping={
+                "id": f"b{i}",
+                "created_at": start,
+                "event_start": start + timedelta(hours=i % 2),
+                "member_id": f"m{i % 2500}",
+                "event_id": f"e{i % 3000}",
+                "class_type_id": CLASS_TYPE,
+                "status": "approved",
+            }
+        )
+        for i in range(5000)
+    )
+    snapshot = ColumnarSnapshot()
+    snapshot.tables = {"bookings": table}
+
+    result = snapshot.query("bookings", group_by=("member_id", "event_id", "hour_of_week"))
+    assert result.matched == 5000 and len(result.groups) == 5000
+    assert result.groups[0] == {"member_id": "m0", "event_id": "e0", "hour_of_week": 18, "value": 1}
+
+    result = snapshot.query("bookings", group_by=("event_id", "hour_of_week"), agg="distinct_members")
+    assert {(g["event_id"], g["hour_of_week"]): g["value"] for g in result.groups}[("e1", 19)] == 2
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.analytics_math import change, compute_revenue_cents, previous_window, window_pair
+from app.analytics_rollups import ensure_rollups, window_totals
+from app.database import Base, engine, SessionLocal
+from app.models import FacebookCampaign, Member, Payment, Refund
+
+
+API_TOKEN = "dev-token"
+CAMPAIGN = "fb_compare_spring"
+# Current window 1992-03-11 .. 1992-03-21 00:00; previous window 1992-03-01 .. 1992-03-11 (exclusive)
+START, END = datetime(1992, 3, 11), datetime(1992, 3, 21)
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _seed(db) -> List[object]:
+    member = Member(
+        id=str(uuid.uuid4()), full_name="Compare Member", join_date=date(1992, 3, 5), facebook_campaign_id=CAMPAIGN
+    )
+    payments = [
+        Payment(id=str(uuid.uuid4()), member_id=member.id, amount_cents=amount, status="succeeded", created_at=ts)
+        for amount, ts in (
+            (200, datetime(1992, 3, 5, 9)),
+            (300, datetime(1992, 3, 10, 23)),
+            (500, datetime(1992, 3, 15, 12)),
+            (100, END),  # the current window's end is inclusive
+        )
+    ]
+    refund = Refund(id=str(uuid.uuid4()), payment_id=payments[2].id, amount_cents=50, created_at=datetime(1992, 3, 16))
+    rows = [FacebookCampaign(id=CAMPAIGN, name="Spring"), member, *payments, refund]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+
+def test_change_and_previous_window() -> None:
+    assert previous_window(START, END) == (datetime(1992, 3, 1), START)
+    assert change(150, 100) == {"current": 150, "previous": 100, "delta": 50, "pct_change": 50.0}
+    assert change(5, 0)["pct_change"] is None
+    assert change(None, 0.5)["delta"] is None
+
+
+def test_window_pair_reads_both_windows_in_one_statement(client: TestClient) -> None:
+    db = SessionLocal()
+    rows = _seed(db)
+    try:
+        ensure_rollups(db)
+        statements: List[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            current, previous = window_pair(db, "payments", START, END)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert len(statements) == 1
+        assert current == window_totals(db, "payments", START, END) == (2, 600)
+        assert previous == (2, 500)
+        assert compute_revenue_cents(db, START, END) == 550
+
+        r = client.get(
+            "/api/analytics.compare",
+            params={"start": START.isoformat(), "end": END.isoformat()},
+            headers=_auth_headers(),
+        )
+        assert r.status_code == 200, r.text
+        body = r.json()
+        assert body["previous_start"] == "1992-03-01T00:00:00"
+        assert body["metrics"]["revenue_cents"] == {"current": 550, "previous": 500, "delta": 50, "pct_change": 10.0}
+        refund_rate = body["metrics"]["refund_rate"]
+        assert refund_rate["current"] == pytest.approx(50 / 600) and refund_rate["previous"] == 0.0
+
+        r = client.get(
+            "/api/analytics.campaigns",
+            params={"start": "1992-03-11", "end": "1992-03-20", "campaign_id": CAMPAIGN, "compare": "true"},
+            headers=_auth_headers(),
+        )
+        assert r.status_code == 200, r.text
+        body = r.json()
+        assert (body["previous_start"], body["previous_end"]) == ("1992-03-01", "1992-03-10")
+        (campaign,) = body["campaigns"]
+        assert (campaign["revenue_cents"], campaign["previous"]["revenue_cents"]) == (450, 500)
+        assert campaign["change"]["revenue_cents"] == {
+            "current": 450,
+            "previous": 500,
+            "delta": -50,
+            "pct_change": -10.0,
+        }
+        assert (campaign["members_acquired"], campaign["previous"]["members_acquired"]) == (0, 1)
+
+        params = {"start": END.isoformat(), "end": START.isoformat()}
+        assert client.get("/api/analytics.compare", params=params, headers=_auth_headers()).status_code == 400
+
+        # Aware bounds are read as UTC; an aware start without end is compared with naive "now"
+        params = {"start": START.isoformat() + "Z", "end": (END + timedelta(hours=2)).isoformat() + "+02:00"}
+        r = client.get("/api/analytics.compare", params=params, headers=_auth_headers())
+        assert r.status_code == 200, r.text
+        assert r.json()["start"] == START.isoformat() and r.json()["end"] == END.isoformat()
+        assert r.json()["metrics"]["revenue_cents"]["current"] == 550
+        r = client.get("/api/analytics.compare", params={"start": START.isoformat() + "Z"}, headers=_auth_headers())
+        assert r.status_code == 200, r.text
+    finally:
+        for row in reversed(rows):
+            db.delete(row)
+        db.commit()
+        db.close()
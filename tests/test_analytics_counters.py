@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, func, insert, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.analytics_cache import clear_cache
+from app.analytics_counters import INITIALIZED, read_counters, rebuild_counters
+from app.models import AnalyticsCounter, MemberVisit, Payment, Refund, WhatsAppStatusEvent
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    clear_cache()
+    return TestClient(app)
+
+
+def _truth(db) -> Dict[str, int]:
+    def count(model, *where) -> int:
+        return db.execute(select(func.count()).select_from(model).where(*where)).scalar_one()
+
+    return {
+        "payments": count(Payment),
+        "refunds": count(Refund),
+        "member_visits": count(MemberVisit),
+        "whatsapp.delivered": count(WhatsAppStatusEvent, WhatsAppStatusEvent.status == "delivered"),
+        "whatsapp.read": count(WhatsAppStatusEvent, WhatsAppStatusEvent.status == "read"),
+    }
+
+
+def test_counters_track_inserts_status_changes_and_deletes(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        rebuild_counters(db)
+        db.commit()
+        pay_id = str(uuid.uuid4())
+        db.add(Payment(id=pay_id, amount_cents=900))
+        db.add(Refund(id=str(uuid.uuid4()), payment_id=pay_id, amount_cents=100))
+        db.add(MemberVisit(member_id="mem_counter", source="test"))
+        status_event = WhatsAppStatusEvent(message_id="msg_counter", status="delivered")
+        db.add(status_event)
+        db.commit()
+        assert read_counters(db) == _truth(db)
+
+        status_event.status = "read"
+        db.commit()
+        assert read_counters(db) == _truth(db)
+
+        db.delete(status_event)
+        db.commit()
+        assert read_counters(db) == _truth(db)
+
+        before = read_counters(db)
+        db.add(Payment(id=str(uuid.uuid4()), amount_cents=1))
+        db.flush()
+        db.rollback()
+        assert read_counters(db) == before
+    finally:
+        db.close()
+
+
+def test_bulk_writes_invalidate_counters(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        rebuild_counters(db)
+        db.commit()
+        db.execute(insert(MemberVisit), [{"member_id": "mem_counter_bulk", "source": "test"} for _ in range(3)])
+        db.commit()
+        assert db.get(AnalyticsCounter, INITIALIZED) is None
+        assert read_counters(db) == _truth(db)
+
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id == "mem_counter_bulk"))
+        db.commit()
+        assert db.get(AnalyticsCounter, INITIALIZED) is None
+        assert read_counters(db) == _truth(db)
+    finally:
+        db.close()
+
+
+def test_totals_read_counters_in_one_statement(client: TestClient) -> None:
+    client.get("/api/analytics.totals", headers=_auth_headers())
+    clear_cache()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        data = client.get("/api/analytics.totals", headers=_auth_headers()).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert len(statements) == 1
+    db = SessionLocal()
+    try:
+        truth = _truth(db)
+    finally:
+        db.close()
+    assert data["payments"] == truth["payments"]
+    assert data["whatsapp_delivered_or_read"] == truth["whatsapp.delivered"] + truth["whatsapp.read"]
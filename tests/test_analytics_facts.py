@@ -1,10 +1,14 @@
 from __future__ import annotations
 
 import sys
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, List
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
@@ -12,7 +16,19 @@ if str(ROOT) not in sys.path:
 
 from app.main import app
 from app.database import Base, engine, SessionLocal
-from app.models import Member, Event, Booking, ClassType, Group, FacebookCampaign
+from app.analytics_facts import FACTS_STATEMENTS, compute_facts
+from app.models import (
+    Member,
+    Event,
+    Booking,
+    ClassType,
+    Group,
+    FacebookCampaign,
+    Payment,
+    Refund,
+    WhatsAppMessage,
+    WhatsAppStatusEvent,
+)
 
 
 API_TOKEN = "dev-token"
@@ -48,3 +64,52 @@ def test_analytics_summary_includes_facts(client: TestClient) -> None:
     assert "payments" in data and "refunds" in data and "whatsapp_delivered_or_read" in data
 
 
+@contextmanager
+def _count_statements() -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_compute_facts_uses_fixed_statement_count(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        pay_id = str(uuid.uuid4())
+        msg_id = str(uuid.uuid4())
+        db.add(Payment(id=pay_id, amount_cents=1500, status="succeeded"))
+        db.add(Refund(id=str(uuid.uuid4()), payment_id=pay_id, amount_cents=500))
+        db.add(WhatsAppMessage(id=msg_id, content="hi"))
+        db.flush()
+        for status in ["delivered", "read", "error"]:
+            db.add(WhatsAppStatusEvent(message_id=msg_id, status=status))
+        db.commit()
+
+        with _count_statements() as statements:
+            facts = compute_facts(db)
+        assert len(statements) == FACTS_STATEMENTS
+
+        def count(model, *where) -> int:
+            return db.execute(select(func.count()).select_from(model).where(*where)).scalar_one()
+
+        assert facts["members"]["total"] == count(Member)
+        assert facts["events"]["total"] == count(Event)
+        assert facts["bookings"]["total"] == count(Booking)
+        assert facts["payments"]["count"] == count(Payment)
+        assert facts["payments"]["gross_amount_cents"] == db.execute(
+            select(func.coalesce(func.sum(Payment.amount_cents), 0))
+        ).scalar_one()
+        assert facts["refunds"]["count"] == count(Refund)
+        assert facts["whatsapp"]["messages_total"] == count(WhatsAppMessage)
+        for status in ["delivered", "read", "error"]:
+            assert facts["whatsapp"][status] == count(WhatsAppStatusEvent, WhatsAppStatusEvent.status == status)
+        assert facts["whatsapp"]["status_events_total"] == count(WhatsAppStatusEvent)
+        assert facts["whatsapp"]["distinct_statused_messages"] >= 1
+    finally:
+        db.close()
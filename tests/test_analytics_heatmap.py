@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, insert, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app import analytics_heatmap
+from app.analytics_heatmap import READY_KEY, decode, encode, rebuild_heatmap
+from app.config import get_settings
+from app.database import Base, engine, SessionLocal, insert_or_ignore
+from app.models import Booking, ConfigEntry, Event, MemberVisit, OccupancyHeatmap
+
+
+API_TOKEN = "dev-token"
+CLASS_TYPE = "ct_heatmap_boxing"
+TUESDAY, SATURDAY = 1, 5
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    # Drop settings cached by earlier modules (e.g. a low rate limit)
+    get_settings.cache_clear()  # type: ignore[attr-defined]
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _heatmap(client: TestClient, **params) -> dict:
+    r = client.get("/api/analytics.heatmap", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _ready(db) -> str:
+    db.expire_all()
+    return db.execute(select(ConfigEntry.value).where(ConfigEntry.key == READY_KEY)).scalar_one_or_none()
+
+
+def test_heatmap_tracks_bookings_and_checkins(client: TestClient) -> None:
+    june = {"start": "1993-06-01", "end": "1993-06-30", "class_type_id": CLASS_TYPE}
+    db = SessionLocal()
+    try:
+        assert _heatmap(client, **june)["class_types"] == []
+        ready = _ready(db)
+
+        # Tue 1993-06-01 18:00 and Sat 1993-06-19 09:00
+        events = [
+            Event(
+                id=str(uuid.uuid4()), name="Boxing", class_type_id=CLASS_TYPE, start=start, end=start + timedelta(hours=1)
+            )
+            for start in (datetime(1993, 6, 1, 18), datetime(1993, 6, 19, 9))
+        ]
+        db.add_all(events)
+        bookings = [
+            Booking(id=str(uuid.uuid4()), event_id=events[i].id, member_id=f"mem_heat_{n}", status=status)
+            for n, (i, status) in enumerate(((0, "approved"), (0, "approved"), (0, "pending"), (1, "approved")))
+        ]
+        db.add_all(bookings)
+        db.add(MemberVisit(ts=datetime(1993, 6, 1, 18, 5), member_id="mem_heat_0", source="qr_checkin"))
+        db.add(MemberVisit(ts=datetime(1993, 6, 1, 18), member_id="mem_heat_1", source="booking_approve"))
+        db.commit()
+
+        body = _heatmap(client, **june)
+        assert body["class_types"] == [CLASS_TYPE]
+        assert body["weekdays"][TUESDAY] == "Tue"
+        grid = body["bookings"][0]
+        assert (grid[TUESDAY][18], grid[SATURDAY][9], body["bookings_total"]) == (2, 1, 3)
+
+        bookings[2].status = "approved"
+        db.commit()
+        bookings[0].status = "cancelled"
+        db.delete(bookings[3])
+        db.commit()
+        body = _heatmap(client, **june)
+        assert (body["bookings"][0][TUESDAY][18], body["bookings_total"]) == (2, 2)
+        # Served from grids updated in place, not a rebuild
+        assert _ready(db) == ready
+
+        # Partial months come from raw rows: only the Tuesday falls in 1993-05-20 .. 1993-06-10
+        partial = _heatmap(client, start="1993-05-20", end="1993-06-10", class_type_id=CLASS_TYPE)
+        assert partial["bookings_total"] == 2
+
+        walk_ins = _heatmap(client, start="1993-06-01", end="1993-06-01")
+        assert walk_ins["checkins_total"] == 1
+        assert walk_ins["checkins"][walk_ins["class_types"].index("")][TUESDAY][18] == 1
+
+        rebuild_heatmap(db)
+        db.commit()
+        assert _heatmap(client, **june)["bookings"] == body["bookings"]
+
+        params = {"start": "1993-06-02", "end": "1993-06-01"}
+        r = client.get("/api/analytics.heatmap", params=params, headers=_auth_headers())
+        assert r.status_code == 400
+    finally:
+        db.execute(delete(Booking).where(Booking.member_id.like("mem_heat_%")))
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_heat_%")))
+        db.execute(delete(Event).where(Event.class_type_id == CLASS_TYPE))
+        db.commit()
+        db.close()
+
+
+def test_concurrently_created_grid_gets_the_delta_added(client: TestClient, monkeypatch) -> None:
+    def raced(conn, table, row):
+        # A concurrent first approval in this (month, class type) creates the grid just before us
+        other = np.zeros((7, 24), dtype=np.int64)
+        other[TUESDAY, 18] = 1
+        conn.execute(insert(table).values(**{**row, "counts": encode(other)}))
+        return insert_or_ignore(conn, table, row)
+
+    db = SessionLocal()
+    try:
+        _heatmap(client, start="1993-08-01", end="1993-08-31")
+        start = datetime(1993, 8, 3, 18)  # Tuesday
+        event = Event(
+            id=str(uuid.uuid4()), name="Boxing", class_type_id=CLASS_TYPE, start=start, end=start + timedelta(hours=1)
+        )
+        db.add(event)
+        db.commit()
+        monkeypatch.setattr(analytics_heatmap, "insert_or_ignore", raced)
+        db.add(Booking(id=str(uuid.uuid4()), event_id=event.id, member_id="mem_heat_race", status="approved"))
+        db.commit()
+        key = ("1993-08", "bookings", CLASS_TYPE)
+        assert decode(db.get(OccupancyHeatmap, key).counts)[TUESDAY, 18] == 2
+    finally:
+        monkeypatch.undo()
+        db.execute(delete(Booking).where(Booking.member_id.like("mem_heat_%")))
+        db.execute(delete(Event).where(Event.class_type_id == CLASS_TYPE))
+        db.commit()
+        db.close()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, insert, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app import analytics_leaderboards
+from app.analytics_leaderboards import READY_KEY, streak_of, week_of
+from app.database import insert_or_ignore
+from app.config import get_settings
+from app.database import Base, engine, SessionLocal
+from app.models import ConfigEntry, MemberVisit, MemberVisitStreak
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    # Drop settings cached by earlier modules (e.g. a low rate limit)
+    get_settings.cache_clear()  # type: ignore[attr-defined]
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _get(client: TestClient, path: str, **params) -> dict:
+    r = client.get(path, params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _ours(members: List[dict]) -> List[dict]:
+    return [m for m in members if m["member_id"].startswith("mem_lb_")]
+
+
+def _ready(db) -> str:
+    db.expire_all()
+    return db.execute(select(ConfigEntry.value).where(ConfigEntry.key == READY_KEY)).scalar_one_or_none()
+
+
+def test_streak_of_counts_consecutive_weeks() -> None:
+    monday = datetime(1994, 1, 3).date()
+    weeks = [monday + timedelta(days=7 * k) for k in (0, 1, 3, 4, 5, 7)]
+    assert streak_of(weeks) == (weeks[-1], 1, 3)
+    assert streak_of(weeks[:-1]) == (weeks[-2], 3, 3)
+
+
+def test_top_visitors_follow_visit_writes(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        _get(client, "/api/analytics.top_visitors", month="1994-05")
+        ready = _ready(db)
+        assert ready is not None
+        visits = [
+            MemberVisit(ts=datetime(1994, 5, day, 18), member_id=member, source="qr_checkin")
+            for member, days in (("mem_lb_a", (2, 9, 16)), ("mem_lb_b", (3,)), ("mem_lb_c", (4, 11)))
+            for day in days
+        ]
+        db.add_all(visits)
+        db.commit()
+        body = _get(client, "/api/analytics.top_visitors", month="1994-05")
+        assert [(m["member_id"], m["visits"], m["rank"]) for m in body["members"]] == [
+            ("mem_lb_a", 3, 1),
+            ("mem_lb_c", 2, 2),
+            ("mem_lb_b", 1, 3),
+        ]
+        # Served from the incrementally maintained counters, not a rebuild
+        assert _ready(db) == ready
+
+        db.delete(visits[0])
+        db.commit()
+        body = _get(client, "/api/analytics.top_visitors", month="1994-05", limit=2)
+        assert [(m["member_id"], m["visits"]) for m in body["members"]] == [("mem_lb_a", 2), ("mem_lb_c", 2)]
+        everyone = _ours(_get(client, "/api/analytics.top_visitors", month="all", limit=200)["members"])
+        assert {m["member_id"]: m["visits"] for m in everyone} == {"mem_lb_a": 2, "mem_lb_b": 1, "mem_lb_c": 2}
+
+        assert client.get(
+            "/api/analytics.top_visitors", params={"month": "May"}, headers=_auth_headers()
+        ).status_code == 400
+    finally:
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_lb_%")))
+        db.commit()
+        db.close()
+    # The bulk cleanup clears the marker; the next read rebuilds without these members
+    db = SessionLocal()
+    try:
+        assert _ready(db) is None
+        assert _get(client, "/api/analytics.top_visitors", month="1994-05")["members"] == []
+    finally:
+        db.close()
+
+
+def test_weekly_streaks_advance_and_recompute_backdated_visits(client: TestClient) -> None:
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        _get(client, "/api/analytics.streaks")
+        for weeks_ago in (2, 1, 0, 0):
+            db.add(MemberVisit(ts=now - timedelta(days=7 * weeks_ago), member_id="mem_lb_x", source="qr_checkin"))
+            db.commit()
+        db.add_all(
+            MemberVisit(ts=now - timedelta(days=7 * weeks_ago), member_id="mem_lb_y", source="booking_approve")
+            for weeks_ago in (10, 9, 0)
+        )
+        db.commit()
+        current = {m["member_id"]: m for m in _ours(_get(client, "/api/analytics.streaks", limit=200)["members"])}
+        assert (current["mem_lb_x"]["current_weeks"], current["mem_lb_x"]["longest_weeks"]) == (3, 3)
+        assert (current["mem_lb_y"]["current_weeks"], current["mem_lb_y"]["longest_weeks"]) == (1, 2)
+
+        # Backdated visit: week -8 joins the -10/-9 run, recomputed from the member's visit weeks
+        db.add(MemberVisit(ts=now - timedelta(days=56), member_id="mem_lb_y", source="qr_checkin"))
+        db.commit()
+        longest = _ours(_get(client, "/api/analytics.streaks", kind="longest", limit=200)["members"])
+        assert {m["member_id"]: m["longest_weeks"] for m in longest} == {"mem_lb_x": 3, "mem_lb_y": 3}
+
+        assert client.get("/api/analytics.streaks", params={"kind": "best"}, headers=_auth_headers()).status_code == 400
+    finally:
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_lb_%")))
+        db.commit()
+        db.close()
+
+
+def test_first_streak_row_stored_concurrently_is_recomputed(client: TestClient, monkeypatch) -> None:
+    now = datetime.utcnow()
+
+    def raced(conn, table, row):
+        # Another transaction stores this member's first streak (with a stale run) just before us
+        stale = {**row, "current_weeks": 9, "longest_weeks": 9}
+        conn.execute(insert(table).values(**stale))
+        return insert_or_ignore(conn, table, row)
+
+    db = SessionLocal()
+    try:
+        _get(client, "/api/analytics.streaks")
+        db.add(MemberVisit(ts=now - timedelta(days=7), member_id="mem_lb_race", source="qr_checkin"))
+        db.commit()
+        db.execute(delete(MemberVisitStreak).where(MemberVisitStreak.member_id == "mem_lb_race"))
+        db.commit()
+        monkeypatch.setattr(analytics_leaderboards, "insert_or_ignore", raced)
+        db.add(MemberVisit(ts=now, member_id="mem_lb_race", source="qr_checkin"))
+        db.commit()
+        db.expire_all()
+        row = db.get(MemberVisitStreak, "mem_lb_race")
+        assert (row.last_week, row.current_weeks, row.longest_weeks) == (week_of(now), 2, 2)
+    finally:
+        monkeypatch.undo()
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_lb_%")))
+        db.commit()
+        db.close()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.analytics_facts import compute_facts
+from app.analytics_kpis import compute_kpis
+from app.analytics_metrics import METRICS, SUMMARY_FIELDS, MetricEvaluator
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+@contextmanager
+def _count_statements() -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_shared_base_aggregates_run_once(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        evaluator = MetricEvaluator(db)
+        evaluator.evaluate(SUMMARY_FIELDS.values())
+        assert len(evaluator.evaluated) == len(set(evaluator.evaluated))
+        # payments.scan feeds totals, facts and kpis but is evaluated a single time
+        assert evaluator.evaluated.count("payments.scan") == 1
+        assert {"totals", "facts", "kpis"} <= set(evaluator.evaluated)
+        assert evaluator.get("facts") == compute_facts(db)
+        assert evaluator.get("kpis") == compute_kpis(db)
+    finally:
+        db.close()
+
+
+def test_unrequested_metrics_are_not_computed(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        evaluator = MetricEvaluator(db)
+        with _count_statements() as statements:
+            evaluator.get("active_members")
+        assert evaluator.evaluated == ["members.by_status", "active_members"]
+        assert len(statements) == 1
+
+        kpi_evaluator = MetricEvaluator(db)
+        kpi_evaluator.get("kpis")
+        base = [name for name in kpi_evaluator.evaluated if not METRICS[name].inputs]
+        assert sorted(base) == sorted(METRICS["kpis"].inputs)
+    finally:
+        db.close()
+
+
+def test_summary_returns_extended_sections(client: TestClient) -> None:
+    r = client.get("/api/analytics.summary", headers=_auth_headers())
+    assert r.status_code == 200
+    data = r.json()
+    assert set(SUMMARY_FIELDS) <= set(data)
+    assert data["average_utilization_rate"] == data["kpis"]["event_capacity_utilization_avg"]
+    assert data["totals"]["payments"] == data["facts"]["payments"]["count"]
+
+
+def test_summary_sections_and_metrics_select_fields(client: TestClient) -> None:
+    with _count_statements() as statements:
+        r = client.get(
+            "/api/analytics.summary",
+            params={"metrics": "active_members,revenue_cents_30d"},
+            headers=_auth_headers(),
+        )
+    assert r.status_code == 200
+    assert set(r.json()) == {"active_members", "revenue_cents_30d"}
+    # members.by_status + the rollup readiness check + the two 30-day amount sums
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 4
+
+    r = client.get("/api/analytics.summary", params={"sections": "attendance,kpis"}, headers=_auth_headers())
+    assert set(r.json()) == {"attendance_by_class_type_30d", "attendance_by_class_type_90d", "kpis"}
+
+    r = client.get("/api/analytics.summary", params={"sections": "bogus"}, headers=_auth_headers())
+    assert r.status_code == 400
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app import analytics_metrics
+from app.analytics_cache import clear_cache
+from app.analytics_metrics import SUMMARY_FIELDS, MetricEvaluator, base_metrics
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    clear_cache()
+    return TestClient(app)
+
+
+def test_parallel_prefetch_matches_sequential(client: TestClient, monkeypatch) -> None:
+    names = list(SUMMARY_FIELDS.values())
+    db = SessionLocal()
+    try:
+        sequential = MetricEvaluator(db)
+        expected = sequential.evaluate(names)
+        assert analytics_metrics.parallel_enabled(db) is False
+        assert set(sequential.timings) == set(base_metrics(names))
+
+        threads = set()
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            threads.add(threading.current_thread().name)
+
+        # SQLite stays sequential in production; a file database still tolerates concurrent reads here
+        monkeypatch.setattr(analytics_metrics, "parallel_enabled", lambda session: True)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            parallel = MetricEvaluator(db, now=sequential.now)
+            assert parallel.evaluate(names) == expected
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert set(parallel.timings) == set(base_metrics(names))
+        assert any(name.startswith("analytics") for name in threads)
+    finally:
+        db.close()
+
+
+def test_summary_reports_server_timing(client: TestClient) -> None:
+    r = client.get("/api/analytics.summary", params={"sections": "revenue,members"}, headers=_auth_headers())
+    assert r.status_code == 200
+    entries = dict(part.strip().split(";dur=") for part in r.headers["Server-Timing"].split(","))
+    assert set(entries) == {"members.by_status", "payments.amount_30d", "refunds.amount_30d"}
+    assert all(float(ms) >= 0 for ms in entries.values())
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.analytics_cache import clear_cache
+from app.models import Booking, Event, Payment
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    clear_cache()
+    return TestClient(app)
+
+
+@contextmanager
+def _count_statements() -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture()
+def seeded():
+    """Payments and bookings in June 1999, removed again afterwards."""
+    db = SessionLocal()
+    rows = []
+    for day, amount in ((1, 500), (1, 700), (3, 1000), (9, 250)):
+        rows.append(Payment(id=str(uuid.uuid4()), amount_cents=amount, created_at=datetime(1999, 6, day, 12)))
+    events = {}
+    for ct in ("ct_ts_boxing", "ct_ts_cardio"):
+        events[ct] = Event(
+            id=str(uuid.uuid4()), name=ct, class_type_id=ct, start=datetime(1999, 6, 1), end=datetime(1999, 6, 1, 1)
+        )
+    rows.extend(events.values())
+    for member, day, ct in ((1, 1, "ct_ts_boxing"), (2, 2, "ct_ts_boxing"), (1, 2, "ct_ts_cardio")):
+        rows.append(
+            Booking(
+                id=str(uuid.uuid4()),
+                event_id=events[ct].id,
+                member_id=f"mem_ts_{member}",
+                created_at=datetime(1999, 6, day, 9),
+            )
+        )
+    db.add_all(rows)
+    db.commit()
+    try:
+        yield
+    finally:
+        for row in rows:
+            db.delete(row)
+        db.commit()
+        db.close()
+
+
+def test_daily_series_is_dense_and_one_query(client: TestClient, seeded) -> None:
+    params = {"metric": "payments_cents", "start": "1999-06-01T00:00:00", "end": "1999-06-05T23:59:59"}
+    with _count_statements() as statements:
+        r = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["buckets"] == ["1999-06-01", "1999-06-02", "1999-06-03", "1999-06-04", "1999-06-05"]
+    assert body["series"] == [{"key": None, "values": [1200, 0, 1000, 0, 0], "total": 2200}]
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
+
+
+def test_date_only_end_covers_the_whole_last_day(client: TestClient, seeded) -> None:
+    # The payment at midday on 1999-06-03 falls in the last bucket
+    params = {"metric": "payments_cents", "start": "1999-06-01T00:00:00", "end": "1999-06-03"}
+    r = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["buckets"] == ["1999-06-01", "1999-06-02", "1999-06-03"]
+    assert body["series"][0]["values"] == [1200, 0, 1000]
+
+    # An explicit time stays an inclusive instant
+    r = client.get(
+        "/api/analytics.timeseries", params={**params, "end": "1999-06-03T11:00:00"}, headers=_auth_headers()
+    )
+    assert r.json()["series"][0]["values"] == [1200, 0, 0]
+
+
+def test_timezone_aware_bounds_are_read_as_utc(client: TestClient, seeded) -> None:
+    params = {"metric": "payments_cents", "start": "1999-06-01T00:00:00Z", "end": "1999-06-03T00:00:00Z"}
+    r = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    assert r.json()["series"][0]["values"] == [1200, 0, 1000]
+
+    # 13:00+02:00 is 11:00 UTC, before the midday payment on the 3rd
+    params = {"metric": "payments_cents", "start": "1999-06-01T02:00:00+02:00", "end": "1999-06-03T13:00:00+02:00"}
+    r = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    assert r.json()["series"][0]["values"] == [1200, 0, 0]
+
+    # No end: "now" is compared with an aware start
+    r = client.get(
+        "/api/analytics.timeseries",
+        params={"metric": "payments_cents", "start": "1999-06-01T00:00:00Z", "granularity": "month"},
+        headers=_auth_headers(),
+    )
+    assert r.status_code == 200, r.text
+
+
+def test_compare_adds_previous_totals_in_one_query(client: TestClient, seeded) -> None:
+    # Current: June 6-10 (the payment on the 9th); previous: June 1-5 (three payments)
+    params = {"metric": "payments_cents", "start": "1999-06-06T00:00:00", "end": "1999-06-10", "compare": "true"}
+    with _count_statements() as statements:
+        r = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["previous_start"] == "1999-06-01T00:00:00" and body["previous_end"] == "1999-06-06T00:00:00"
+    assert body["buckets"][0] == "1999-06-06" and len(body["buckets"]) == 5
+    (series,) = body["series"]
+    assert series["values"] == [0, 0, 0, 250, 0]
+    assert series["previous_total"] == 2200
+    assert series["change"] == {"current": 250, "previous": 2200, "delta": -1950, "pct_change": -88.64}
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
+
+    # Keys seen only in the previous period still get a (zero) series
+    params = {"metric": "bookings", "start": "1999-06-03T00:00:00", "end": "1999-06-04", "compare": "true"}
+    params["group_by"] = "class_type_id"
+    r = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers())
+    totals = {s["key"]: (s["total"], s["previous_total"]) for s in r.json()["series"]}
+    assert totals == {"ct_ts_boxing": (0, 2), "ct_ts_cardio": (0, 1)}
+
+    params = {"metric": "payments", "start": "1999-06-06T00:00:00", "end": "1999-06-10"}
+    body = client.get("/api/analytics.timeseries", params=params, headers=_auth_headers()).json()
+    assert "previous_start" not in body and set(body["series"][0]) == {"key", "values", "total"}
+
+
+def test_weekly_and_monthly_buckets(client: TestClient, seeded) -> None:
+    params = {"metric": "payments", "start": "1999-06-01T00:00:00", "end": "1999-06-13T00:00:00"}
+    r = client.get("/api/analytics.timeseries", params={**params, "granularity": "week"}, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    body = r.json()
+    # Weeks start on Monday: 1999-06-01 is a Tuesday
+    assert body["buckets"] == ["1999-05-31", "1999-06-07"]
+    assert body["series"][0]["values"] == [3, 1]
+
+    r = client.get("/api/analytics.timeseries", params={**params, "granularity": "month"}, headers=_auth_headers())
+    assert r.json()["buckets"] == ["1999-06-01"]
+    assert r.json()["series"][0]["values"] == [4]
+
+
+def test_group_by_class_type_and_errors(client: TestClient, seeded) -> None:
+    params = {"metric": "bookings", "start": "1999-06-01T00:00:00", "end": "1999-06-03T00:00:00"}
+    r = client.get(
+        "/api/analytics.timeseries", params={**params, "group_by": "class_type_id"}, headers=_auth_headers()
+    )
+    assert r.status_code == 200, r.text
+    series = {s["key"]: s["values"] for s in r.json()["series"]}
+    assert series == {"ct_ts_boxing": [1, 1, 0], "ct_ts_cardio": [0, 1, 0]}
+
+    bad = [
+        {**params, "group_by": "facebook_campaign_id", "metric": "refunds"},
+        {**params, "metric": "nope"},
+        {**params, "granularity": "hour"},
+        {**params, "start": "1999-06-05T00:00:00"},
+    ]
+    for query in bad:
+        assert client.get("/api/analytics.timeseries", params=query, headers=_auth_headers()).status_code == 400
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.models import Booking, Member, Refund
+from app.database import SessionLocal
+from benchmarks.run_analytics import ENTRY_POINTS, check_report, compare_reports, run
+from benchmarks.synthetic import SCALES, build_gym
+
+
+TINY = SCALES["tiny"]
+
+
+def _snapshot(path: Path):
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    try:
+        with engine.connect() as conn:
+            return (
+                conn.execute(select(func.count(), func.max(Booking.id), func.min(Booking.created_at))).one(),
+                conn.execute(select(func.group_concat(Member.status, ""))).scalar_one(),
+                conn.execute(select(func.sum(Refund.amount_cents))).scalar_one(),
+            )
+    finally:
+        engine.dispose()
+
+
+def test_synthetic_gym_is_deterministic(tmp_path: Path) -> None:
+    for name in ("a.db", "b.db"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}", future=True)
+        try:
+            counts = build_gym(engine, TINY, seed=7)
+        finally:
+            engine.dispose()
+        assert counts["members"] == TINY.members and counts["member_visits"] == TINY.visits
+    assert _snapshot(tmp_path / "a.db") == _snapshot(tmp_path / "b.db")
+
+
+def test_run_reports_times_and_query_counts(tmp_path: Path) -> None:
+    names = ["compute_facts", "window_pair[payments,30d]", "analytics_summary", "analytics_summary[approx]"]
+    report = run(tmp_path / "gym.db", TINY, repeat=1, names=names)
+    assert report["rows"]["bookings"] == TINY.bookings
+    assert set(report["prepare_seconds"]) >= {"rollups-backfill", "counters-rebuild"}
+    assert list(report["results"]) == names
+    # Both windows of the pair come from one statement over the rollups
+    assert report["results"]["window_pair[payments,30d]"]["queries"] == 2
+    assert all(result["queries"] > 0 and result["median_ms"] >= 0 for result in report["results"].values())
+    assert report["failures"] == check_report(report)
+
+    # The summary windows end with the synthetic span, so the 30-day sections see data
+    engine = create_engine(f"sqlite:///{tmp_path / 'gym.db'}", future=True)
+    db = SessionLocal(bind=engine)
+    try:
+        summary = ENTRY_POINTS["analytics_summary"](db)
+        approx = ENTRY_POINTS["analytics_summary[approx]"](db)
+    finally:
+        db.close()
+        engine.dispose()
+    assert summary.revenue_cents_30d > 0 and sum(summary.attendance_by_class_type_30d.values()) > 0
+    assert summary.whatsapp_delivery_rate_30d is not None
+    assert approx.revenue_cents_30d == summary.revenue_cents_30d
+
+    # A second run reuses the gym; reports of the same gym compare entry by entry
+    again = run(tmp_path / "gym.db", TINY, repeat=1, names=names[:1])
+    assert again["build_seconds"] is None
+    (row,) = compare_reports(report, again)
+    assert row["name"] == "compute_facts" and row["current_queries"] == row["baseline_queries"]
+
+    with pytest.raises(SystemExit):
+        run(tmp_path / "gym.db", TINY, seed=1, repeat=0, names=names[:1])
+    assert set(names) <= set(ENTRY_POINTS)
+
+
+def test_check_report_flags_a_slower_approx_summary() -> None:
+    def report(exact_ms: float, approx_ms: float):
+        return {
+            "results": {
+                "analytics_summary": {"median_ms": exact_ms},
+                "analytics_summary[approx]": {"median_ms": approx_ms},
+            }
+        }
+
+    assert check_report(report(100.0, 80.0)) == []
+    assert check_report(report(100.0, 105.0)) == []
+    (failure,) = check_report(report(100.0, 400.0))
+    assert failure.startswith("analytics_summary[approx]")
+    assert check_report({"results": {"analytics_summary": {"median_ms": 1.0}}}) == []
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.analytics_kpis import compute_kpis
+from app import booking_counts
+from app.booking_counts import READY_KEY, average_utilization, ensure_booking_counts, reconcile_booking_counts
+from app.models import Booking, ConfigEntry, Event, EventBookingCounts
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _naive_utilization(db) -> Optional[float]:
+    values: List[float] = []
+    for event_id, capacity in db.execute(select(Event.id, Event.capacity).where(Event.capacity.is_not(None))):
+        if not capacity or capacity <= 0:
+            continue
+        approved = db.execute(
+            select(func.count()).select_from(Booking).where(and_(Booking.event_id == event_id, Booking.status == "approved"))
+        ).scalar_one()
+        values.append(min(1.0, approved / capacity))
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def _create_event(client: TestClient, ct_id: str, capacity: int, requires_approval: bool = False) -> str:
+    start = datetime.utcnow() + timedelta(days=2)
+    r = client.post(
+        "/api/events.create",
+        json={
+            "name": "Sparring",
+            "class_type_id": ct_id,
+            "start": start.isoformat(),
+            "end": (start + timedelta(hours=1)).isoformat(),
+            "capacity": capacity,
+            "requires_approval": requires_approval,
+        },
+        headers=_auth_headers(),
+    )
+    assert r.status_code == 200, r.text
+    return r.json()["id"]
+
+
+def _book(client: TestClient, event_id: str) -> dict:
+    member_id = client.post(
+        "/api/members.create", json={"full_name": f"Counter {uuid.uuid4().hex[:6]}"}, headers=_auth_headers()
+    ).json()["id"]
+    r = client.post("/api/bookings.create", json={"event_id": event_id, "member_id": member_id}, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _counts(db, event_id: str) -> tuple:
+    row = db.get(EventBookingCounts, event_id)
+    return (row.approved_count, row.pending_count, row.cancelled_count)
+
+
+def test_counts_follow_booking_transitions(client: TestClient) -> None:
+    ct_id = f"ct_{uuid.uuid4().hex[:8]}"
+    client.post("/api/class_types.create", json={"id": ct_id, "name": "Sparring"}, headers=_auth_headers())
+    open_event = _create_event(client, ct_id, capacity=4)
+    gated_event = _create_event(client, ct_id, capacity=2, requires_approval=True)
+
+    first = _book(client, open_event)
+    _book(client, open_event)
+    pending = _book(client, gated_event)
+    assert pending["status"] == "pending"
+    client.post("/api/bookings.cancel", json={"id": first["id"]}, headers=_auth_headers())
+    client.post("/api/bookings.approve", json={"id": pending["id"], "approved_by": "coach"}, headers=_auth_headers())
+    # Re-approving is a no-op and must not double count
+    client.post("/api/bookings.approve", json={"id": pending["id"], "approved_by": "coach"}, headers=_auth_headers())
+
+    db = SessionLocal()
+    try:
+        assert _counts(db, open_event) == (1, 0, 1)
+        assert _counts(db, gated_event) == (1, 0, 0)
+        assert average_utilization(db) == _naive_utilization(db)
+        assert compute_kpis(db)["event_capacity_utilization_avg"] == average_utilization(db)
+    finally:
+        db.close()
+
+    summary = client.get("/api/analytics.summary", headers=_auth_headers()).json()
+    db = SessionLocal()
+    try:
+        assert summary["average_utilization_rate"] == _naive_utilization(db)
+    finally:
+        db.close()
+
+
+def test_reconcile_rebuilds_from_bookings(client: TestClient) -> None:
+    ct_id = f"ct_{uuid.uuid4().hex[:8]}"
+    client.post("/api/class_types.create", json={"id": ct_id, "name": "Pads"}, headers=_auth_headers())
+    event_id = _create_event(client, ct_id, capacity=3)
+    _book(client, event_id)
+    _book(client, event_id)
+
+    db = SessionLocal()
+    try:
+        db.execute(update(EventBookingCounts).values(approved_count=0, pending_count=7))
+        db.commit()
+        result = reconcile_booking_counts(db)
+        db.commit()
+        assert result["events"] >= 1
+        assert _counts(db, event_id) == (2, 0, 0)
+        assert average_utilization(db) == _naive_utilization(db)
+    finally:
+        db.close()
+
+
+def test_counts_rebuild_on_first_read_and_after_bulk_writes(client: TestClient) -> None:
+    ct_id = f"ct_{uuid.uuid4().hex[:8]}"
+    client.post("/api/class_types.create", json={"id": ct_id, "name": "Bags"}, headers=_auth_headers())
+    event_id = _create_event(client, ct_id, capacity=2)
+    booking = _book(client, event_id)
+
+    db = SessionLocal()
+    try:
+        # A database that predates the counts table: no rows and no ready marker
+        db.execute(delete(EventBookingCounts))
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == READY_KEY))
+        db.commit()
+        assert average_utilization(db) == _naive_utilization(db)
+        assert _counts(db, event_id) == (1, 0, 0)
+
+        # A bulk statement on bookings bypasses the transitions and clears the marker
+        db.execute(update(Booking).where(Booking.id == booking["id"]).values(status="cancelled"))
+        db.commit()
+        assert db.get(ConfigEntry, READY_KEY) is None
+        assert average_utilization(db) == _naive_utilization(db)
+        db.expire_all()
+        assert _counts(db, event_id) == (0, 0, 1)
+    finally:
+        db.close()
+
+
+def test_concurrent_first_reads_rebuild_once(client: TestClient, monkeypatch) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == READY_KEY))
+        db.commit()
+    finally:
+        db.close()
+    calls: List[str] = []
+
+    def slow_reconcile(db):
+        calls.append(threading.current_thread().name)
+        time.sleep(0.1)
+        return reconcile_booking_counts(db)
+
+    monkeypatch.setattr(booking_counts, "reconcile_booking_counts", slow_reconcile)
+    errors: List[BaseException] = []
+
+    def read() -> None:
+        session = SessionLocal()
+        try:
+            ensure_booking_counts(session)
+        except BaseException as exc:  # surfaced below
+            errors.append(exc)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and len(calls) == 1
+
+    # Losing the race to another process: its rows are kept and the read goes on
+    def conflicting_reconcile(db):
+        raise IntegrityError("INSERT INTO event_booking_counts", {}, Exception("UNIQUE constraint failed"))
+
+    monkeypatch.setattr(booking_counts, "reconcile_booking_counts", conflicting_reconcile)
+    db = SessionLocal()
+    try:
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == READY_KEY))
+        db.commit()
+        assert average_utilization(db) == _naive_utilization(db)
+        assert db.get(ConfigEntry, READY_KEY) is None
+    finally:
+        db.close()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.analytics_churn import BIAS, churn_scores, score_members
+from app.database import Base, engine, SessionLocal
+from app.models import Booking, Member, MemberChurnScore, MemberVisit, Payment, Refund
+
+
+API_TOKEN = "dev-token"
+NOW = datetime(1996, 6, 1, 12)
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _ours(items):
+    return [item for item in items if item["member_id"].startswith("mem_ch_")]
+
+
+def test_churn_scores_are_logistic() -> None:
+    scores = churn_scores(np.array([[0.0] * 5, [1.0] * 5]))
+    assert scores[0] == pytest.approx(1 / (1 + np.exp(-BIAS)))
+    assert 0.99 < scores[1] < 1.0
+
+
+def test_score_members_and_at_risk_list(client: TestClient) -> None:
+    db = SessionLocal()
+    members = [
+        Member(id="mem_ch_loyal", full_name="Loyal", join_date=date(1995, 1, 1)),
+        Member(id="mem_ch_lapsing", full_name="Lapsing", join_date=date(1995, 1, 1)),
+        Member(id="mem_ch_new", full_name="Newcomer", join_date=date(1996, 5, 23)),
+        Member(id="mem_ch_gone", full_name="Gone", join_date=date(1995, 1, 1), status="inactive"),
+    ]
+    try:
+        db.add_all(members)
+        # Loyal: weekly for eight weeks, last visit two days ago
+        db.add_all(
+            MemberVisit(ts=NOW - timedelta(days=2 + 7 * k), member_id="mem_ch_loyal", source="qr_checkin")
+            for k in range(8)
+        )
+        # Lapsing: four visits in the prior four weeks, none since; cancels, a failed payment and a refund
+        db.add_all(
+            MemberVisit(ts=NOW - timedelta(days=30 + 7 * k), member_id="mem_ch_lapsing", source="qr_checkin")
+            for k in range(4)
+        )
+        db.add_all(
+            Booking(
+                id=str(uuid.uuid4()),
+                event_id=f"evt_ch_{k}",
+                member_id="mem_ch_lapsing",
+                status="cancelled",
+                created_at=NOW - timedelta(days=40),
+            )
+            for k in range(2)
+        )
+        paid, failed = (
+            Payment(
+                id=str(uuid.uuid4()),
+                member_id="mem_ch_lapsing",
+                amount_cents=500,
+                status=status,
+                created_at=NOW - timedelta(days=days_ago),
+            )
+            for status, days_ago in (("succeeded", 50), ("failed", 20))
+        )
+        db.add_all([paid, failed])
+        db.add(Refund(id=str(uuid.uuid4()), payment_id=paid.id, amount_cents=500, created_at=NOW - timedelta(days=45)))
+        db.commit()
+
+        result = score_members(db, now=NOW)
+        db.commit()
+        assert result["scored"] >= 3
+        rows = db.query(MemberChurnScore).filter(MemberChurnScore.member_id.like("mem_ch_%"))
+        scores = {row.member_id: row for row in rows}
+        assert set(scores) == {"mem_ch_loyal", "mem_ch_lapsing", "mem_ch_new"}
+        lapsing = scores["mem_ch_lapsing"]
+        assert (lapsing.days_since_visit, lapsing.recent_visits, lapsing.prior_visits) == (30, 0, 4)
+        assert (lapsing.cancellation_ratio, lapsing.refunds, lapsing.payment_failures) == (1.0, 1, 1)
+        assert lapsing.score == pytest.approx(0.935, abs=1e-3)
+        assert (scores["mem_ch_loyal"].recent_visits, scores["mem_ch_loyal"].prior_visits) == (4, 4)
+        assert scores["mem_ch_loyal"].score < 0.1
+        assert scores["mem_ch_new"].days_since_visit is None and scores["mem_ch_new"].score < 0.1
+
+        r = client.get("/api/members.at_risk", params={"page_size": 500}, headers=_auth_headers())
+        assert r.status_code == 200, r.text
+        assert [item["member_id"] for item in _ours(r.json()["items"])] == ["mem_ch_lapsing"]
+
+        r = client.get("/api/members.at_risk", params={"min_score": 0, "page_size": 500}, headers=_auth_headers())
+        body = r.json()
+        assert body["total"] == result["scored"]
+        ours = _ours(body["items"])
+        assert [item["member_id"] for item in ours] == ["mem_ch_lapsing", "mem_ch_new", "mem_ch_loyal"]
+        assert ours[0]["full_name"] == "Lapsing"
+
+        r = client.get("/api/members.at_risk", params={"min_score": 0, "page_size": 1}, headers=_auth_headers())
+        assert len(r.json()["items"]) == 1
+        assert client.get("/api/members.at_risk", params={"min_score": 2}, headers=_auth_headers()).status_code == 422
+    finally:
+        db.rollback()
+        db.execute(delete(MemberChurnScore))
+        db.execute(delete(Booking).where(Booking.member_id.like("mem_ch_%")))
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_ch_%")))
+        ours = select(Payment.id).where(Payment.member_id.like("mem_ch_%"))
+        db.execute(delete(Refund).where(Refund.payment_id.in_(ours)))
+        db.execute(delete(Payment).where(Payment.member_id.like("mem_ch_%")))
+        db.execute(delete(Member).where(Member.id.like("mem_ch_%")))
+        db.commit()
+        db.close()
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.config import get_settings
+from app.code_lexical import LexicalIndex, tokenize_code
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> TestClient:
+    monkeypatch.setenv("APP_CODE_LEXICAL_INDEX_DIR", str(tmp_path / "index"))
+    get_settings.cache_clear()  # type: ignore[attr-defined]
+    return TestClient(app)
+
+
+def test_tokenizer_splits_identifiers_and_keeps_them_whole() -> None:
+    tokens = tokenize_code("def compute_refund_rate(db): return HTTPException")
+    assert "compute_refund_rate" in tokens
+    assert {"compute", "refund", "rate"} <= set(tokens)
+    assert {"httpexception", "http", "exception"} <= set(tokens)
+
+
+def test_index_roundtrip_preserves_scores() -> None:
+    index = LexicalIndex(signature="sig")
+    index.add_document({"path": "a.py"}, "def compute_refund_rate(): pass")
+    index.add_document({"path": "b.py"}, "def compute_revenue_cents(): pass")
+    loaded = LexicalIndex.from_bytes(index.to_bytes())
+    assert loaded.signature == "sig"
+    assert loaded.search("refund rate") == index.search("refund rate")
+    assert loaded.search("compute_refund_rate")[0][1]["path"] == "a.py"
+
+
+def test_code_search_lexical_and_hybrid_modes(client: TestClient, tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "refunds.py").write_text("def compute_refund_rate(db):\n    return 0.0\n")
+    (src / "revenue.py").write_text("def compute_revenue_cents(db):\n    return 0\n")
+    params = {"root_dir": str(src), "exts": ".py"}
+
+    r = client.post("/api/code/search", params={"q": "compute_refund_rate", "mode": "lexical", **params}, headers=_auth_headers())
+    assert r.status_code == 200
+    data = r.json()
+    assert data["source"] == "lexical"
+    assert data["items"][0]["path"] == "refunds.py"
+    assert list((tmp_path / "index").glob("*.bm25"))
+
+    r2 = client.post("/api/code/search", params={"q": "refund", "mode": "hybrid", **params}, headers=_auth_headers())
+    assert r2.status_code == 200
+    data2 = r2.json()
+    assert data2["source"] == "hybrid"
+    assert data2["items"][0]["path"] == "refunds.py"
+    assert data2["total"] == 2
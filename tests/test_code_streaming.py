@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine
+from app.routers.code_index import decode_binary_frames, decode_vector_base64
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+@pytest.fixture()
+def code_dir(tmp_path: Path) -> Path:
+    for i in range(3):
+        (tmp_path / f"mod_{i}.py").write_text(f"def handler_{i}():\n    return {i}\n")
+    return tmp_path
+
+
+def test_code_backfill_ndjson_stream(client: TestClient, code_dir: Path) -> None:
+    params = {"root_dir": str(code_dir), "exts": ".py"}
+    baseline = client.post("/api/code/backfill", params=params, headers=_auth_headers()).json()
+
+    r = client.post("/api/code/backfill", params={**params, "format": "ndjson"}, headers=_auth_headers())
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines() if line]
+    records = [line for line in lines if line["type"] == "vector"]
+    assert lines[-1] == {"type": "summary", "count": 3, "persisted": False}
+    assert [rec["path"] for rec in records] == [m["path"] for m in baseline["meta"]]
+    assert records[0]["vector"] == baseline["vectors"][0]
+
+    r2 = client.post(
+        "/api/code/backfill", params={**params, "format": "ndjson", "encoding": "base64"}, headers=_auth_headers()
+    )
+    first = json.loads(r2.text.splitlines()[0])
+    decoded = decode_vector_base64(first["vector_b64"])
+    assert first["dims"] == len(decoded) == len(baseline["vectors"][0])
+    assert all(abs(a - b) < 1e-6 for a, b in zip(decoded, baseline["vectors"][0]))
+
+
+def test_code_backfill_binary_frames(client: TestClient, code_dir: Path) -> None:
+    r = client.post(
+        "/api/code/backfill",
+        params={"root_dir": str(code_dir), "exts": ".py", "format": "binary"},
+        headers=_auth_headers(),
+    )
+    assert r.status_code == 200
+    frames = list(decode_binary_frames(r.content))
+    assert len(frames) == 4
+    meta, vector = frames[0]
+    assert meta["type"] == "vector" and meta["path"].endswith(".py")
+    assert len(vector) > 0
+    summary, empty = frames[-1]
+    assert summary["type"] == "summary" and summary["count"] == 3 and empty == []
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import and_, delete, event, func, select
+from sqlalchemy.exc import IntegrityError
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.analytics_math import compute_refund_rate, compute_revenue_cents, compute_whatsapp_delivery_rate
+from app import analytics_rollups
+from app.analytics_rollups import READY_KEY, ensure_rollups, rebuild_rollups, split_window, window_totals
+from app.models import (
+    Booking,
+    ConfigEntry,
+    DailyRollup,
+    Event,
+    Payment,
+    Refund,
+    WhatsAppMessage,
+    WhatsAppStatusEvent,
+)
+
+
+API_TOKEN = "dev-token"
+
+# Far-past days keep these rows out of other tests' 30/90-day windows
+BASE = datetime(2001, 3, 10)
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _raw_sum(db, model, start: datetime, end: datetime) -> int:
+    return int(
+        db.execute(
+            select(func.coalesce(func.sum(model.amount_cents), 0)).where(
+                and_(model.created_at >= start, model.created_at <= end)
+            )
+        ).scalar_one()
+    )
+
+
+def _rollup_rows(db, metric: str) -> Dict[tuple, tuple]:
+    rows = db.execute(select(DailyRollup).where(DailyRollup.metric == metric)).scalars().all()
+    return {(r.day, r.status, r.dim): (r.count, r.sum) for r in rows}
+
+
+def test_split_window_keeps_partial_days_raw() -> None:
+    days, edges = split_window(BASE + timedelta(hours=6), BASE + timedelta(days=3, hours=2))
+    assert days == ((BASE + timedelta(days=1)).date(), (BASE + timedelta(days=3)).date())
+    assert edges == [
+        (BASE + timedelta(hours=6), BASE + timedelta(days=1), False),
+        (BASE + timedelta(days=3), BASE + timedelta(days=3, hours=2), True),
+    ]
+    assert split_window(BASE, BASE + timedelta(hours=5)) == (None, [(BASE, BASE + timedelta(hours=5), True)])
+
+
+def test_windowed_math_matches_raw_rows(client: TestClient) -> None:
+    db = SessionLocal()
+    created = []
+    try:
+        for offset_hours, amount in ((1, 1000), (20, 2500), (30, 700), (50, 1200), (75, 4000), (96, 300)):
+            pay_id = str(uuid.uuid4())
+            ts = BASE + timedelta(hours=offset_hours)
+            created.append(Payment(id=pay_id, amount_cents=amount, status="succeeded", created_at=ts))
+            if amount >= 1200:
+                created.append(Refund(id=str(uuid.uuid4()), payment_id=pay_id, amount_cents=amount // 4, created_at=ts))
+        messages = []
+        for offset_hours in (2, 26, 49, 73):
+            msg = WhatsAppMessage(id=str(uuid.uuid4()), content="hi", created_at=BASE + timedelta(hours=offset_hours))
+            messages.append(msg)
+        created.extend(messages)
+        db.add_all(created)
+        db.flush()
+        # Delivered on day 1, read on day 2: counted once, on day 1
+        status_events = [
+            WhatsAppStatusEvent(message_id=messages[0].id, status="delivered", created_at=BASE + timedelta(hours=3)),
+            WhatsAppStatusEvent(message_id=messages[0].id, status="read", created_at=BASE + timedelta(hours=28)),
+            WhatsAppStatusEvent(message_id=messages[2].id, status="read", created_at=BASE + timedelta(hours=51)),
+        ]
+        db.add_all(status_events)
+        db.commit()
+        created.extend(status_events)
+
+        for start, end in (
+            (BASE + timedelta(hours=6), BASE + timedelta(days=3, hours=2)),
+            (BASE, BASE + timedelta(days=5)),
+            (BASE + timedelta(hours=19), BASE + timedelta(hours=31)),
+        ):
+            payments = _raw_sum(db, Payment, start, end)
+            refunds = _raw_sum(db, Refund, start, end)
+            assert compute_revenue_cents(db, start, end) == payments - refunds
+            assert compute_refund_rate(db, start, end) == (refunds / payments if payments else None)
+
+        start, end = BASE, BASE + timedelta(days=4)
+        assert window_totals(db, "whatsapp.sent", start, end) == (4, 0)
+        assert window_totals(db, "whatsapp.delivered", start, end) == (2, 0)
+        assert compute_whatsapp_delivery_rate(db, start, end) == 0.5
+        # The read on day 2 does not count again for a window that starts on day 2
+        assert window_totals(db, "whatsapp.delivered", BASE + timedelta(days=1), end) == (1, 0)
+        # ... nor when that read sits inside a partial edge day
+        assert window_totals(db, "whatsapp.delivered", BASE + timedelta(hours=27), end) == (1, 0)
+
+        # Deleting the rows takes their amounts back out of the rollups
+        for obj in created:
+            db.delete(obj)
+        db.commit()
+        assert compute_revenue_cents(db, start, end) == 0
+        assert window_totals(db, "whatsapp.sent", start, end) == (0, 0)
+        assert window_totals(db, "whatsapp.delivered", start, end) == (0, 0)
+    finally:
+        db.close()
+
+
+def test_delivered_edges_read_status_events_by_index(client: TestClient) -> None:
+    db = SessionLocal()
+    message = WhatsAppMessage(id=str(uuid.uuid4()), content="hi", created_at=BASE + timedelta(hours=2))
+    try:
+        db.add(message)
+        db.commit()
+        start, end = BASE + timedelta(hours=1), BASE + timedelta(days=3, hours=5)
+        window_totals(db, "whatsapp.delivered", start, end)
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            window_totals(db, "whatsapp.delivered", start, end)
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        (statement, parameters), = [s for s in statements if "whatsapp_status_events" in s[0]]
+        with engine.connect() as conn:
+            plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+        # No full pass over the status events: the edge rows are found through an index
+        assert not [step for step in plan if step.startswith("SCAN whatsapp_status_events")]
+        assert any("ix_whatsapp_status_created" in step for step in plan)
+    finally:
+        db.delete(message)
+        db.commit()
+        db.close()
+
+
+def test_booking_status_change_moves_rollup_and_rebuild_matches(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        event = Event(
+            id=str(uuid.uuid4()),
+            name="Rollup sparring",
+            class_type_id="ct_rollup",
+            start=BASE,
+            end=BASE + timedelta(hours=1),
+        )
+        db.add(event)
+        db.flush()
+        booking = Booking(
+            id=str(uuid.uuid4()), event_id=event.id, member_id="mem_rollup", status="pending", created_at=BASE
+        )
+        db.add(booking)
+        db.commit()
+        key_pending = (BASE.date(), "pending", "ct_rollup")
+        key_approved = (BASE.date(), "approved", "ct_rollup")
+        before = _rollup_rows(db, "bookings")
+        assert before[key_pending][0] >= 1
+
+        booking.status = "approved"
+        db.commit()
+        after = _rollup_rows(db, "bookings")
+        assert after[key_pending][0] == before[key_pending][0] - 1
+        assert after[key_approved][0] == before.get(key_approved, (0, 0))[0] + 1
+
+        incremental = {metric: _rollup_rows(db, metric) for metric in ("bookings", "payments", "refunds")}
+        rebuild_rollups(db)
+        db.commit()
+        rebuilt = {metric: _rollup_rows(db, metric) for metric in ("bookings", "payments", "refunds")}
+        strip = lambda rows: {k: v for k, v in rows.items() if v != (0, 0)}
+        assert {m: strip(r) for m, r in incremental.items()} == {m: strip(r) for m, r in rebuilt.items()}
+    finally:
+        db.close()
+
+
+def test_rebuild_lost_to_another_process_keeps_its_rollups(client: TestClient, monkeypatch) -> None:
+    def conflicting_rebuild(db):
+        raise IntegrityError("INSERT INTO daily_rollups", {}, Exception("UNIQUE constraint failed"))
+
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db)
+        db.commit()
+        expected = window_totals(db, "payments", BASE, BASE + timedelta(days=30))
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == READY_KEY))
+        db.commit()
+    finally:
+        db.close()
+
+    monkeypatch.setattr(analytics_rollups, "rebuild_rollups", conflicting_rebuild)
+    db = SessionLocal()
+    try:
+        ensure_rollups(db)
+        assert window_totals(db, "payments", BASE, BASE + timedelta(days=30)) == expected
+    finally:
+        db.close()
+    monkeypatch.undo()
+    db = SessionLocal()
+    try:
+        ensure_rollups(db)
+        assert db.get(ConfigEntry, READY_KEY) is not None
+    finally:
+        db.close()
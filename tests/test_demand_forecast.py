@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app import analytics_forecast
+from app.analytics_forecast import COMPUTED_KEY, ensure_forecast, refresh_demand_forecast, smooth
+from app.database import Base, engine, SessionLocal
+from app.models import Booking, ConfigEntry, DemandForecast, Event, MemberVisit
+
+
+API_TOKEN = "dev-token"
+BOXING, YOGA = "ct_forecast_boxing", "ct_forecast_yoga"
+TODAY = date(1995, 3, 6)  # a Monday; history covers the 12 weeks before it
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _event(class_type_id: str, start: datetime, capacity: int = 10) -> Event:
+    return Event(
+        id=str(uuid.uuid4()),
+        name="Forecast class",
+        class_type_id=class_type_id,
+        start=start,
+        end=start + timedelta(hours=1),
+        capacity=capacity,
+    )
+
+
+def test_smooth_skips_weeks_without_sessions() -> None:
+    weekly = np.array([[np.nan, 4.0, 6.0, np.nan, 8.0], [np.nan] * 5])
+    level = smooth(weekly, 0.5)
+    assert level[0] == pytest.approx(6.5)
+    assert np.isnan(level[1])
+    assert smooth(weekly, 1.0)[0] == pytest.approx(8.0)
+
+
+def test_schedule_shows_predicted_fill_rate(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        # Tuesday 18:00 boxing, three and two weeks before TODAY plus last week: demand 4, 6, 8
+        past = [_event(BOXING, datetime(1995, 2, 14 + 7 * k, 18)) for k in range(3)]
+        ignored = _event(BOXING, datetime(1994, 11, 1, 18))  # older than the history window
+        db.add_all([*past, ignored])
+        for ev, approved in zip([*past, ignored], (4, 6, 7, 50)):
+            db.add_all(
+                Booking(id=str(uuid.uuid4()), event_id=ev.id, member_id=f"mem_fc_{n}", status="approved")
+                for n in range(approved)
+            )
+        db.add(Booking(id=str(uuid.uuid4()), event_id=past[0].id, member_id="mem_fc_p", status="pending"))
+        # Last week a drop-in checked in without a booking: 7 approved, 8 distinct visitors
+        db.add_all(
+            MemberVisit(ts=past[2].start, member_id=f"mem_fc_{n}", event_id=past[2].id, source="qr_checkin")
+            for n in (*range(7), 0, 99)
+        )
+        db.commit()
+
+        result = refresh_demand_forecast(db, today=TODAY)
+        db.commit()
+        assert result["through_week"] == TODAY.isoformat()
+        (slot,) = db.query(DemandForecast).filter(DemandForecast.class_type_id == BOXING).all()
+        assert (slot.weekday, slot.hour, slot.expected, slot.sessions, slot.weeks) == (1, 18, 6.5, 3, 3)
+
+        upcoming = [
+            _event(BOXING, datetime(1995, 3, 7, 18), capacity=6),
+            _event(BOXING, datetime(1995, 3, 9, 7), capacity=20),
+            _event(YOGA, datetime(1995, 3, 10, 9)),
+        ]
+        db.add_all(upcoming)
+        db.commit()
+
+        r = client.get(
+            "/api/events.schedule", params={"start": "1995-03-06", "end": "1995-03-12"}, headers=_auth_headers()
+        )
+        assert r.status_code == 200, r.text
+        body = r.json()
+        assert body["forecast_through_week"] == "1995-03-06"
+        items = {item["event_id"]: item for item in body["items"]}
+        assert list(items) == [ev.id for ev in upcoming]
+        tuesday, thursday, yoga = (items[ev.id] for ev in upcoming)
+        assert (tuesday["predicted_demand"], tuesday["predicted_fill_rate"], tuesday["outlook"]) == (6.5, 1.083, "over")
+        assert (tuesday["basis"], tuesday["booked"]) == ("slot", 0)
+        # No history at Thursday 07:00: the class type's mean over its slots
+        assert (thursday["basis"], thursday["predicted_fill_rate"]) == ("class_type", 0.325)
+        assert thursday["outlook"] == "under"
+        assert (yoga["predicted_demand"], yoga["outlook"]) == (None, None)
+
+        r = client.get(
+            "/api/events.schedule",
+            params={"start": "1995-03-06", "end": "1995-03-12", "class_type_id": YOGA},
+            headers=_auth_headers(),
+        )
+        assert [item["event_id"] for item in r.json()["items"]] == [upcoming[2].id]
+        params = {"start": "1995-03-06", "end": "1995-03-05"}
+        assert client.get("/api/events.schedule", params=params, headers=_auth_headers()).status_code == 400
+    finally:
+        db.execute(delete(Booking).where(Booking.member_id.like("mem_fc_%")))
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_fc_%")))
+        db.execute(delete(Event).where(Event.class_type_id.in_([BOXING, YOGA])))
+        db.execute(delete(DemandForecast))
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == COMPUTED_KEY))
+        db.commit()
+        db.close()
+
+
+def test_first_read_racing_another_refresh_keeps_its_forecast(client: TestClient, monkeypatch) -> None:
+    def raced(db):
+        # The periodic refresh in another worker commits first; our insert then hits its rows
+        other = SessionLocal()
+        try:
+            refresh_demand_forecast(other, today=TODAY)
+            other.commit()
+        finally:
+            other.close()
+        raise IntegrityError("INSERT INTO demand_forecasts", {}, Exception("UNIQUE constraint failed"))
+
+    db = SessionLocal()
+    try:
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == COMPUTED_KEY))
+        db.commit()
+        monkeypatch.setattr(analytics_forecast, "refresh_demand_forecast", raced)
+        assert ensure_forecast(db) == TODAY.isoformat()
+    finally:
+        monkeypatch.undo()
+        db.execute(delete(ConfigEntry).where(ConfigEntry.key == COMPUTED_KEY))
+        db.commit()
+        db.close()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app.demographics import histograms, refresh_demographic_segments
+from app.models import Member
+from app.utils import age_band, compute_age, compute_demographic_segment
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    return TestClient(app)
+
+
+def _years_ago(today: date, years: int, days: int = 0) -> date:
+    try:
+        anchor = today.replace(year=today.year - years)
+    except ValueError:  # Feb 29 today
+        anchor = today.replace(year=today.year - years, day=28)
+    return anchor + timedelta(days=days)
+
+
+def _add_members(db) -> None:
+    today = date.today()
+    dobs = [
+        _years_ago(today, 18),  # turns 18 today
+        _years_ago(today, 18, days=1),  # turns 18 tomorrow
+        _years_ago(today, 34, days=-1),
+        _years_ago(today, 35, days=1),
+        _years_ago(today, 70),
+        date(1992, 2, 29),
+        None,
+    ]
+    genders = [" Female ", "male", None, "", "MALE", "nonbinary", None]
+    for dob, gender in zip(dobs, genders):
+        db.add(Member(id=str(uuid.uuid4()), full_name="Demo", dob=dob, gender=gender, demographic_segment="stale"))
+    db.commit()
+
+
+def test_sql_histograms_match_python(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        _add_members(db)
+        bands: Counter = Counter()
+        genders: Counter = Counter()
+        for dob, gender in db.execute(select(Member.dob, Member.gender)):
+            bands[age_band(compute_age(dob)) or "unknown"] += 1
+            genders[(gender or "other").strip().lower()] += 1
+        assert histograms(db) == {"age_bands": dict(bands), "genders": dict(genders)}
+    finally:
+        db.close()
+
+
+def test_refresh_rewrites_stale_segments_only(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        _add_members(db)
+        assert refresh_demographic_segments(db)["updated"] >= 7
+        db.commit()
+        db.expire_all()
+        for member in db.execute(select(Member)).scalars():
+            assert member.demographic_segment == compute_demographic_segment(member.dob, member.gender)
+        assert refresh_demographic_segments(db) == {"updated": 0}
+        db.commit()
+
+        segment = compute_demographic_segment(date(1992, 2, 29), "nonbinary")
+        r = client.get("/api/members.list", params={"demographic_segment": segment}, headers=_auth_headers())
+        assert r.status_code == 200
+        items = r.json()["items"]
+        assert items and all(item["demographic_segment"] == segment for item in items)
+    finally:
+        db.close()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.database import Base, engine, SessionLocal
+from app import embedding_tasks
+from app.embedding_metrics import Histogram, embedding_lag, reset_metrics, write_summary
+from app.models import Member, SystemLog
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    Base.metadata.create_all(bind=engine)
+    reset_metrics()
+    return TestClient(app)
+
+
+def test_histogram_quantiles() -> None:
+    hist = Histogram([1, 10, 100])
+    for value in [0.5, 0.7, 5, 50, 500]:
+        hist.observe(value)
+    snap = hist.snapshot()
+    assert snap["count"] == 5
+    assert snap["p50_ms"] == 10.0
+    assert snap["p99_ms"] == 500.0
+    assert snap["buckets"] == {"le_1": 2, "le_10": 1, "le_100": 1, "le_inf": 1}
+
+
+def test_metrics_track_lag_provider_and_search(client: TestClient) -> None:
+    r = client.post(
+        "/api/members.create", json={"full_name": f"Lag Probe {uuid.uuid4().hex[:6]}"}, headers=_auth_headers()
+    )
+    member_id = r.json()["id"]
+    client.post("/api/embeddings.backfill", headers=_auth_headers())
+    before = client.get("/api/embeddings.metrics", headers=_auth_headers()).json()
+    assert before["lag"]["entities"]["member"]["stale"] == 0
+    assert before["lag"]["entities"]["member"]["missing"] == 0
+
+    # Change the text behind the API's back so no re-embed task runs
+    db = SessionLocal()
+    try:
+        db.get(Member, member_id).notes = "now training for a fight"
+        db.commit()
+    finally:
+        db.close()
+
+    client.get("/api/embeddings.search", params={"q": "fight"}, headers=_auth_headers())
+    data = client.get("/api/embeddings.metrics", headers=_auth_headers()).json()
+    assert data["lag"]["entities"]["member"]["stale"] == 1
+    assert data["lag"]["stale_total"] >= 1
+    fake = data["provider"]["fake"]
+    assert fake["calls"] >= 2 and fake["bytes"] > 0
+    assert fake["cache_hits"] + fake["cache_misses"] == fake["texts"]
+    phases = data["search"]["db"]
+    assert {"embed", "scan", "hydrate"} <= set(phases)
+    assert phases["scan"]["count"] == 1
+
+
+def test_lag_rehashes_only_edited_entities(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    r = client.post(
+        "/api/members.create", json={"full_name": f"Hash Probe {uuid.uuid4().hex[:6]}"}, headers=_auth_headers()
+    )
+    member_id = r.json()["id"]
+    client.post("/api/embeddings.backfill", headers=_auth_headers())
+    hashed = []
+    real = embedding_tasks.text_hash_for_entity
+    monkeypatch.setattr(
+        embedding_tasks, "text_hash_for_entity", lambda et, obj: hashed.append(obj.id) or real(et, obj)
+    )
+    db = SessionLocal()
+    try:
+        embedding_lag(db)
+        hashed.clear()
+        embedding_lag(db)
+        assert hashed == []
+
+        db.get(Member, member_id).notes = "switched to southpaw"
+        db.commit()
+        assert embedding_lag(db)["entities"]["member"]["stale"] >= 1
+        assert hashed == [member_id]
+    finally:
+        db.close()
+
+
+def test_write_summary_to_system_log(client: TestClient) -> None:
+    client.get("/api/embeddings.search", params={"q": "jab"}, headers=_auth_headers())
+    db = SessionLocal()
+    try:
+        log = write_summary(db)
+        stored = db.get(SystemLog, log.id)
+        assert stored.action == "metrics.summary"
+        assert "search[db]" in stored.message
+        assert "lag" in json.loads(stored.meta_json)
+    finally:
+        db.close()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, func, select
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.analytics_cache import clear_cache
+from app.analytics_sketches import ensure_total_sketches, total_sketch, window_sketch
+from app.config import get_settings
+from app.database import Base, engine, SessionLocal
+from app.hll import HyperLogLog
+from app.models import HllSketch, MemberVisit
+
+
+API_TOKEN = "dev-token"
+DAY0 = datetime(1996, 2, 1)
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    # Drop settings cached by earlier modules (e.g. a low rate limit)
+    get_settings.cache_clear()  # type: ignore[attr-defined]
+    Base.metadata.create_all(bind=engine)
+    clear_cache()
+    return TestClient(app)
+
+
+def _uniques(client: TestClient, **params) -> dict:
+    r = client.get("/api/analytics.uniques", params=params, headers=_auth_headers())
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_sketch_estimates_merge_and_serialize() -> None:
+    left, right, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    left.add_many(f"m{i}" for i in range(0, 12000))
+    right.add_many(f"m{i}" for i in range(8000, 20000))
+    union.add_many(f"m{i}" for i in range(20000))
+    merged = left.copy().merge(right)
+    assert (merged.registers == union.registers).all()
+    assert abs(merged.count() - 20000) <= 4 * merged.relative_error * 20000
+
+    small = HyperLogLog()
+    small.add_many(["a", "b", "c", "a"])
+    assert small.count() == 3
+    restored = HyperLogLog.from_bytes(merged.to_bytes())
+    assert restored.count() == merged.count()
+    assert len(HyperLogLog().to_bytes()) < 100
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(precision=10))
+
+
+def _seed(db) -> List[MemberVisit]:
+    # Day d has members d*100 .. d*100+399: overlapping populations across five days
+    visits = [
+        MemberVisit(ts=DAY0 + timedelta(days=d, hours=8 + i % 10), member_id=f"mem_hll_{d * 100 + i}", source="qr")
+        for d in range(5)
+        for i in range(400)
+    ]
+    db.add_all(visits)
+    db.commit()
+    return visits
+
+
+def _exact(db, start: datetime, end: datetime) -> int:
+    return db.execute(
+        select(func.count(func.distinct(MemberVisit.member_id))).where(MemberVisit.ts >= start, MemberVisit.ts <= end)
+    ).scalar()
+
+
+def test_windowed_uniques_use_day_sketches_and_follow_writes(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        _seed(db)
+        start, end = DAY0 + timedelta(hours=12), DAY0 + timedelta(days=4, hours=12)
+        params = {"metric": "visits.members", "start": start.isoformat(), "end": end.isoformat()}
+        body = _uniques(client, **params)
+        exact = _exact(db, start, end)
+        assert body["approx"] is True and body["relative_error"] == pytest.approx(0.0163, abs=1e-4)
+        assert abs(body["value"] - exact) <= 4 * body["relative_error"] * exact
+        assert body["low"] <= body["value"] <= body["high"]
+        assert _uniques(client, approx="false", **params)["value"] == exact
+
+        # Whole days 1996-02-02 .. 1996-02-04 are stored; the partial first/last days are read raw
+        scopes = set(db.execute(select(HllSketch.scope).where(HllSketch.metric == "visits.members")).scalars())
+        assert {"1996-02-02", "1996-02-03", "1996-02-04"} <= scopes
+        assert "1996-02-01" not in scopes and "1996-02-05" not in scopes
+
+        # A backdated visit drops its day's sketch (and the all-time one); the next read rebuilds it
+        db.add(MemberVisit(ts=DAY0 + timedelta(days=2, hours=9), member_id="mem_hll_new", source="qr"))
+        db.commit()
+        assert db.get(HllSketch, ("visits.members", "1996-02-03")) is None
+        assert db.get(HllSketch, ("visits.members", "all")) is None
+        body = _uniques(client, metric="visits.members", start="1996-02-03T00:00:00", end="1996-02-04T00:00:00")
+        exact = _exact(db, DAY0 + timedelta(days=2), DAY0 + timedelta(days=3))
+        assert exact == 401
+        assert abs(body["value"] - exact) <= 4 * body["relative_error"] * exact
+        assert db.get(HllSketch, ("visits.members", "1996-02-03")) is not None
+
+        # Aware bounds are read as UTC; an aware start alone ends at the naive "now"
+        exact = _exact(db, start, end)
+        aware = {"metric": "visits.members", "start": start.isoformat() + "Z", "end": end.isoformat() + "Z"}
+        assert _uniques(client, approx="false", **aware)["value"] == exact
+        aware["end"] = (end + timedelta(hours=2)).isoformat() + "+02:00"
+        assert _uniques(client, approx="false", **aware)["value"] == exact
+        assert _uniques(client, metric="visits.members", start=start.isoformat() + "Z")["value"] > 0
+    finally:
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_hll_%")))
+        db.commit()
+        db.close()
+
+
+def test_summary_approx_mode_estimates_unique_visitors(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        _seed(db)
+        exact = client.get("/api/analytics.summary", params={"sections": "facts"}, headers=_auth_headers()).json()
+        params = {"sections": "facts", "approx": "true"}
+        r = client.get("/api/analytics.summary", params=params, headers=_auth_headers())
+        assert r.status_code == 200, r.text
+        approx = r.json()["facts"]
+        expected = exact["facts"]["visits"]["unique_members"]
+        assert approx["visits"]["total"] == exact["facts"]["visits"]["total"]
+        assert abs(approx["visits"]["unique_members"] - expected) <= 4 * 0.0163 * expected + 1
+        assert db.get(HllSketch, ("visits.members", "all")) is not None
+
+        r = client.get("/api/analytics.uniques", params={"metric": "nope"}, headers=_auth_headers())
+        assert r.status_code == 400
+    finally:
+        db.execute(delete(MemberVisit).where(MemberVisit.member_id.like("mem_hll_%")))
+        db.commit()
+        db.close()
+
+
+def test_unsealed_tail_reads_the_ts_index_and_reads_do_not_commit(client: TestClient) -> None:
+    db = SessionLocal()
+    try:
+        ensure_total_sketches(db, ["visits.members"])
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            total_sketch(db, "visits.members")
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        (statement, parameters), = [s for s in statements if "FROM member_visits" in s[0]]
+        assert "DISTINCT" not in statement
+        with engine.connect() as conn:
+            plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+        assert any("ix_member_visits_ts" in step for step in plan), plan
+
+        # Day sketches built by a read are only flushed: the caller's rollback discards them
+        window_sketch(db, "visits.members", DAY0, DAY0 + timedelta(days=3))
+        assert db.get(HllSketch, ("visits.members", "1996-02-02")) is not None
+        db.rollback()
+        assert db.get(HllSketch, ("visits.members", "1996-02-02")) is None
+    finally:
+        db.close()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+from sqlalchemy import delete, update
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.backfill_jobs import WORKER_ID
+from app.database import Base, engine, SessionLocal
+from app.models import TaskLease
+from app.periodic import claim_lease, start_periodic
+
+
+def test_one_worker_holds_a_task_lease_until_it_expires() -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.execute(delete(TaskLease).where(TaskLease.name == "test-lease"))
+        db.commit()
+        assert claim_lease(db, "test-lease", 60, worker_id="worker-a")
+        assert not claim_lease(db, "test-lease", 60, worker_id="worker-b")
+        assert claim_lease(db, "test-lease", 60, worker_id="worker-a")  # renewal
+
+        # worker-a died: once its lease lapses, worker-b takes the task over
+        db.execute(update(TaskLease).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+        assert claim_lease(db, "test-lease", 60, worker_id="worker-b")
+        assert not claim_lease(db, "test-lease", 60, worker_id="worker-a")
+    finally:
+        db.execute(delete(TaskLease).where(TaskLease.name == "test-lease"))
+        db.commit()
+        db.close()
+
+
+def test_periodic_job_runs_only_under_the_lease() -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.execute(delete(TaskLease).where(TaskLease.name.in_(["test-held", "test-free"])))
+        db.commit()
+        claim_lease(db, "test-held", 60, worker_id="another-worker")
+    finally:
+        db.close()
+    assert start_periodic("test-free", 0, lambda db: None, threading.Event()) is None
+
+    runs: List[str] = []
+    for name in ("test-held", "test-free"):
+        stop = threading.Event()
+
+        def job(db, name=name, stop=stop) -> dict:
+            runs.append(name)
+            stop.set()
+            return {}
+
+        thread = start_periodic(name, 0.05, job, stop)
+        stop.wait(0.5)
+        stop.set()
+        thread.join(timeout=5)
+    assert runs == ["test-free"]
+
+    db = SessionLocal()
+    try:
+        assert db.get(TaskLease, "test-free").worker_id == WORKER_ID
+        db.execute(delete(TaskLease).where(TaskLease.name.in_(["test-held", "test-free"])))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.main import app
+from app.config import get_settings
+from app.database import Base, engine, SessionLocal
+from app.models import Member
+from app.vector_store import VectorCollection, get_vector_collection
+
+
+API_TOKEN = "dev-token"
+
+
+def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {API_TOKEN}"}
+
+
+def _unit(values) -> list:
+    v = np.asarray(values, dtype=np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def test_segments_supersede_and_compact(tmp_path: Path) -> None:
+    collection = VectorCollection(tmp_path / "member")
+    collection.append([("a", "h1", _unit([1, 0, 0])), ("b", "h1", _unit([0, 1, 0]))])
+    collection.append([("a", "h2", _unit([0, 0, 1]))])
+
+    snap = collection.snapshot()
+    assert snap.total_rows == 3 and snap.live_count == 2
+    hits = snap.search(_unit([0, 0, 1]), limit=2)
+    assert hits[0][1] == "a" and abs(hits[0][0] - 1.0) < 1e-6
+    assert [entity_id for _, entity_id in hits] == ["a", "b"]
+
+    collection.compact()
+    compacted = collection.snapshot()
+    assert compacted.generation > snap.generation
+    assert compacted.total_rows == compacted.live_count == 2
+    assert len(list((tmp_path / "member").glob("*.vseg"))) == 1
+    assert dict((i, h) for i, h, _ in compacted.iter_live()) == {"a": "h2", "b": "h1"}
+
+    # Another process opening the same directory sees the same data
+    other = VectorCollection(tmp_path / "member")
+    assert other.snapshot().search(_unit([0, 0, 1]), limit=1)[0][1] == "a"
+
+
+def test_embeddings_search_uses_vector_store(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("APP_VECTOR_STORE_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setenv("APP_EMBEDDINGS_PROVIDER", "fake")
+    get_settings.cache_clear()  # type: ignore[attr-defined]
+    Base.metadata.create_all(bind=engine)
+    member_id = f"vs_{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        db.add(Member(id=member_id, full_name="Vector Store Boxer", email="vs@example.com"))
+        db.commit()
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    r = client.post("/api/embeddings.backfill", params={"entity_type": "member"}, headers=_auth_headers())
+    assert r.status_code == 200
+    assert get_vector_collection("member").snapshot().live_count >= 1
+
+    r2 = client.get(
+        "/api/embeddings.search",
+        params={"q": "Vector Store Boxer\nvs@example.com", "entity_type": "member", "limit": 1},
+        headers=_auth_headers(),
+    )
+    assert r2.status_code == 200
+    data = r2.json()
+    assert data["source"] == "vector_store"
+    assert data["items"][0]["entity_id"] == member_id
+    get_settings.cache_clear()  # type: ignore[attr-defined]